@@ -8,7 +8,7 @@ from formalchemy import templates
 from formalchemy import config
 from formalchemy.tables import Grid
 from formalchemy.forms import FieldSet, SimpleMultiDict
-from formalchemy.fields import Field, FieldRenderer
+from formalchemy.fields import Field, FieldRenderer, RenderContext, OptionsCache
 from formalchemy.validators import ValidationError
 import formalchemy.validators as validators
 import formalchemy.fatypes as types
@@ -45,6 +45,6 @@ def Column(*args, **kwargs):
     return SAColumn(*args, **kwargs)
 
 
-__all__ = ["FieldSet", "Field", "FieldRenderer", "Grid", "ValidationError", "validators", "SimpleMultiDict", "types"]
+__all__ = ["FieldSet", "Field", "FieldRenderer", "RenderContext", "OptionsCache", "Grid", "ValidationError", "validators", "SimpleMultiDict", "types"]
 __version__ = '1.5.7.dev0'
 
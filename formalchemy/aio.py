@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""asyncio versions of the validation, the synchronization and the
+rendering, used by `FieldSet.avalidate`, `FieldSet.async_sync`,
+`FieldSet.arender` and their `Grid` variants.
+
+Validators may be plain functions or coroutine functions. The values are
+deserialized first, then the validators of all the fields run concurrently
+with `asyncio.gather`.
+
+When the FieldSet is bound to a session providing ``run_sync`` (a
+SQLAlchemy ``AsyncSession``), the deserialization, which loads the related
+instances, `sync` and the loading of the options of the relations run
+inside ``run_sync`` with the synchronous session.
+"""
+import asyncio
+import inspect
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
+
+from formalchemy.fields import RenderContext, _flushed_states
+from formalchemy.validators import ValidationError
+
+async def _maybe_await(value):
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+async def run_sync(fs, func, fieldsets=()):
+    """call `func()` with the session of `fs`. For an ``AsyncSession``,
+    `func` is called by ``run_sync`` and the ``session`` of `fs` and of the
+    `fieldsets` bound to it is the synchronous session meanwhile"""
+    session = fs.session
+    if not hasattr(session, 'run_sync'):
+        return func()
+    fieldsets = [fs] + [f for f in fieldsets
+                        if f is not fs and f.session is session]
+    def call(sync_session):
+        for f in fieldsets:
+            f.session = sync_session
+        try:
+            return func()
+        finally:
+            for f in fieldsets:
+                f.session = session
+    return await session.run_sync(call)
+
+def _deserialize(field):
+    # the first step of AbstractField._validate
+    field.errors = []
+    if field.is_readonly():
+        return None
+    try:
+        return field._cached_deserialize()
+    except ValidationError as e:
+        field.errors.append(e.message)
+        return e
+
+async def _check(field, validator, value):
+    try:
+        await _maybe_await(field._call_validator(validator, value))
+    except ValidationError as e:
+        return e.message
+
+async def _validate_field(field, value):
+    if field.is_readonly():
+        return True
+    if isinstance(value, ValidationError):
+        return False
+    messages = await asyncio.gather(*[_check(field, validator, value)
+                                      for validator in field._get_validators(value)])
+    field.errors.extend([m for m in messages if m is not None])
+    return not field.errors
+
+async def _validate_fields(fs, fieldsets):
+    fields = [list(f.render_fields.values()) for f in fieldsets]
+    values = await run_sync(fs, lambda: [[_deserialize(field) for field in L]
+                                         for L in fields], fieldsets)
+    results = await asyncio.gather(*[
+        asyncio.gather(*[_validate_field(field, value)
+                         for field, value in zip(L, row_values)])
+        for L, row_values in zip(fields, values)])
+    return [all(row) for row in results]
+
+async def validate(fs):
+    """asyncio version of `FieldSet.validate`"""
+    fs._check_validate()
+    success = (await _validate_fields(fs, [fs]))[0]
+    if fs.validator:
+        fs._errors = []
+        try:
+            await _maybe_await(fs.validator(fs))
+        except ValidationError as e:
+            fs._errors = e.args
+            success = False
+    return success
+
+async def validate_grid(grid):
+    """asyncio version of `Grid.validate`. The rows are validated
+    concurrently"""
+    grid._check_validate()
+    grid._errors.clear()
+    rows = list(grid.rows)
+    contexts = grid._bind_rows(rows)
+    results = await _validate_fields(grid, contexts)
+    return grid._merge_rows(rows, contexts, results)
+
+async def sync(fs):
+    """asyncio version of `FieldSet.sync` and `Grid.sync`"""
+    return await run_sync(fs, fs.sync)
+
+_flushed_key = 'formalchemy.aio.flushed'
+_tracked_key = 'formalchemy.aio.transaction'
+
+def _transaction_created(session, transaction):
+    if getattr(transaction, 'parent', None) is None:
+        session.info[_tracked_key] = transaction
+
+def _flushed(session, flush_context):
+    session.info[_flushed_key] = True
+
+def _transaction_ended(session, transaction):
+    if getattr(transaction, 'parent', None) is None:
+        session.info.pop(_flushed_key, None)
+        if session.info.get(_tracked_key) is transaction:
+            del session.info[_tracked_key]
+
+def setup():
+    """register the ``Session`` listeners recording which transactions have
+    flushed changes. `load_relation_options` only uses an executor for the
+    transactions begun after this call, so call it at startup"""
+    if not event.contains(Session, 'after_flush', _flushed):
+        event.listen(Session, 'after_transaction_create', _transaction_created)
+        event.listen(Session, 'after_flush', _flushed)
+        event.listen(Session, 'after_transaction_end', _transaction_ended)
+
+def _root_transaction(session):
+    transaction = session.transaction
+    while getattr(transaction, 'parent', None) is not None:
+        transaction = transaction.parent
+    return transaction
+
+def _uncommitted(session):
+    """True if `session` has changes, flushed or not, which another session
+    would not see. A transaction begun before `setup()` may have flushed
+    changes"""
+    if session.new or session.dirty or session.deleted or \
+       session.info.get(_flushed_key):
+        return True
+    transaction = _root_transaction(session)
+    if transaction is not None and \
+       session.info.get(_tracked_key) is not transaction:
+        return True
+    for state in _flushed_states(session):
+        return True
+    return False
+
+def _load_in_new_session(field, bind):
+    session = Session(bind=bind)
+    try:
+        return field._load_relation_options(session)
+    finally:
+        session.close()
+
+async def load_relation_options(fs, fields, executor=None):
+    """return the options of the relation `fields` of `fs`. With an
+    ``AsyncSession`` they are loaded in one ``run_sync()`` call. With an
+    `executor`, each relation is loaded concurrently in the executor by a
+    new session sharing the bind of the FieldSet's session. The new sessions
+    only see the committed rows, so the executor is not used when the
+    session has pending or flushed changes, which requires `setup()`;
+    single connection pools (like in-memory SQLite) are not used
+    concurrently either. Otherwise the options are loaded one after the
+    other"""
+    session = fields[0]._relation_session()
+    if hasattr(session, 'run_sync'):
+        return await session.run_sync(
+            lambda s: [f._load_relation_options(s) for f in fields])
+    if executor is not None and session is not None and len(fields) > 1 \
+       and not _uncommitted(session):
+        binds = [session.get_bind(mapper=f._property.mapper) for f in fields]
+        pools = [getattr(bind, 'pool', None) for bind in binds]
+        if not [p for p in pools if isinstance(p, (SingletonThreadPool, StaticPool))]:
+            loop = asyncio.get_running_loop()
+            return await asyncio.gather(*[
+                loop.run_in_executor(executor, _load_in_new_session, f, bind)
+                for f, bind in zip(fields, binds)])
+    return [f._load_relation_options() for f in fields]
+
+async def render(fs, executor=None, **kwargs):
+    """asyncio version of `FieldSet.render` and `Grid.render`. The options
+    of the relations which are not in ``config.options_cache`` are loaded
+    first (see `load_relation_options`), then the template is rendered"""
+    context = fs.render_context
+    if context is None:
+        context = RenderContext()
+    pending = {}
+    for field in fs.render_fields.values():
+        # a readonly FieldSet does not render options
+        if fs.readonly or not field.is_relation or field.is_readonly() or \
+           field._render_opts.get('options') is not None or \
+           not getattr(field.renderer, 'loads_options', True):
+            continue
+        key = context.key(field.relation_type(), field._relation_order_by(),
+                          field._relation_session())
+        if key in context.options or key in pending:
+            continue
+        cache, cache_key = field._options_cache_key()
+        if cache is not None:
+            options = cache.lookup(cache_key)
+            if options is not None:
+                context.options[key] = options
+                continue
+            pending[key] = (field, cache, cache_key, cache.generation)
+        else:
+            pending[key] = (field, None, None, None)
+    if pending:
+        keys = list(pending)
+        options = await load_relation_options(
+                            fs, [pending[k][0] for k in keys], executor)
+        for key, value in zip(keys, options):
+            field, cache, cache_key, generation = pending[key]
+            if cache is not None:
+                cache.store(cache_key, value, generation)
+            context.options[key] = value
+            context.misses += 1
+    previous = fs.render_context
+    fs.render_context = context
+    try:
+        return fs.render(**kwargs)
+    finally:
+        fs.render_context = previous
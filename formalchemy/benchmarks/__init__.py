@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for FormAlchemy.
+
+Each module can be run as a script, e.g.::
+
+    $ python -m formalchemy.benchmarks.memory
+
+They only require an in-memory SQLite database.
+"""
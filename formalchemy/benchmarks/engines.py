@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Compare the template engines on the ``pylonsapp/performance_test.py``
+workload::
+
+    $ python -m formalchemy.benchmarks.engines
+
+The output of each engine is checked against the TempitaEngine one.
+"""
+import timeit
+
+from formalchemy import FieldSet, Grid
+from formalchemy import templates
+from formalchemy.benchmarks.models import User
+
+def fieldsets(engine):
+    """render the FieldSets of the performance test app"""
+    fs = FieldSet(User)
+    fs.engine = engine
+    body = fs.bind(User()).render()
+    body += fs.bind(User()).render()
+    fs.rebind(User())
+    body += fs.render()
+    return body
+
+def grid(engine, rows=50):
+    """render a Grid"""
+    g = Grid(User, [User(id=i, name=u'user%i' % i) for i in range(rows)])
+    g.engine = engine
+    return g.render()
+
+def main(number=200):
+    workloads = [fieldsets, grid]
+    reference = templates.TempitaEngine()
+    engines = [('tempita', reference),
+               ('compiled', templates.CompiledEngine())]
+    if templates.HAS_MAKO:
+        engines.append(('mako', templates.MakoEngine(input_encoding='utf-8',
+                                                    output_encoding='utf-8')))
+    for workload in workloads:
+        expected = workload(reference)
+        for name, engine in engines:
+            if name != 'mako':
+                assert workload(engine) == expected, name
+            seconds = timeit.timeit(lambda: workload(engine), number=number)
+            print('%-10s %-10s %8.1f renders/s' % (workload.__name__, name,
+                                                   number / seconds))
+
+if __name__ == '__main__':
+    main()
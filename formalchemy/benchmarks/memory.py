@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Measure the memory used by fields and renderers::
+
+    $ python -m formalchemy.benchmarks.memory
+
+Reports the number of bytes allocated per field when binding a configured
+FieldSet, with and without ``copy_on_write``, and when instantiating
+renderers.
+"""
+import gc
+
+from formalchemy import FieldSet
+from formalchemy.benchmarks.models import Wide
+
+def allocated(func, count):
+    """return the number of bytes still allocated after calling `func`
+    `count` times"""
+    # python 3.4+
+    import tracemalloc
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        results = [func() for i in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del results
+    return after - before
+
+def per_field(copy_on_write=False, count=500):
+    """bytes per field of a bound FieldSet"""
+    fs = FieldSet(Wide)
+    fs.configure(pk=True)
+    fs.copy_on_write = copy_on_write
+    nb_fields = len(fs._fields) + len(fs._render_fields)
+    instance = Wide(id=1)
+    return allocated(lambda: fs.bind(instance), count) / float(count * nb_fields)
+
+def per_renderer(count=500):
+    """bytes per renderer instance"""
+    fs = FieldSet(Wide)
+    fields = list(fs._fields.values())
+    def render_all():
+        for field in fields:
+            field._renderer = None
+        return [field.renderer for field in fields]
+    return allocated(render_all, count) / float(count * len(fields))
+
+def main():
+    print('bound field:                 %6i bytes' % per_field())
+    print('bound field (copy on write): %6i bytes' % per_field(copy_on_write=True))
+    print('renderer:                    %6i bytes' % per_renderer())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Models used by the benchmarks"""
+import datetime
+
+from sqlalchemy import Column, Integer, Unicode, Date, DateTime, Boolean, \
+                       LargeBinary, ForeignKey, create_engine
+from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+class Wide(Base):
+    """A model with 20 columns, like a row of a typical bulk-edit Grid"""
+    __tablename__ = 'wides'
+    id = Column(Integer, primary_key=True)
+    locals().update(('text%02i' % i, Column(Unicode(30), nullable=False))
+                    for i in range(10))
+    locals().update(('number%02i' % i, Column(Integer)) for i in range(5))
+    locals().update(('date%02i' % i, Column(Date)) for i in range(2))
+    locals().update(('flag%02i' % i, Column(Boolean)) for i in range(2))
+
+class User(Base):
+    """The model of ``pylonsapp/performance_test.py``"""
+    __tablename__ = 'users'
+    id = Column(Integer, primary_key=True)
+    name = Column(Unicode(12))
+    fullname = Column(Unicode(40))
+    password = Column(Unicode(20))
+
+class Group(Base):
+    __tablename__ = 'groups'
+    id = Column(Integer, primary_key=True)
+    name = Column(Unicode(30), nullable=False)
+    def __unicode__(self):
+        return self.name
+    __str__ = __unicode__
+
+class Customer(Base):
+    """A model with a scalar relation, a collection, a date and a binary"""
+    __tablename__ = 'customers'
+    id = Column(Integer, primary_key=True)
+    email = Column(Unicode(40), unique=True, nullable=False)
+    name = Column(Unicode(30), nullable=False)
+    birthdate = Column(Date)
+    active = Column(Boolean, nullable=False, default=True)
+    avatar = Column(LargeBinary)
+    group_id = Column(Integer, ForeignKey('groups.id'))
+    group = relationship(Group, backref='customers')
+    orders = relationship('Order', backref='customer', order_by='Order.id')
+    def __unicode__(self):
+        return self.name
+    __str__ = __unicode__
+
+class Order(Base):
+    __tablename__ = 'orders'
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, ForeignKey('customers.id'))
+    created = Column(DateTime, nullable=False)
+    lines = relationship('OrderLine', backref='order')
+    def __unicode__(self):
+        return u'Order #%s' % self.id
+    __str__ = __unicode__
+
+class OrderLine(Base):
+    """A model with a composite primary key"""
+    __tablename__ = 'order_lines'
+    order_id = Column(Integer, ForeignKey('orders.id'), primary_key=True)
+    line = Column(Integer, primary_key=True)
+    product = Column(Unicode(30), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    price = Column(Integer, nullable=False)
+
+def populate(customers=1000, groups=20, orders=50, url='sqlite://'):
+    """return a session bound to a new database (in-memory SQLite by
+    default) holding `customers` customers spread in `groups` groups. The
+    first customers have two orders each, until there is `orders` orders."""
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    all_groups = [Group(id=i + 1, name=u'group %i' % i) for i in range(groups)]
+    session.add_all(all_groups)
+    for i in range(customers):
+        session.add(Customer(id=i + 1, email=u'customer%i@example.com' % i,
+                             name=u'customer %i' % i,
+                             birthdate=datetime.date(1970 + i % 40, 1 + i % 12,
+                                                     1 + i % 28),
+                             avatar=b'\x89PNG' + b'\0' * 512,
+                             group=all_groups[i % groups]))
+    for i in range(min(orders, customers * 2)):
+        order = Order(id=i + 1, customer_id=i // 2 + 1,
+                      created=datetime.datetime(2010, 1, 1, 12))
+        order.lines = [OrderLine(line=j, product=u'product %i' % j,
+                                 quantity=j + 1, price=999)
+                       for j in range(3)]
+        session.add(order)
+    session.commit()
+    return session
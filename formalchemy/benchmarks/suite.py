@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""Time the life cycle of FieldSets and Grids on an in-memory SQLite
+database::
+
+    $ python -m formalchemy.benchmarks.suite
+    $ python -m formalchemy.benchmarks.suite --save
+
+Each benchmark reports the operations per second, the peak memory allocated
+by one operation and the number of SQL queries it runs. Results are
+compared with ``baseline.json`` (or the file given with ``--baseline``),
+which ``--save`` overwrites.
+
+The models are in ``formalchemy.benchmarks.models``: ``Customer`` has a
+scalar relation, a collection, a date, a boolean and a binary column,
+``OrderLine`` has a composite primary key.
+"""
+import gc
+import os
+import sys
+import json
+import timeit
+from optparse import OptionParser
+
+from sqlalchemy import event
+
+from formalchemy import FieldSet, Grid
+from formalchemy.benchmarks.models import Customer, OrderLine, populate
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+class QueryCounter(object):
+    """count the queries executed by a SQLAlchemy engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self)
+
+def ops_per_second(func, min_time=0.2):
+    """call `func` until it ran for at least `min_time` seconds"""
+    number = 1
+    while True:
+        seconds = timeit.timeit(func, number=number)
+        if seconds >= min_time:
+            return number / seconds
+        number *= max(2, int(min_time / max(seconds, 1e-6) * 1.2))
+
+def peak_allocated(func):
+    """return the peak number of bytes allocated while calling `func`"""
+    # python 3.4+
+    import tracemalloc
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def measure(func, engine, min_time=0.2):
+    """return the ops/sec, bytes and queries of `func`"""
+    func()
+    with QueryCounter(engine) as counter:
+        allocated = peak_allocated(func)
+    return dict(ops=ops_per_second(func, min_time), bytes=allocated,
+                queries=counter.count)
+
+def customer_data(fs, customer, data=None):
+    """add the POST data of `customer`, bound to `fs`, to `data`"""
+    if data is None:
+        data = {}
+    name = lambda field: field.renderer.name
+    data[name(fs.email)] = customer.email
+    data[name(fs.name)] = customer.name
+    date = customer.birthdate
+    data[name(fs.birthdate) + '__year'] = str(date.year)
+    data[name(fs.birthdate) + '__month'] = str(date.month)
+    data[name(fs.birthdate) + '__day'] = str(date.day)
+    if customer.active:
+        data[name(fs.active)] = 'True'
+    data[name(fs.group)] = str(customer.group_id)
+    if 'orders' in fs.render_fields:
+        data[name(fs.orders)] = [str(o.id) for o in customer.orders]
+    return data
+
+def fieldset_benchmarks(session):
+    """return a list of (name, func) for a Customer FieldSet"""
+    customer = session.query(Customer).get(1)
+    fs = FieldSet(Customer, session=session)
+    data = customer_data(fs.bind(customer), customer)
+    readonly = fs.bind(customer)
+    readonly.readonly = True
+    line = session.query(OrderLine).first()
+    lines = FieldSet(OrderLine, session=session)
+
+    def sync():
+        bound = fs.bind(customer, data=data)
+        assert bound.validate(), bound.errors
+        bound.sync()
+
+    return [
+        ('fieldset.construct', lambda: FieldSet(Customer)),
+        ('fieldset.configure',
+         lambda: fs.configure(exclude=[fs.avatar], options=[
+                              fs.email.label('E-mail'), fs.active.required()])),
+        ('fieldset.bind', lambda: fs.bind(customer)),
+        ('fieldset.render', lambda: fs.bind(customer).render()),
+        ('fieldset.render_readonly', readonly.render),
+        ('fieldset.validate', lambda: fs.bind(customer, data=data).validate()),
+        ('fieldset.sync', sync),
+        ('fieldset.composite_pk.render', lambda: lines.bind(line).render()),
+    ]
+
+def grid_benchmarks(session, rows):
+    """return a list of (name, func) for a Customer Grid of `rows` rows"""
+    customers = session.query(Customer).order_by(Customer.id).limit(rows).all()
+    g = Grid(Customer, session=session)
+    g.configure(exclude=[g.avatar, g.orders])
+    data = {}
+    bound = g.bind(customers)
+    for customer in bound:
+        customer_data(bound, customer, data)
+    return [
+        ('grid.%i.render' % rows, lambda: g.bind(customers).render()),
+        ('grid.%i.validate' % rows,
+         lambda: g.bind(customers, data=data).validate()),
+    ]
+
+def run(rows=(10, 100, 1000), pattern=None, min_time=0.2):
+    """run the benchmarks whose name contains `pattern` and return a dict of
+    name: results"""
+    session = populate(customers=max(rows or [1]))
+    engine = session.get_bind()
+    benchmarks = fieldset_benchmarks(session)
+    for count in rows:
+        benchmarks.extend(grid_benchmarks(session, count))
+    results = {}
+    for name, func in benchmarks:
+        if pattern and pattern not in name:
+            continue
+        results[name] = measure(func, engine, min_time)
+    session.close()
+    return results
+
+def load(filename):
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as fd:
+        return json.load(fd)
+
+def save(results, filename):
+    with open(filename, 'w') as fd:
+        json.dump(results, fd, indent=2, sort_keys=True)
+        fd.write('\n')
+
+def report(results, baseline, out=sys.stdout):
+    """print `results` compared to `baseline`"""
+    out.write('%-30s %10s %8s %10s %8s\n' % (
+              'benchmark', 'ops/sec', 'baseline', 'KiB/op', 'queries'))
+    for name in sorted(results):
+        result = results[name]
+        reference = baseline.get(name)
+        ratio = reference and '%7.2fx' % (result['ops'] / reference['ops']) or ''
+        queries = '%i' % result['queries']
+        if reference and reference['queries'] != result['queries']:
+            queries += ' (%+i)' % (result['queries'] - reference['queries'])
+        out.write('%-30s %10.1f %8s %10.1f %8s\n' % (
+                  name, result['ops'], ratio, result['bytes'] / 1024.,
+                  queries))
+
+def main(args=None):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--rows', default='10,100,1000',
+                      help='Grid sizes, comma separated [%default]')
+    parser.add_option('-k', dest='pattern', default=None,
+                      help='only run the benchmarks containing PATTERN')
+    parser.add_option('--min-time', type='float', default=0.2,
+                      help='minimal time spent per benchmark [%default]')
+    parser.add_option('--baseline', default=BASELINE,
+                      help='baseline file [%default]')
+    parser.add_option('--save', action='store_true', default=False,
+                      help='store the results as the new baseline')
+    options, args = parser.parse_args(args)
+    rows = [int(r) for r in options.rows.split(',') if r]
+    results = run(rows, options.pattern, options.min_time)
+    report(results, load(options.baseline))
+    if options.save:
+        save(results, options.baseline)
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,9 @@ There is two configuration settings available in a global config object.
 
 - date_edit_format: Used to retrieve field order. Default to m-d-y
 
+- options_cache: A :class:`~formalchemy.fields.OptionsCache` shared by the
+  relation fields of the process. Default: None
+
 Here is a simple example::
 
     >>> from formalchemy import config
@@ -47,6 +50,7 @@ class Config(object):
         date_format='%Y-%m-%d',
         date_edit_format='m-d-y',
         engine = templates.default_engine,
+        options_cache=None,
     )
 
     def __getattr__(self, attr):
@@ -1,14 +1,22 @@
 # -*- coding: utf-8 -*-
 import os
+import re
+import sys
 import stat
+import time
 import cgi
 import string
 import random
 import shutil
+import tempfile
+import threading
+import mimetypes
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_tz, mktime_tz
 from six import string_types
 import formalchemy.helpers as h
 from formalchemy.fields import FileFieldRenderer as Base
-from formalchemy.fields import FieldRenderer
+from formalchemy.fields import FieldRenderer, Upload
 from formalchemy.validators import regex
 from formalchemy.i18n import _
 
@@ -18,7 +26,9 @@ except ImportError:
     config = {}
 
 __all__ = ['file_extension', 'image_extension',
-           'FileFieldRenderer', 'ImageFieldRenderer']
+           'Storage', 'RandomStorage', 'ContentAddressedStorage',
+           'FileFieldRenderer', 'ImageFieldRenderer', 'BlobApp',
+           'collect_garbage']
 
 def file_extension(extensions=[], errormsg=None):
     """Validate a file extension.
@@ -50,12 +60,246 @@ def normalized_basename(path):
     filename = filename.split('\\')[-1]
     return filename.replace(' ', '_')
 
+class StorageIndex(object):
+    """The metadata of the files of a storage root, by path. Only the
+    `maxsize` most recently used entries are kept."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, path):
+        with self._lock:
+            metadata = self.entries.pop(path)
+            # most recently used last
+            self.entries[path] = metadata
+            return metadata
+
+    def get(self, path, default=None):
+        try:
+            return self[path]
+        except KeyError:
+            return default
+
+    def __setitem__(self, path, metadata):
+        with self._lock:
+            self.entries.pop(path, None)
+            self.entries[path] = metadata
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def pop(self, path, default=None):
+        with self._lock:
+            return self.entries.pop(path, default)
+
+    def keys(self):
+        with self._lock:
+            return list(self.entries)
+
+    def __contains__(self, path):
+        return path in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def _index_for(root, maxsize):
+    """return the `StorageIndex` shared by the storages of `root`"""
+    key = os.path.abspath(root)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = StorageIndex(maxsize)
+        return index
+
+class Storage(object):
+    """Base class of the storage backends used by `FileFieldRenderer`.
+
+    Files are identified by a path relative to `root`, using ``/`` as
+    separator. This is the value stored in the database. `index` caches
+    the size and metadata of the files saved or looked up, so rendering
+    does not need a filesystem call. It is shared by the storages of the
+    same `root` and keeps the `index_size` most recently used files.
+    """
+
+    immutable = False
+    index_size = 10000
+
+    def __init__(self, root):
+        self.root = root
+        self.index = _index_for(root, self.index_size)
+        self.columns = []
+
+    def track(self, *columns):
+        """register the mapped attributes storing the paths of this storage's
+        files. They are used by `collect_garbage`"""
+        for column in columns:
+            if not [c for c in self.columns if c is column]:
+                self.columns.append(column)
+
+    def filepath(self, path):
+        """return the absolute path of a stored file"""
+        return os.path.join(self.root, path.replace('/', os.sep))
+
+    def save(self, fileobj, filename):
+        """store the content of `fileobj` and return its path"""
+        raise NotImplementedError()
+
+    def open(self, path):
+        """return a file object to read a stored file"""
+        return open(self.filepath(path), 'rb')
+
+    def metadata(self, path):
+        """return a dict with at least the ``size`` of a stored file, or
+        None if the file does not exist"""
+        try:
+            return self.index[path]
+        except KeyError:
+            pass
+        try:
+            size = os.stat(self.filepath(path))[stat.ST_SIZE]
+        except OSError:
+            return None
+        metadata = self.index[path] = dict(size=size)
+        return metadata
+
+    def etag(self, path, st):
+        """return the entity tag of a stored file given its `os.stat`"""
+        return '%x-%x' % (int(st.st_mtime), st.st_size)
+
+    def size(self, path):
+        metadata = self.metadata(path)
+        return metadata and metadata['size'] or 0
+
+    def exists(self, path):
+        return self.metadata(path) is not None
+
+    def delete(self, path):
+        self.index.pop(path, None)
+        try:
+            os.remove(self.filepath(path))
+        except OSError:
+            pass
+
+    def _makedirs(self, filepath):
+        dirname = os.path.dirname(filepath)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                if not os.path.isdir(dirname):
+                    raise
+
+class RandomStorage(Storage):
+    """Store each upload under three random directories. This is the
+    default storage of `FileFieldRenderer`."""
+
+    def __init__(self, root, relative_path=None):
+        Storage.__init__(self, root)
+        if relative_path is not None:
+            self.relative_path = relative_path
+
+    def relative_path(self, filename):
+        rdir = lambda: ''.join(random.sample(string.ascii_lowercase, 3))
+        return '/'.join([rdir(), rdir(), rdir(), filename])
+
+    def save(self, fileobj, filename):
+        path = self.relative_path(filename)
+        filepath = self.filepath(path)
+        self._makedirs(filepath)
+        with open(filepath, 'wb') as fd:
+            shutil.copyfileobj(fileobj, fd)
+        return path
+
+class ContentAddressedStorage(Storage):
+    """Store each upload once, in a directory named after the hash of its
+    content and sharded `depth` levels deep, e.g.
+    ``9f/86/9f86d081.../logo.png`` with the default `depth` of 2 and `width`
+    of 2.
+
+    The content is hashed while it is copied to a temporary file in `root`,
+    which is then renamed to its final location. When the same content is
+    uploaded again under another name, the new name is a hard link to the
+    existing file (a copy when hard links are not supported). The
+    modification time of a deduplicated file is refreshed, so that
+    `collect_garbage` does not remove content uploaded again within its
+    grace period.
+    """
+
+    tmp_dir = '.tmp'
+    chunk_size = 65536
+    immutable = True
+
+    def __init__(self, root, depth=2, width=2, hash_name='sha256'):
+        Storage.__init__(self, root)
+        self.depth = depth
+        self.width = width
+        self.hash_name = hash_name
+
+    def digest_path(self, digest):
+        """return the directory of a content"""
+        shards = [digest[i * self.width:(i + 1) * self.width]
+                  for i in range(self.depth)]
+        return '/'.join(shards + [digest])
+
+    def save(self, fileobj, filename):
+        tmp_dir = os.path.join(self.root, self.tmp_dir)
+        if not os.path.isdir(tmp_dir):
+            self._makedirs(os.path.join(tmp_dir, filename))
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as sink:
+                upload = Upload.from_file(fileobj, filename, sink,
+                                          self.chunk_size, self.hash_name)
+            dirname = self.digest_path(upload.hash)
+            path = '%s/%s' % (dirname, filename)
+            filepath = self.filepath(path)
+            if not os.path.exists(filepath):
+                self._makedirs(filepath)
+                existing = [name for name in os.listdir(os.path.dirname(filepath))
+                            if not name.startswith('.')]
+                if existing:
+                    self._link(self.filepath('%s/%s' % (dirname, existing[0])),
+                               filepath, tmp_path)
+                else:
+                    os.rename(tmp_path, filepath)
+            else:
+                os.utime(filepath, None)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.index[path] = dict(size=upload.size, hash=upload.hash,
+                                content_type=upload.content_type)
+        return path
+
+    def etag(self, path, st):
+        segments = path.split('/')
+        if len(segments) == self.depth + 2:
+            return segments[-2]
+        return Storage.etag(self, path, st)
+
+    def _link(self, source, target, tmp_path):
+        try:
+            os.link(source, target)
+        except (OSError, AttributeError):
+            os.rename(tmp_path, target)
+        else:
+            # the link shares the inode, and the mtime, of an old file
+            os.utime(target, None)
+
 
 class FileFieldRenderer(Base):
-    """render a file input field stored on file system
+    """render a file input field stored on file system.
+
+    Files are saved by `storage`, a `RandomStorage` in `storage_path` by
+    default. Use `new()` to configure a renderer with another `Storage`.
     """
 
     url_prefix = '/'
+    storage = None
 
     @property
     def storage_path(self):
@@ -68,6 +312,8 @@ class FileFieldRenderer(Base):
                     'storage_path must be set to a valid path. Got %r' % self.storage_path)
         Base.__init__(self, *args, **kwargs)
         self._path = None
+        if self.storage is None:
+            self.storage = RandomStorage(self.storage_path, self.relative_path)
 
     def relative_path(self, filename):
         """return the file path relative to root
@@ -85,10 +331,7 @@ class FileFieldRenderer(Base):
     def get_size(self):
         relative_path = self.field.value
         if relative_path:
-            filepath = os.path.join(self.storage_path,
-                                    relative_path.replace('/', os.sep))
-            if os.path.isfile(filepath):
-                return os.stat(filepath)[stat.ST_SIZE]
+            return self.storage.size(relative_path)
         return 0
 
     def render(self, **kwargs):
@@ -136,15 +379,7 @@ class FileFieldRenderer(Base):
         data = FieldRenderer.deserialize(self)
         if isinstance(data, cgi.FieldStorage):
             filename = normalized_basename(data.filename)
-            self._path = self.relative_path(filename)
-            filepath = os.path.join(self.storage_path,
-                                    self._path.replace('/', os.sep))
-            dirname = os.path.dirname(filepath)
-            if not os.path.isdir(dirname):
-                os.makedirs(dirname)
-            fd = open(filepath, 'wb')
-            shutil.copyfileobj(data.file, fd)
-            fd.close()
+            self._path = self.storage.save(data.file, filename)
             return self._path
         checkbox_name = '%s--remove' % self.name
         if not data and not self.params.has_key(checkbox_name):
@@ -159,20 +394,28 @@ class FileFieldRenderer(Base):
         return data is not None and data or ''
 
     @classmethod
-    def new(cls, storage_path, url_prefix='/'):
+    def new(cls, storage_path=None, url_prefix='/', storage=None):
         """Return a new class::
 
             >>> FileFieldRenderer.new(storage_path='/') # doctest: +ELLIPSIS
             <class 'formalchemy.ext.fsblob.ConfiguredFileFieldRenderer_...'>
             >>> ImageFieldRenderer.new(storage_path='/') # doctest: +ELLIPSIS
             <class 'formalchemy.ext.fsblob.ConfiguredImageFieldRenderer_...'>
+
+        The `storage` is shared by the instances of the class::
+
+            >>> storage = ContentAddressedStorage('/')
+            >>> FileFieldRenderer.new(storage=storage).storage_path
+            '/'
         """
         if url_prefix[-1] != '/':
             url_prefix += '/'
+        if storage_path is None and storage is not None:
+            storage_path = storage.root
         name = 'Configured%s_%s' % (cls.__name__, str(random.random())[2:])
         return type(name, (cls,),
                     dict(storage_path=storage_path,
-                    url_prefix=url_prefix))
+                    url_prefix=url_prefix, storage=storage))
 
 
 class ImageFieldRenderer(FileFieldRenderer):
@@ -189,3 +432,330 @@ class ImageFieldRenderer(FileFieldRenderer):
             return h.content_tag('a', tag, href=url, **kwargs)
         return ''
 
+
+
+class FileIterator(object):
+    """iterate over `length` bytes of an open file starting at `offset`"""
+
+    def __init__(self, fd, offset=0, length=None, block_size=65536):
+        self.fd = fd
+        self.remaining = length
+        self.block_size = block_size
+        fd.seek(offset)
+
+    def __iter__(self):
+        while self.remaining is None or self.remaining > 0:
+            size = self.block_size
+            if self.remaining is not None:
+                size = min(size, self.remaining)
+            chunk = self.fd.read(size)
+            if not chunk:
+                break
+            if self.remaining is not None:
+                self.remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self.fd.close()
+
+
+class BlobApp(object):
+    """A WSGI application serving the files of a `Storage` (or of a
+    directory), to be mounted at the `url_prefix` of the renderers::
+
+        >>> app = BlobApp(ContentAddressedStorage('/var/files'))
+
+    Files are sent with ``wsgi.file_wrapper`` when the server provides it
+    (which lets servers use ``sendfile()``) or by blocks of `block_size`
+    bytes. Single byte ranges, ``ETag``, ``If-None-Match``,
+    ``Last-Modified`` and ``If-Modified-Since`` are supported. Files of an
+    immutable storage, whose names change with their content, are cached
+    for a year, the others for `max_age` seconds.
+
+    The content type may be sniffed from uploaded bytes, so browsers are
+    told not to sniff it again (``X-Content-Type-Options: nosniff``) and
+    only the `inline_types` are displayed: other files, like HTML or SVG
+    which could run scripts on the application's origin, are sent as
+    attachments.
+    """
+
+    block_size = 65536
+    inline_types = ('image/png', 'image/jpeg', 'image/gif', 'image/webp',
+                    'text/plain', 'application/pdf', 'audio/mpeg',
+                    'audio/ogg', 'video/mp4', 'video/webm')
+
+    def __init__(self, storage, max_age=3600):
+        if isinstance(storage, string_types):
+            storage = RandomStorage(storage)
+        self.storage = storage
+        self.max_age = max_age
+
+    def __call__(self, environ, start_response):
+        method = environ.get('REQUEST_METHOD', 'GET')
+        if method not in ('GET', 'HEAD'):
+            return self.error(start_response, '405 Method Not Allowed',
+                              [('Allow', 'GET, HEAD')])
+        path = environ.get('PATH_INFO', '').lstrip('/')
+        segments = path.split('/')
+        if not path or [s for s in segments if not s or s.startswith('.')]:
+            return self.error(start_response, '404 Not Found')
+        filepath = self.storage.filepath(path)
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return self.error(start_response, '404 Not Found')
+        if not stat.S_ISREG(st.st_mode):
+            return self.error(start_response, '404 Not Found')
+
+        size = st.st_size
+        etag = '"%s"' % self.storage.etag(path, st)
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+        headers = [('ETag', etag), ('Last-Modified', last_modified),
+                   ('Accept-Ranges', 'bytes'),
+                   ('X-Content-Type-Options', 'nosniff')]
+        if self.storage.immutable:
+            headers.append(('Cache-Control',
+                            'public, max-age=31536000, immutable'))
+        else:
+            headers.append(('Cache-Control', 'public, max-age=%i' % self.max_age))
+
+        if self.not_modified(environ, etag, st.st_mtime):
+            start_response('304 Not Modified', headers)
+            return []
+
+        content_type = None
+        metadata = self.storage.index.get(path)
+        if metadata:
+            content_type = metadata.get('content_type')
+        if not content_type:
+            content_type = mimetypes.guess_type(path)[0] or \
+                           'application/octet-stream'
+        headers.append(('Content-Type', content_type))
+        if content_type not in self.inline_types:
+            headers.append(('Content-Disposition',
+                            content_disposition(segments[-1])))
+
+        status = '200 OK'
+        offset, length = 0, size
+        byte_range = environ.get('HTTP_RANGE')
+        if byte_range and self.if_range(environ, etag, last_modified):
+            byte_range = parse_range(byte_range, size)
+            if byte_range == ():
+                headers.append(('Content-Range', 'bytes */%i' % size))
+                return self.error(start_response,
+                                  '416 Requested Range Not Satisfiable',
+                                  headers)
+            if byte_range is not None:
+                offset, length = byte_range
+                status = '206 Partial Content'
+                headers.append(('Content-Range', 'bytes %i-%i/%i' % (
+                                offset, offset + length - 1, size)))
+        headers.append(('Content-Length', str(length)))
+        start_response(status, headers)
+        if method == 'HEAD':
+            return []
+        fd = open(filepath, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None and length == size:
+            return file_wrapper(fd, self.block_size)
+        return FileIterator(fd, offset, length, self.block_size)
+
+    def not_modified(self, environ, etag, mtime):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            tags = [t.strip() for t in if_none_match.split(',')]
+            return '*' in tags or etag in tags or 'W/' + etag in tags
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            since = parsedate_tz(if_modified_since)
+            if since is not None:
+                return int(mtime) <= mktime_tz(since)
+        return False
+
+    def if_range(self, environ, etag, last_modified):
+        if_range = environ.get('HTTP_IF_RANGE')
+        return not if_range or if_range in (etag, last_modified)
+
+    def error(self, start_response, status, headers=()):
+        body = status.encode('ascii')
+        headers = [(k, v) for k, v in headers
+                   if k not in ('Content-Type', 'Content-Length')]
+        start_response(status, headers + [('Content-Type', 'text/plain'),
+                                          ('Content-Length', str(len(body)))])
+        return [body]
+
+
+def content_disposition(filename):
+    """return the ``Content-Disposition`` of a file sent as an attachment.
+    The `filename` is only given when it needs no quoting"""
+    if re.match(r'^[A-Za-z0-9_.() -]+$', filename):
+        return 'attachment; filename="%s"' % filename
+    return 'attachment'
+
+
+def parse_range(value, size):
+    """parse a ``Range`` header and return a tuple (offset, length), None if
+    the header is invalid or asks for several ranges, or an empty tuple if
+    the range is not satisfiable:
+
+    >>> parse_range('bytes=0-99', 1000)
+    (0, 100)
+    >>> parse_range('bytes=900-', 1000)
+    (900, 100)
+    >>> parse_range('bytes=-100', 1000)
+    (900, 100)
+    >>> parse_range('bytes=0-0', 1000)
+    (0, 1)
+    >>> parse_range('bytes=0-1,5-6', 1000)
+    >>> parse_range('bytes=1000-', 1000)
+    ()
+    """
+    unit, sep, ranges = value.partition('=')
+    if unit.strip() != 'bytes' or ',' in ranges:
+        return None
+    start, sep, end = ranges.strip().partition('-')
+    try:
+        if not start:
+            length = min(int(end), size)
+            if length <= 0:
+                return ()
+            return (size - length, length)
+        start = int(start)
+        if end:
+            end = min(int(end), size - 1)
+        else:
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return ()
+    if end < start:
+        return None
+    return (start, end - start + 1)
+
+
+def referenced_paths(session, columns, batch_size=1000):
+    """yield the non empty values of `columns` (mapped attributes or
+    columns), with one query per column"""
+    for column in columns:
+        query = session.query(column).filter(column != None)
+        for row in query.yield_per(batch_size):
+            if row[0]:
+                yield row[0]
+
+
+def collect_garbage(storage, session, columns=None, grace=86400,
+                    dry_run=False, out=None, progress=10000):
+    """Remove the files of `storage` which are not referenced by `columns`
+    (by default the columns registered with `Storage.track`) and which are
+    older than `grace` seconds. Temporary files left by interrupted uploads
+    are removed too.
+
+    Return a dict of statistics. With `dry_run`, nothing is removed but
+    the statistics are the same. A progress line is written to `out` every
+    `progress` files. Otherwise the entries of `storage.index` whose file
+    was removed, here or by another process, are evicted.
+    """
+    if columns is None:
+        columns = storage.columns
+    if not columns:
+        raise ValueError('No column references files of %r' % storage)
+    started = time.time()
+    referenced = set(referenced_paths(session, columns))
+    limit = started - grace
+    stats = dict(scanned=0, referenced=len(referenced), removed=0,
+                 removed_bytes=0, recent=0)
+    seen = set()
+    for dirpath, dirnames, filenames in os.walk(storage.root):
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            path = os.path.relpath(filepath, storage.root).replace(os.sep, '/')
+            stats['scanned'] += 1
+            seen.add(path)
+            if out is not None and progress and not stats['scanned'] % progress:
+                out.write('%(scanned)i files scanned, %(removed)i orphans\n'
+                          % stats)
+            if path in referenced:
+                continue
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                continue
+            if st.st_mtime > limit:
+                stats['recent'] += 1
+                continue
+            stats['removed'] += 1
+            stats['removed_bytes'] += st.st_size
+            if not dry_run:
+                storage.delete(path)
+                seen.discard(path)
+                _remove_empty_dirs(os.path.dirname(filepath), storage.root)
+    if not dry_run:
+        for path in storage.index.keys():
+            if path not in seen:
+                storage.index.pop(path)
+    stats['seconds'] = time.time() - started
+    stats['files_per_second'] = stats['scanned'] / max(stats['seconds'], 1e-6)
+    return stats
+
+
+def _remove_empty_dirs(dirname, root):
+    root = os.path.abspath(root)
+    dirname = os.path.abspath(dirname)
+    while dirname != root and dirname.startswith(root):
+        try:
+            os.rmdir(dirname)
+        except OSError:
+            break
+        dirname = os.path.dirname(dirname)
+
+
+def _resolve(name):
+    """return the object named ``package.module:Class.attribute``"""
+    module_name, sep, attrs = name.partition(':')
+    obj = __import__(module_name, fromlist=['__name__'])
+    for attr in attrs.split('.'):
+        if attr:
+            obj = getattr(obj, attr)
+    return obj
+
+
+def main(args=None):
+    """Remove the orphan files of a storage::
+
+        $ python -m formalchemy.ext.fsblob --url sqlite:///app.db \\
+            --column myapp.model:User.avatar /var/files
+    """
+    from optparse import OptionParser
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    parser = OptionParser(usage='%prog [options] storage_path')
+    parser.add_option('--url', help='SQLAlchemy database url')
+    parser.add_option('--column', dest='columns', action='append', default=[],
+                      help='mapped attribute referencing files, '
+                           'as package.module:Class.attribute')
+    parser.add_option('--grace', type='int', default=86400,
+                      help='keep orphans younger than GRACE seconds [%default]')
+    parser.add_option('-n', '--dry-run', action='store_true', default=False,
+                      help='only report what would be removed')
+    options, args = parser.parse_args(args)
+    if len(args) != 1 or not options.url or not options.columns:
+        parser.error('a storage path, --url and --column are required')
+    storage = Storage(args[0])
+    session = sessionmaker(bind=create_engine(options.url))()
+    try:
+        stats = collect_garbage(storage, session,
+                                [_resolve(c) for c in options.columns],
+                                grace=options.grace, dry_run=options.dry_run,
+                                out=sys.stdout)
+    finally:
+        session.close()
+    sys.stdout.write('%(scanned)i files scanned, %(referenced)i referenced, '
+                     '%(recent)i recent orphans kept\n' % stats)
+    sys.stdout.write('%s%i orphans (%i bytes) removed in %.1fs, '
+                     '%.0f files/s\n' % (options.dry_run and '[dry run] ' or '',
+                     stats['removed'], stats['removed_bytes'],
+                     stats['seconds'], stats['files_per_second']))
+
+if __name__ == '__main__':
+    main()
@@ -150,12 +150,41 @@ class _RESTController(object):
                 fields = fs.render_fields
                 if field_name in fields:
                     field = fields[field_name]
+                    if 'term' in request.GET:
+                        return self.lookup_json(field)
                     return field.render()
                 else:
                     abort(404)
             return fs.render()
         return ''
 
+    def lookup_json(self, field):
+        """return the instances looked up by the renderer of `field` (see
+        :class:`~formalchemy.fields.AutocompleteFieldRenderer`) for the
+        ``term``, ``after`` and ``limit`` GET parameters, as JSON"""
+        lookup = getattr(field.renderer, 'lookup', None)
+        if lookup is None:
+            abort(404)
+        after = request.GET.get('after')
+        try:
+            if after:
+                # the `next` value of the previous page: [label, pk]
+                after = json.loads(after)
+                if not isinstance(after, list) or len(after) != 2 or \
+                   [v for v in after if isinstance(v, (list, dict))]:
+                    raise ValueError('Invalid after: %r' % (after,))
+            else:
+                after = None
+            limit = request.GET.get('limit')
+            if limit is not None:
+                limit = int(limit)
+                if limit < 1:
+                    raise ValueError('Invalid limit: %r' % limit)
+        except (TypeError, ValueError):
+            abort(400)
+        response.content_type = 'application/json'
+        return json.dumps(lookup(request.GET['term'], after=after, limit=limit))
+
     def get_page(self, **kwargs):
         """return a ``webhelpers.paginate.Page`` used to display ``Grid``.
 
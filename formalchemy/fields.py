@@ -4,18 +4,30 @@
 # the MIT License: http://www.opensource.org/licenses/mit-license.php
 
 import cgi
+import hashlib
 import logging
+import tempfile
+import mimetypes
+from io import BytesIO
 logger = logging.getLogger('formalchemy.' + __name__)
 
 from copy import copy, deepcopy
+import numbers
 import datetime
+import time
+import threading
 import warnings
+import weakref
+import itertools
+from collections import OrderedDict
 from six import string_types,text_type, next
 
 from sqlalchemy.orm.interfaces import MANYTOMANY
 from sqlalchemy.orm.interfaces import ONETOMANY
 from sqlalchemy.orm.interfaces import MANYTOONE
-from sqlalchemy.orm import class_mapper, Query
+from sqlalchemy import tuple_, and_, or_, event
+from sqlalchemy.orm import class_mapper, Query, Session
+from sqlalchemy.orm.attributes import instance_state
 from sqlalchemy.orm.attributes import ScalarAttributeImpl, ScalarObjectAttributeImpl, CollectionAttributeImpl
 from sqlalchemy.orm.properties import CompositeProperty, ColumnProperty
 try:
@@ -30,6 +42,7 @@ from formalchemy import config
 from formalchemy.i18n import get_translator
 from formalchemy.i18n import _
 from formalchemy.helpers import html_escape
+from formalchemy.multidict import data_state
 
 __all__ = ['Field', 'FieldRenderer',
            'TextFieldRenderer', 'TextAreaFieldRenderer',
@@ -72,6 +85,99 @@ class _NoDefault(object):
 NoDefault = _NoDefault()
 del _NoDefault
 
+class _ImmutableList(list):
+    """An empty list shared between fields. It is stored in the slots of
+    the fields only, the public attributes return a real list (see
+    `_owned`)."""
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('%s is shared and can not be modified in place' %
+                        self.__class__.__name__)
+    append = extend = insert = remove = pop = sort = reverse = _immutable
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _immutable
+    def __copy__(self):
+        return list(self)
+    def __deepcopy__(self, memo):
+        return list(self)
+    def __reduce__(self):
+        return (list, (list(self),))
+_EMPTY_LIST = _ImmutableList()
+
+class _ImmutableDict(dict):
+    """An empty dict shared between fields. It is stored in the slots of
+    the fields only, the public attributes return a real dict (see
+    `_owned`)."""
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('%s is shared and can not be modified in place' %
+                        self.__class__.__name__)
+    __setitem__ = __delitem__ = update = setdefault = pop = popitem = clear = _immutable
+    def __copy__(self):
+        return dict(self)
+    def __deepcopy__(self, memo):
+        return dict(self)
+    def __reduce__(self):
+        return (dict, (dict(self),))
+_EMPTY_DICT = _ImmutableDict()
+
+def _shared_or_copy(value):
+    """return a copy of `value`, or the empty sentinel of its type"""
+    if not value:
+        if isinstance(value, dict):
+            return _EMPTY_DICT
+        if isinstance(value, list):
+            return _EMPTY_LIST
+    return copy(value)
+
+_slots = {}
+def _slot_descriptors(cls):
+    """return the descriptors of all the `__slots__` of `cls`"""
+    try:
+        return _slots[cls]
+    except KeyError:
+        descriptors = []
+        for klass in reversed(cls.__mro__):
+            slots = klass.__dict__.get('__slots__', ())
+            if isinstance(slots, string_types):
+                slots = (slots,)
+            for name in slots:
+                if name not in ('__dict__', '__weakref__'):
+                    descriptors.append(klass.__dict__[name])
+        descriptors = _slots[cls] = tuple(descriptors)
+        return descriptors
+
+def _copy_slotted(obj):
+    """shallow copy of an instance of a class using `__slots__`. The
+    instance `__dict__` of the copy is only created if needed"""
+    cls = obj.__class__
+    new = cls.__new__(cls)
+    for descriptor in _slot_descriptors(cls):
+        try:
+            descriptor.__set__(new, descriptor.__get__(obj, cls))
+        except AttributeError:
+            pass
+    attrs = getattr(obj, '__dict__', None)
+    if attrs:
+        new.__dict__.update(attrs)
+    return new
+
+# containers a field view shares with the field it has been created from
+# (see AbstractField._view)
+_SHARED_ATTRS = ('_render_opts', '_validators', '_html_options', '_metadata')
+
+def _owned(name):
+    """A property for the container stored in the slot ``_<name>`` of a
+    field. The slot may hold an empty sentinel or a container shared with
+    another field: the property replaces it by a copy owned by the field on
+    first access (see `AbstractField._own`), so the container can be
+    modified in place. Read-only code uses the slot directly."""
+    attr = '_' + name
+    def fget(self):
+        return self._own(attr)
+    def fset(self, value):
+        setattr(self, attr, value)
+        if attr in self._shared:
+            self._shared = tuple([a for a in self._shared if a != attr])
+    return property(fget, fset)
+
 def deserialize_once(func):
     """Simple deserialization caching decorator.
 
@@ -88,6 +194,147 @@ def deserialize_once(func):
         return self._deserialization_result
     return cache
 
+_TRUE_STRINGS = frozenset(['1', 't', 'true', 'yes'])
+_FALSE_STRINGS = frozenset(['0', 'f', 'false', 'no'])
+
+# C implementations of ISO 8601 parsing (python >= 3.7)
+_date_fromisoformat = getattr(datetime.date, 'fromisoformat', None)
+_time_fromisoformat = getattr(datetime.time, 'fromisoformat', None)
+_datetime_fromisoformat = getattr(datetime.datetime, 'fromisoformat', None)
+
+def _isodigits(data, separator):
+    return data.replace(separator, '').isdigit()
+
+def _parse_date(data):
+    """
+    >>> _parse_date('2008-01-05'), _parse_date('2008-1-5')
+    (datetime.date(2008, 1, 5), datetime.date(2008, 1, 5))
+    >>> _parse_date('YYYY-MM-DD') is None
+    True
+    """
+    if isinstance(data, datetime.date):
+        return data
+    if _date_fromisoformat is not None and len(data) == 10 and \
+       data[4] == '-' and data[7] == '-' and _isodigits(data, '-'):
+        try:
+            return _date_fromisoformat(data)
+        except ValueError:
+            pass
+    if data == 'YYYY-MM-DD' or data == '-MM-DD' or not data.strip():
+        return None
+    try:
+        return datetime.date(*[int(st) for st in data.split('-')])
+    except:
+        raise validators.ValidationError('Invalid date')
+
+def _parse_time(data):
+    """
+    >>> _parse_time('12:05:00'), _parse_time('12:5')
+    (datetime.time(12, 5), datetime.time(12, 5))
+    """
+    if isinstance(data, datetime.time):
+        return data
+    if _time_fromisoformat is not None and len(data) == 8 and \
+       data[2] == ':' and data[5] == ':' and _isodigits(data, ':'):
+        try:
+            return _time_fromisoformat(data)
+        except ValueError:
+            pass
+    if data == 'HH:MM:SS' or not data.strip():
+        return None
+    try:
+        return datetime.time(*[int(st) for st in data.split(':')])
+    except:
+        raise validators.ValidationError('Invalid time')
+
+def _parse_datetime(data):
+    """
+    >>> _parse_datetime('2008-01-05 12:05:00')
+    datetime.datetime(2008, 1, 5, 12, 5)
+    >>> _parse_datetime('2008-1-5T12:5:0Z')
+    datetime.datetime(2008, 1, 5, 12, 5)
+    """
+    if isinstance(data, datetime.datetime):
+        return data
+    if _datetime_fromisoformat is not None and len(data) == 19 and \
+       data[10] in ' T' and _isodigits(data[:10], '-') and \
+       _isodigits(data[11:], ':') and data[4] == data[7] == '-' and \
+       data[13] == data[16] == ':':
+        try:
+            return _datetime_fromisoformat(data)
+        except ValueError:
+            pass
+    if 'Z' in data:
+        data = data.strip('Z')
+    if 'T' in data:
+        data_date, data_time = data.split('T')
+    elif ' ' in data:
+        data_date, data_time = data.split(' ')
+    else:
+        raise validators.ValidationError('Incomplete datetime: %s' % data)
+    dt, tm = _parse_date(data_date), _parse_time(data_time)
+    if dt is None and tm is None:
+        return None
+    elif dt is None or tm is None:
+        raise validators.ValidationError('Incomplete datetime')
+    return datetime.datetime(dt.year, dt.month, dt.day, tm.hour, tm.minute, tm.second)
+
+def _deserialize_boolean(data, renderer):
+    if isinstance(data, bool):
+        return data
+    if data is not None:
+        lower = data.lower()
+        if lower in _TRUE_STRINGS: return True
+        if lower in _FALSE_STRINGS: return False
+    if data is None or data == renderer.field._null_option[1]:
+        return None
+    return data
+
+def _nullable(parse):
+    """return a deserializer calling `parse(data, renderer)` for the values
+    which are not null"""
+    def deserialize(data, renderer):
+        if data is None or data == renderer.field._null_option[1]:
+            return None
+        return parse(data, renderer)
+    return deserialize
+
+_deserialize_float = _nullable(validators.float_)
+
+# the type checks of the deserialization, in order
+_deserializer_types = (
+    (fatypes.Boolean, _deserialize_boolean),
+    (fatypes.Interval, _nullable(
+        lambda data, renderer: datetime.timedelta(validators.float_(data, renderer)))),
+    (fatypes.Integer, _nullable(validators.integer)),
+    (fatypes.Float, _deserialize_float),
+    (fatypes.Numeric, _nullable(validators.decimal_)),
+    (fatypes.Date, _nullable(lambda data, renderer: _parse_date(data))),
+    (fatypes.Time, _nullable(lambda data, renderer: _parse_time(data))),
+    (fatypes.DateTime, _nullable(lambda data, renderer: _parse_datetime(data))),
+)
+_deserialize_default = _nullable(lambda data, renderer: data)
+
+# (type class, asdecimal) -> deserializer
+_deserializers = {}
+
+def _deserializer_for(type_):
+    """return the function turning a submitted value into a python value for
+    a field of type `type_`, called with the value and the renderer.  The
+    type dispatch is done once per type class"""
+    key = (type_.__class__, getattr(type_, 'asdecimal', None))
+    deserializer = _deserializers.get(key)
+    if deserializer is None:
+        deserializer = _deserialize_default
+        for cls, func in _deserializer_types:
+            if isinstance(type_, cls):
+                deserializer = func
+                if cls is fatypes.Numeric and not type_.asdecimal:
+                    deserializer = _deserialize_float
+                break
+        _deserializers[key] = deserializer
+    return deserializer
+
 class FieldRenderer(object):
     """
     This should be the super class of all Renderer classes.
@@ -99,11 +346,17 @@ class FieldRenderer(object):
     Subclasses should override `render` and `deserialize`.
     See their docstrings for details.
     """
+    # subclasses are free to add attributes: the instance __dict__ is
+    # created on first use
+    __slots__ = ('field', '__dict__', '__weakref__')
+    cache_deserialization = True
 
     def __init__(self, field):
         self.field = field
         assert isinstance(self.field, AbstractField)
 
+    __copy__ = _copy_slotted
+
     @property
     def name(self):
         """Name of rendered input element.
@@ -251,8 +504,12 @@ class FieldRenderer(object):
            vals = self.params.getall(self.name)
 
         to catch all the values for the renderer's form entry.
+
+        When the data is a `UnicodeMultiDict`, this is an
+        `IndexedMultiDict` over it, so lookups do not depend on the number
+        of submitted fields.
         """
-        return self.field.parent.data
+        return self.field.parent._get_params()
 
     @property
     def _params(self):
@@ -312,13 +569,16 @@ class FieldRenderer(object):
         value if there was an error with the form.
 
         .. note::
-         Note that this function will be called *twice*, once when
-         the fieldset is `.validate()`d -- with its value only tested,
-         and a second time when the fieldset is `.sync()`d -- and its
-         value assigned to the model. Also note that deserialize() can
+         Note that this function is used when the fieldset is
+         `.validate()`d -- with its value only tested, and when the
+         fieldset is `.sync()`d -- and its value assigned to the model. Also note that deserialize() can
          also raise a ValidationError() exception if it finds some
          errors converting its values.
 
+        The fields keep the result of this function for the data they are
+        bound to, so it is called once per field and bound model (see
+        `DeserializationCache`) unless `cache_deserialization` is False.
+
         If calling this function twice poses a problem to your logic, for
         example, if you have heavy database queries, or temporary objects
         created in this function, consider using the ``deserialize_once``
@@ -341,68 +601,12 @@ class FieldRenderer(object):
         return self._deserialize(self._serialized_value())
 
     def _deserialize(self, data):
-        if isinstance(self.field.type, fatypes.Boolean):
-            if isinstance(data, bool):
-                 return data
-            if data is not None:
-                if data.lower() in ['1', 't', 'true', 'yes']: return True
-                if data.lower() in ['0', 'f', 'false', 'no']: return False
-        if data is None or data == self.field._null_option[1]:
-            return None
-        if isinstance(self.field.type, fatypes.Interval):
-            return datetime.timedelta(validators.float_(data, self))
-        if isinstance(self.field.type, fatypes.Integer):
-            return validators.integer(data, self)
-        if isinstance(self.field.type, fatypes.Float):
-            return validators.float_(data, self)
-        if isinstance(self.field.type, fatypes.Numeric):
-            if self.field.type.asdecimal:
-                return validators.decimal_(data, self)
-            else:
-                return validators.float_(data, self)
-
-        def _date(data):
-            if isinstance(data, datetime.date):
-                return data
-            if data == 'YYYY-MM-DD' or data == '-MM-DD' or not data.strip():
-                return None
-            try:
-                return datetime.date(*[int(st) for st in data.split('-')])
-            except:
-                raise validators.ValidationError('Invalid date')
-        def _time(data):
-            if isinstance(data, datetime.time):
-                return data
-            if data == 'HH:MM:SS' or not data.strip():
-                return None
-            try:
-                return datetime.time(*[int(st) for st in data.split(':')])
-            except:
-                raise validators.ValidationError('Invalid time')
-
-        if isinstance(self.field.type, fatypes.Date):
-            return _date(data)
-        if isinstance(self.field.type, fatypes.Time):
-            return _time(data)
-        if isinstance(self.field.type, fatypes.DateTime):
-            if isinstance(data, datetime.datetime):
-                return data
-            if 'Z' in data:
-                data = data.strip('Z')
-            if 'T' in data:
-                data_date, data_time = data.split('T')
-            elif ' ' in data:
-                data_date, data_time = data.split(' ')
-            else:
-                raise validators.ValidationError('Incomplete datetime: %s' % data)
-            dt, tm = _date(data_date), _time(data_time)
-            if dt is None and tm is None:
-                return None
-            elif dt is None or tm is None:
-                raise validators.ValidationError('Incomplete datetime')
-            return datetime.datetime(dt.year, dt.month, dt.day, tm.hour, tm.minute, tm.second)
-
-        return data
+        # the deserializer of the field type is looked up once
+        type_ = self.field.type
+        plan = self.__dict__.get('_deserializer')
+        if plan is None or plan[0] is not type_:
+            plan = self._deserializer = (type_, _deserializer_for(type_))
+        return plan[1](data, self)
 
     def stringify_value(self, v, as_html=False):
         if as_html:
@@ -492,13 +696,135 @@ class CheckBoxFieldRenderer(FieldRenderer):
             return False
         return FieldRenderer.deserialize(self)
 
+_magic_numbers = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+    (b'%PDF-', 'application/pdf'),
+    (b'PK\x03\x04', 'application/zip'),
+    (b'\x1f\x8b', 'application/gzip'),
+]
+
+def sniff_content_type(head, filename=None, default='application/octet-stream'):
+    """Guess a content type from the first bytes of a file, then from its
+    `filename`:
+
+    >>> sniff_content_type(b'GIF89a...', 'image.png')
+    'image/gif'
+    >>> sniff_content_type(b'var test = null;', 'test.css')
+    'text/css'
+    >>> sniff_content_type(b'')
+    'application/octet-stream'
+    """
+    for magic, content_type in _magic_numbers:
+        if head.startswith(magic):
+            return content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if filename:
+        content_type = mimetypes.guess_type(filename)[0]
+        if content_type:
+            return content_type
+    return default
+
+class Upload(object):
+    """An uploaded file, read once by `FileFieldRenderer`. The `size`, `hash`
+    (an hex digest) and `content_type` are computed while the upload is
+    copied to `file`. An `Upload` can be read like a file."""
+
+    def __init__(self, filename, file, size, hash, content_type):
+        self.filename = filename
+        self.file = file
+        self.size = size
+        self.hash = hash
+        self.content_type = content_type
+
+    @classmethod
+    def from_file(cls, fileobj, filename=None, sink=None, chunk_size=65536,
+                  hash_name='sha256'):
+        """Copy `fileobj` to `sink` (a temporary file by default) by chunks
+        of `chunk_size` bytes"""
+        if sink is None:
+            sink = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        digest = hashlib.new(hash_name)
+        size = 0
+        head = b''
+        while True:
+            chunk = fileobj.read(chunk_size)
+            if not chunk:
+                break
+            if len(head) < 16:
+                head += chunk[:16 - len(head)]
+            size += len(chunk)
+            digest.update(chunk)
+            sink.write(chunk)
+        if hasattr(sink, 'seek'):
+            sink.seek(0)
+        return cls(filename, sink, size, digest.hexdigest(),
+                   sniff_content_type(head, filename))
+
+    def read(self, *args):
+        return self.file.read(*args)
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+    def chunks(self, chunk_size=65536):
+        """iterate over the content from the start"""
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return '<Upload %r %s %i bytes>' % (self.filename, self.content_type,
+                                             self.size)
+
 class FileFieldRenderer(FieldRenderer):
-    """render a file input field"""
+    """render a file input field.
+
+    The upload is read by chunks, and its size, hash and content type are
+    available in `upload` after deserialization. When `streaming` is True
+    the `Upload` is spooled to the temporary file returned by `open_sink()`
+    instead of being read in memory, and the model receives the value
+    returned by `store()`: the content by default, or what an override
+    returns (e.g. the path of the upload saved to a storage). The upload is
+    closed once stored.
+    """
     remove_label = _('Remove')
+    streaming = False
+    chunk_size = 65536
+    spool_size = 1024 * 1024
+    hash_name = 'sha256'
     def __init__(self, *args, **kwargs):
         FieldRenderer.__init__(self, *args, **kwargs)
         self._data = None # caches FieldStorage data
         self._filename = None
+        self.upload = None
+
+    def open_sink(self, filename):
+        """return the file-like where an upload is written in streaming
+        mode"""
+        return tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+
+    def store(self, upload):
+        """save `upload` in streaming mode and return the value of the
+        field, which must fit the column. Return the content, for a binary
+        column; override to return a path or a key instead"""
+        return b''.join(upload.chunks(self.chunk_size))
 
     def render(self, **kwargs):
         if self.field.model_value:
@@ -542,7 +868,20 @@ class FileFieldRenderer(FieldRenderer):
                 # synchronisation
                 if self._data is None:
                     self._filename = data.filename
-                    self._data = data.file.read()
+                    if self.streaming:
+                        sink = self.open_sink(data.filename)
+                    else:
+                        sink = BytesIO()
+                    try:
+                        self.upload = Upload.from_file(data.file, data.filename,
+                                                       sink, self.chunk_size,
+                                                       self.hash_name)
+                        if self.streaming:
+                            self._data = self.store(self.upload)
+                        else:
+                            self._data = sink.getvalue()
+                    finally:
+                        sink.close()
                 data = self._data
             else:
                 data = None
@@ -864,6 +1203,102 @@ class SelectFieldRenderer(FieldRenderer):
         return _stringify(D.get(value, value))
 
 
+class AutocompleteFieldRenderer(FieldRenderer):
+    """Render a scalar relation to a large table as a text input whose
+    suggestions are looked up on the server (see `lookup`), plus a hidden
+    input holding the primary key. Only the selected instance is loaded, and
+    the submitted primary key is checked with one ``Query.get()``. Use
+    `AbstractField.autocomplete`.
+
+    The related class must declare ``__label_columns__``: the first column
+    is searched and should be indexed.
+    """
+    # AttributeField.render does not load the options of the relation
+    loads_options = False
+    limit = 20
+
+    def _label(self, instance):
+        if instance is None:
+            return u''
+        labels = _label_columns(type(instance))
+        if not labels:
+            return _stringify(instance)
+        return u' '.join([_stringify(getattr(instance, column.key))
+                          for column in labels])
+
+    def render(self, lookup_url=None, **kwargs):
+        label_name = self.name + '__label'
+        params = self.params
+        if params is not None and label_name in params:
+            label = params.getone(label_name)
+        else:
+            label = self._label(self.raw_value)
+        kwargs.setdefault('class_', 'fa-autocomplete')
+        kwargs.setdefault('id', self.name)
+        if lookup_url:
+            kwargs['data-lookup-url'] = lookup_url
+        # the label and the focus go to the text input
+        return h.hidden_field(self.name, value=self.value,
+                              id=self.name + '__value') + \
+               h.text_field(label_name, value=label, autocomplete='off',
+                            **kwargs)
+
+    def render_readonly(self, **kwargs):
+        return self._label(self.raw_value)
+
+    def _serialized_value(self):
+        if self.name not in self.params:
+            return None
+        return FieldRenderer._serialized_value(self)
+
+    def deserialize(self):
+        value = self._serialized_value()
+        if value is None or value == '' or value == self.field._null_option[1]:
+            return None
+        cls = self.field.relation_type()
+        pk = _coerce_pk(class_mapper(cls).primary_key, value)
+        instance = self.field.query(cls).get(pk)
+        if instance is None:
+            raise validators.ValidationError(_('Invalid value'))
+        return _pk(instance)
+
+    def lookup(self, term, after=None, limit=None):
+        """Return the related instances whose first label column starts with
+        `term`, as a dict suitable for JSON::
+
+            {'results': [{'id': pk, 'label': label}, ...], 'next': after}
+
+        The results are ordered by label then primary key. At most `limit`
+        results are returned, between 1 and `self.limit`; `next` is None
+        for the last page, or the `after` value to pass to get the next one
+        (keyset paging)."""
+        cls = self.field.relation_type()
+        labels = _label_columns(cls)
+        if not labels:
+            raise ValueError('%s must declare __label_columns__ to be looked up'
+                             % cls.__name__)
+        columns = class_mapper(cls).primary_key
+        if len(columns) != 1:
+            raise ValueError('%s must have a single primary key column to be '
+                             'looked up' % cls.__name__)
+        pk, search = columns[0], labels[0]
+        limit = max(1, min(limit or self.limit, self.limit))
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        q = self.field.query(pk, *labels)
+        q = q.filter(search.like(escaped + '%', escape='\\'))
+        if after:
+            after_label, after_pk = after
+            q = q.filter(or_(search > after_label,
+                             and_(search == after_label, pk > after_pk)))
+        rows = q.order_by(search, pk).limit(limit + 1).all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        results = [dict(id=id, label=label)
+                   for label, id in _projected_options(rows, 1)]
+        return dict(results=results,
+                    next=more and [rows[-1][1], rows[-1][0]] or None)
+
+
 class HiddenFieldRenderer(FieldRenderer):
     """render a field as an hidden field"""
     def render(self, **kwargs):
@@ -927,6 +1362,86 @@ def _pk(instance):
         return _pk_one_column(instance, columns[0])
     return tuple([_pk_one_column(instance, column) for column in columns])
 
+# dialects supporting ``(a, b) IN ((1, 2), (3, 4))``
+_TUPLE_IN_DIALECTS = ('postgresql', 'mysql', 'oracle')
+
+def _coerce_pk(columns, pk):
+    # turn a submitted primary key into the tuple of values used in the
+    # identity map. Strings are converted for numeric columns.
+    values = len(columns) == 1 and [pk] or list(pk)
+    coerced = []
+    for column, value in zip(columns, values):
+        if isinstance(value, string_types):
+            python_type = _numeric_type(column)
+            if python_type is not None:
+                try:
+                    value = python_type(value)
+                except (TypeError, ValueError, ArithmeticError):
+                    pass
+        coerced.append(value)
+    return tuple(coerced)
+
+def _numeric_type(column):
+    # the python type of a numeric column, None for the other columns
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return None
+    if python_type is not None and python_type is not bool and \
+       issubclass(python_type, numbers.Number):
+        return python_type
+    return None
+
+def _is_coerced(columns, key):
+    # False when `_coerce_pk` left a string for a numeric column
+    for column, value in zip(columns, key):
+        if isinstance(value, string_types) and _numeric_type(column) is not None:
+            return False
+    return True
+
+def _get_instances(query, pks, chunk_size=500):
+    """Return the instances of the query's class with the primary keys `pks`
+    (None for the missing ones), like ``[query.get(pk) for pk in pks]``
+    but with a single ``IN`` query for the instances which are not in the
+    session's identity map."""
+    mapper = class_mapper(query.column_descriptions[0]['entity'])
+    session = query.session
+    columns = mapper.primary_key
+    keys = [_coerce_pk(columns, pk) for pk in pks]
+    found = {}
+    missing = []
+    for pk, key in zip(pks, keys):
+        if key in found:
+            continue
+        if not _is_coerced(columns, key):
+            # values which could not be coerced to the type of the key
+            found[key] = query.get(pk)
+            continue
+        obj = session.identity_map.get(mapper.identity_key_from_primary_key(key))
+        if obj is not None:
+            state = instance_state(obj)
+            if not state.expired and not state.deleted:
+                found[key] = obj
+                continue
+        found[key] = None
+        missing.append(key)
+    if missing:
+        dialect = session.get_bind(mapper).dialect.name
+        for i in range(0, len(missing), chunk_size):
+            chunk = missing[i:i + chunk_size]
+            if len(columns) == 1:
+                criterion = columns[0].in_([key[0] for key in chunk])
+            elif dialect in _TUPLE_IN_DIALECTS:
+                criterion = tuple_(*columns).in_(chunk)
+            else:
+                criterion = or_(*[and_(*[c == v for c, v in zip(columns, key)])
+                                  for key in chunk])
+            for obj in query.filter(criterion):
+                key = tuple(mapper.primary_key_from_instance(obj))
+                found[key] = obj
+    # the keys not returned by the IN query do not exist
+    return [found[key] for key in keys]
+
 
 from ast import literal_eval
 def _simple_eval(source):
@@ -943,6 +1458,297 @@ def _query_options(L):
     """
     return [(_stringify(item), _pk(item)) for item in L]
 
+def _label_columns(cls):
+    """Return the attributes of `cls` named by its ``__label_columns__``, or
+    None"""
+    names = getattr(cls, '__label_columns__', None)
+    if not names:
+        return None
+    if isinstance(names, string_types):
+        names = [names]
+    return [getattr(cls, name) for name in names]
+
+def _projected_options(rows, pk_size):
+    """
+    Return a list of `(item description, item pk)` tuples for the `rows` of
+    a query selecting the primary key columns then the label columns. The
+    description is made of the labels separated by spaces.
+    """
+    options = []
+    for row in rows:
+        if pk_size == 1:
+            pk = row[0]
+        else:
+            pk = tuple(row[:pk_size])
+        options.append((u' '.join([_stringify(v) for v in row[pk_size:]]), pk))
+    return options
+
+
+class RenderContext(object):
+    """Data shared by all the FieldSets and Grids rendered during one
+    request.  It memoizes the options of relation fields, so the options of
+    a relation are loaded once per ``(relation class, order_by, session)``,
+    whatever the number of bound FieldSets rendering them.
+
+    A context is created on demand for a request and stored in its environ
+    (see `from_request`), so all FieldSets bound with the same `request`
+    share it.  It can also be passed explicitly::
+
+        >>> from formalchemy.tests import FieldSet, Order, order1, session
+        >>> context = RenderContext()
+        >>> fs1 = FieldSet(Order).bind(order1, render_context=context)
+        >>> fs2 = FieldSet(Order, prefix='other').bind(order1, render_context=context)
+        >>> html = fs1.user.render() + fs2.user.render()
+        >>> context.misses, context.hits
+        (1, 1)
+
+    A context should not outlive its request: options are never reloaded.
+    """
+    environ_key = 'fa.render_context'
+
+    def __init__(self):
+        self.options = {}
+        self.hits = self.misses = 0
+
+    @classmethod
+    def from_request(cls, request):
+        """return the context stored in the environ of `request`, creating it
+        if needed.  Return None if `request` has no environ"""
+        environ = getattr(request, 'environ', None)
+        if environ is None:
+            return None
+        context = environ.get(cls.environ_key)
+        if context is None:
+            context = environ[cls.environ_key] = cls()
+        return context
+
+    @staticmethod
+    def key(cls, order_by, session):
+        """the key of the options of `cls` in `options`"""
+        return (cls, tuple(order_by or ()), session)
+
+    def relation_options(self, cls, order_by, session, load):
+        """return the options for `cls`, calling `load` on the first call for
+        a given `(cls, order_by, session)`"""
+        key = self.key(cls, order_by, session)
+        try:
+            options = self.options[key]
+        except KeyError:
+            self.misses += 1
+            options = self.options[key] = load()
+        else:
+            self.hits += 1
+        return options
+
+    def __repr__(self):
+        return '<%s hits=%s misses=%s>' % (self.__class__.__name__,
+                                           self.hits, self.misses)
+
+class OptionsCache(object):
+    """A process-wide cache of the options of relation fields, for lookup
+    tables which rarely change. It is enabled with::
+
+        from formalchemy import config
+        config.options_cache = OptionsCache(maxsize=128, ttl=3600)
+
+    The options are cached by `(relation class, order_by, database)` for
+    `ttl` seconds, and the least recently used entries are evicted beyond
+    `maxsize` entries. If `classes` is given, only the relations to these
+    classes (or their subclasses) are cached.
+
+    The entries of a class are invalidated when an instance of the class is
+    inserted, updated or deleted, including by ``Query.update()`` and
+    ``Query.delete()``, and again when the session is committed. Changes
+    made by other processes, or to the tables used by ``__unicode__``, are
+    only seen after `ttl` seconds. A session holding uncommitted changes to
+    a class, flushed or not, neither reads nor fills the cache for it: the
+    options it loads include rows the other sessions cannot see yet.
+
+    `stats()` returns the number of hits, misses, evictions, expired entries
+    and invalidations.
+    """
+
+    def __init__(self, maxsize=128, ttl=3600, classes=None, clock=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.classes = classes is not None and tuple(classes) or None
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = self.misses = self.evictions = self.expired = 0
+        self.invalidations = 0
+        # incremented by each invalidation, so a value loaded while the
+        # class was modified is not stored
+        self.generation = 0
+        self._lock = threading.Lock()
+        _options_caches.add(self)
+
+    def accepts(self, cls):
+        """True if the options of `cls` are cached"""
+        return self.classes is None or issubclass(cls, self.classes)
+
+    @staticmethod
+    def key(cls, order_by, bind):
+        return (cls, tuple(order_by or ()), bind)
+
+    def lookup(self, key):
+        """return the options stored for `key`, or None"""
+        with self._lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                if entry[0] > self.clock():
+                    # most recently used last
+                    self.entries[key] = entry
+                    self.hits += 1
+                    return entry[1]
+                self.expired += 1
+            self.misses += 1
+        return None
+
+    def store(self, key, options, generation=None):
+        """store `options` unless the cache was invalidated since
+        `generation`"""
+        _watch_options(key[0])
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries.pop(key, None)
+            self.entries[key] = (self.clock() + self.ttl, options)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key, load):
+        """return the options for `key`, calling `load` on a miss"""
+        options = self.lookup(key)
+        if options is None:
+            generation = self.generation
+            options = load()
+            self.store(key, options, generation)
+        return options
+
+    def invalidate(self, cls=None):
+        """drop the entries of the classes related to `cls`, or all the
+        entries"""
+        with self._lock:
+            self.generation += 1
+            if cls is None:
+                keys = list(self.entries)
+            else:
+                keys = [k for k in self.entries
+                        if issubclass(k[0], cls) or issubclass(cls, k[0])]
+            for k in keys:
+                del self.entries[k]
+            self.invalidations += len(keys)
+
+    def stats(self):
+        return dict(size=len(self.entries), hits=self.hits,
+                    misses=self.misses, evictions=self.evictions,
+                    expired=self.expired, invalidations=self.invalidations)
+
+    def __repr__(self):
+        return '<%s hits=%s misses=%s evictions=%s>' % (
+                self.__class__.__name__, self.hits, self.misses,
+                self.evictions)
+
+_options_caches = weakref.WeakSet()
+_watched_mappers = set()
+_options_session_key = 'formalchemy.options_cache'
+
+def _invalidate_options(cls):
+    for cache in list(_options_caches):
+        cache.invalidate(cls)
+
+def _options_modified(session, cls):
+    _invalidate_options(cls)
+    # invalidate again on commit: another thread may have cached the rows
+    # read before the commit
+    if session is not None:
+        session.info.setdefault(_options_session_key, set()).add(cls)
+
+def _flushed_states(session):
+    """iterate over the states of the instances flushed, and not
+    committed yet, by the transaction of `session` and the enclosing
+    ones"""
+    transaction = getattr(session, 'transaction', None)
+    while transaction is not None:
+        for name in ('_new', '_dirty', '_deleted'):
+            for state in getattr(transaction, name, None) or ():
+                yield state
+        transaction = getattr(transaction, '_parent', None)
+
+def _options_uncommitted(session, cls):
+    """True if `session` has changes to instances of classes related to
+    `cls` which are not committed"""
+    related = lambda c: issubclass(c, cls) or issubclass(cls, c)
+    for c in session.info.get(_options_session_key, ()):
+        if related(c):
+            return True
+    # flushed before _watch_options was called, or not flushed yet
+    for state in _flushed_states(session):
+        if related(state.class_):
+            return True
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if related(type(obj)):
+            return True
+    return False
+
+def _options_changed(mapper, connection, target):
+    _options_modified(object_session(target), mapper.class_)
+
+def _options_bulk_changed(context):
+    if context.mapper is not None:
+        _options_modified(context.session, context.mapper.class_)
+
+def _options_committed(session):
+    for cls in session.info.pop(_options_session_key, ()):
+        _invalidate_options(cls)
+
+def _watch_options(cls):
+    """listen to the changes of the instances of `cls`"""
+    mapper = class_mapper(cls).base_mapper
+    if mapper in _watched_mappers:
+        return
+    if not _watched_mappers:
+        event.listen(Session, 'after_bulk_update', _options_bulk_changed)
+        event.listen(Session, 'after_bulk_delete', _options_bulk_changed)
+        event.listen(Session, 'after_commit', _options_committed)
+        event.listen(Session, 'after_rollback', _options_committed)
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(mapper, name, _options_changed, propagate=True)
+    _watched_mappers.add(mapper)
+
+class DeserializationCache(dict):
+    """The values deserialized from the data bound to a FieldSet, by field
+    and model instance, so ``validate()``, ``sync()`` and `Field.value`
+    deserialize each field once::
+
+        >>> from formalchemy.tests import FieldSet, User, bill
+        >>> fs = FieldSet(User).bind(bill, data={'User-1-email': 'bill@example.com',
+        ...     'User-1-password': '1234', 'User-1-name': 'Bill', 'User-1-orders': '1'})
+        >>> fs.validate()
+        True
+        >>> fs.sync()
+        >>> fs.deserialization_cache
+        <DeserializationCache hits=4 misses=4>
+
+    The cache is dropped by `rebind`, and when the data is modified (see
+    `multidict.data_state`). Renderers whose `deserialize` has side effects can set
+    `cache_deserialization` to False.
+    """
+
+    def __init__(self, data):
+        dict.__init__(self)
+        self.data = data
+        self.state = data_state(data)
+        self.hits = self.misses = 0
+
+    def is_valid(self, data):
+        """True if the cache can be used for `data`"""
+        return data is self.data and data_state(data) == self.state
+
+    def __repr__(self):
+        return '<%s hits=%s misses=%s>' % (self.__class__.__name__,
+                                           self.hits, self.misses)
 
 def _normalized_options(options):
     """
@@ -974,6 +1780,41 @@ def _foreign_keys(property):
         return [r for l, r in property.synchronize_pairs]
 
 
+# renderers owner class -> {type class: (renderers, len(renderers), key)},
+# released with the owner class
+_renderer_keys = weakref.WeakKeyDictionary()
+
+def _renderer_key(cls, type_cls, renderers):
+    """return the key of the default renderer to use for `type_cls` in the
+    `renderers` mapping of `cls` (a FieldSet class), or None.  The most
+    specific class in the MRO of `type_cls` wins.
+
+    The result is cached.  The cache entry is rebuilt when `renderers` is
+    replaced or its size changes, and the renderer itself is always read
+    from `renderers`, so assigning a new renderer to a type is seen
+    immediately."""
+    keys = _renderer_keys.get(cls)
+    if keys is None:
+        keys = _renderer_keys.setdefault(cls, {})
+    entry = keys.get(type_cls)
+    if entry is not None and entry[0] is renderers and \
+       entry[1] == len(renderers) and entry[2] in renderers:
+        return entry[2]
+    key = None
+    for t in type_cls.__mro__:
+        if t in renderers:
+            key = t
+            break
+    else:
+        # virtual subclasses (abc) don't appear in the MRO
+        for t in renderers:
+            if isinstance(t, type) and issubclass(type_cls, t):
+                key = t
+                break
+    if key is not None:
+        keys[type_cls] = (renderers, len(renderers), key)
+    return key
+
 def _model_equal(a, b):
     if not isinstance(a, type):
         a = type(a)
@@ -1012,6 +1853,20 @@ class AbstractField(object):
             'validate', 'renderer', 'hidden', 'required', 'readonly',
             'null_as', 'label', 'multiple', 'options', 'validators',
             'size', 'instructions', 'metadata', 'html', 'attrs']
+    # Fields are created for each bound FieldSet, so they are kept small:
+    # attributes live in slots and empty containers are shared sentinels,
+    # copied when the public attribute is accessed (see `_owned`).  Custom
+    # attributes still go in the instance __dict__.
+    __slots__ = ('parent', '_renderer', '_render_opts', '_validators',
+                 '_errors', '_readonly', 'label_text', '_html_options',
+                 'is_pk', 'is_raw_foreign_key', '_metadata', 'name', 'key',
+                 'type', '_shared', '__dict__', '__weakref__')
+
+    render_opts = _owned('render_opts')
+    validators = _owned('validators')
+    errors = _owned('errors')
+    html_options = _owned('html_options')
+    metadata = _owned('metadata')
 
     def __init__(self, parent, name=None, type=fatypes.String, **kwattrs):
         # the FieldSet (or any ModelRenderer) owning this instance
@@ -1021,36 +1876,74 @@ class AbstractField(object):
         # .checkbox, etc.
         self._renderer = None
         # other render options, such as size, multiple, etc.
-        self.render_opts = {}
+        self._render_opts = _EMPTY_DICT
         # validator functions added with .validate()
-        self.validators = []
+        self._validators = _EMPTY_LIST
         # errors found by _validate() (which runs implicit and
         # explicit validators)
-        self.errors = []
+        self._errors = _EMPTY_LIST
         self._readonly = False
         # label to use for the rendered field.  autoguessed if not specified by .label()
         self.label_text = None
         # optional attributes to pass to renderers
-        self.html_options = {}
+        self._html_options = _EMPTY_DICT
         # True iff this Field is a primary key
         self.is_pk = False
         # True iff this Field is a raw foreign key
         self.is_raw_foreign_key = False
         # Field metadata, for customization
-        self.metadata = {}
+        self._metadata = _EMPTY_DICT
         self.name = name
         self.type = type
+        # names of the attributes shared with another field, which must be
+        # copied before being modified.  Only views have some.
+        self._shared = ()
+
+    __copy__ = _copy_slotted
 
     def __deepcopy__(self, memo):
         wrapper = copy(self)
-        wrapper.render_opts = dict(self.render_opts)
-        wrapper.validators = list(self.validators)
-        wrapper.errors = list(self.errors)
+        wrapper._render_opts = _shared_or_copy(self._render_opts)
+        wrapper._validators = _shared_or_copy(self._validators)
+        wrapper._errors = _shared_or_copy(self._errors)
+        wrapper._html_options = _shared_or_copy(self._html_options)
+        wrapper._metadata = _shared_or_copy(self._metadata)
+        wrapper._shared = ()
         wrapper._renderer = copy(self._renderer)
         if hasattr(wrapper._renderer, 'field'):
             wrapper._renderer.field = wrapper
         return wrapper
 
+    def _view(self, parent):
+        """Return a lightweight copy of this Field, bound to `parent`.  The
+        configuration (``render_opts``, ``validators``, ``html_options``,
+        ``metadata``, renderer) is shared with this field and only copied
+        when modified; ``errors`` and the renderer instance are allocated on
+        first use."""
+        view = copy(self)
+        view.parent = parent
+        view._errors = _EMPTY_LIST
+        if isinstance(self._renderer, FieldRenderer):
+            view._shared = _SHARED_ATTRS + ('_renderer',)
+        else:
+            view._shared = _SHARED_ATTRS
+        return view
+
+    def _own(self, attr):
+        """Return the value of the slot `attr`, copying it first if it is
+        shared with another field or is an empty sentinel.  The public
+        ``render_opts``, ``validators``, ``errors``, ``html_options`` and
+        ``metadata`` attributes call it, so they can be modified in place."""
+        value = getattr(self, attr)
+        if attr in self._shared:
+            value = copy(value)
+            setattr(self, attr, value)
+            self._shared = tuple([a for a in self._shared if a != attr])
+        elif value is _EMPTY_DICT or value is _EMPTY_LIST:
+            value = copy(value)
+            setattr(self, attr, value)
+        return value
+
     @property
     def requires_label(self):
         return not isinstance(self.renderer, HiddenFieldRenderer)
@@ -1067,40 +1960,46 @@ class AbstractField(object):
                          "or specify relation options manually so FormAlchemy doesn't try to autoload them."))
 
     def _validate(self):
+        self.errors = []
+
         if self.is_readonly():
             return True
 
-        self.errors = []
-
         try:
             # Call renderer.deserialize(), because the deserializer can
             # also raise a ValidationError
-            value = self._deserialize()
+            value = self._cached_deserialize()
         except validators.ValidationError as e:
             self.errors.append(e.message)
             return False
 
-        L = list(self.validators)
-        if self.is_required() and validators.required not in L:
-            L.append(validators.required)
-        for validator in L:
-            if value is None and not getattr(validator, 'accepts_none', False):
-                continue
+        for validator in self._get_validators(value):
             try:
-                validator(value, self)
+                self._call_validator(validator, value)
             except validators.ValidationError as e:
                 self.errors.append(e.message)
-            except TypeError:
-                warnings.warn(DeprecationWarning('Please provide a field argument to your %r validator. Your validator will break in FA 1.5' % validator))
-                try:
-                    validator(value)
-                except validators.ValidationError as e:
-                    self.errors.append(e.message)
         return not self.errors
 
+    def _get_validators(self, value):
+        """the validators to run for `value`"""
+        L = list(self._validators)
+        if self.is_required() and validators.required not in L:
+            L.append(validators.required)
+        if value is None:
+            L = [v for v in L if getattr(v, 'accepts_none', False)]
+        return L
+
+    def _call_validator(self, validator, value):
+        # returns the result of the validator, a coroutine for the async ones
+        try:
+            return validator(value, self)
+        except TypeError:
+            warnings.warn(DeprecationWarning('Please provide a field argument to your %r validator. Your validator will break in FA 1.5' % validator))
+            return validator(value)
+
     def is_required(self):
         """True iff this Field must be given a non-empty value"""
-        return validators.required in self.validators
+        return validators.required in self._validators
 
     def is_readonly(self):
         """True iff this Field is in readonly mode"""
@@ -1185,10 +2084,10 @@ class AbstractField(object):
                 self.metadata['instructions'] = value
             elif attr == 'required':
                 if value:
-                    if validators.required not in self.validators:
+                    if validators.required not in self._validators:
                         self.validators.append(validators.required)
                 else:
-                    if validators.required in self.validators:
+                    if validators.required in self._validators:
                         self.validators.remove(validators.required)
             elif attr == 'hidden':
                 if isinstance(self.type, fatypes.Date):
@@ -1244,7 +2143,7 @@ class AbstractField(object):
 
         and display the content in a <span> or something.
         """
-        new_attr = self.metadata.copy()
+        new_attr = dict(self._metadata)
         new_attr.update(attrs)
         return self._modified(metadata=new_attr)
     def validate(self, validator):
@@ -1282,7 +2181,7 @@ class AbstractField(object):
               the `sync` calls, or `label`-tag associations (if you change
               `name`, or `id` for example).  Use with caution.
         """
-        new_opts = copy(self.html_options)
+        new_opts = dict(self._html_options)
         for k, v in html_options.items():
             new_opts[k.rstrip('_')] = v
         return self._modified(html_options=new_opts)
@@ -1332,7 +2231,7 @@ class AbstractField(object):
             renderer = HiddenDateTimeFieldRenderer
         else:
             renderer = HiddenFieldRenderer
-        return self._modified(_renderer=renderer, render_opts={})
+        return self._modified(_renderer=renderer, render_opts=_EMPTY_DICT)
     def password(self):
         """Render the field as a password input, hiding its value."""
         field = deepcopy(self)
@@ -1354,7 +2253,7 @@ class AbstractField(object):
         field = deepcopy(self)
         field._renderer = lambda f: f.parent.default_renderers['radio']
         if options is None:
-            options = self.render_opts.get('options')
+            options = self._render_opts.get('options')
         else:
             options = _normalized_options(options)
         field.render_opts = {'options': options}
@@ -1364,7 +2263,7 @@ class AbstractField(object):
         field = deepcopy(self)
         field._renderer = lambda f: f.parent.default_renderers['checkbox']
         if options is None:
-            options = self.render_opts.get('options')
+            options = self._render_opts.get('options')
         else:
             options = _normalized_options(options)
         field.render_opts = {'options': options}
@@ -1377,13 +2276,23 @@ class AbstractField(object):
         field = deepcopy(self)
         field._renderer = lambda f: f.parent.default_renderers['dropdown']
         if options is None:
-            options = self.render_opts.get('options')
+            options = self._render_opts.get('options')
         else:
             options = _normalized_options(options)
         field.render_opts = {'multiple': multiple, 'options': options}
         if multiple:
             field.render_opts['size'] = size
         return field
+    def autocomplete(self, lookup_url=None):
+        """
+        Render a scalar relation as a text input suggesting the related
+        instances looked up at `lookup_url`, for relations to tables too
+        large for a select. See `AutocompleteFieldRenderer`.
+        """
+        field = deepcopy(self)
+        field._renderer = lambda f: f.parent.default_renderers['autocomplete']
+        field.render_opts = {'lookup_url': lookup_url}
+        return field
     def reset(self):
         """
         Return the field with all configuration changes reverted.
@@ -1505,37 +2414,42 @@ class AbstractField(object):
         return field
 
     def _get_renderer(self):
-        for t in self.parent.default_renderers:
-            if not isinstance(t, string_types) and type(self.type) is t:
-                return self.parent.default_renderers[t]
-        for t in self.parent.default_renderers:
-            if not isinstance(t, string_types) and isinstance(self.type, t):
-                return self.parent.default_renderers[t]
-        raise TypeError(
-                'No renderer found for field %s. '
-                'Type %s has no default renderer' % (self.name, self.type))
+        renderers = self.parent.default_renderers
+        key = _renderer_key(self.parent.__class__, type(self.type), renderers)
+        if key is None:
+            raise TypeError(
+                    'No renderer found for field %s. '
+                    'Type %s has no default renderer' % (self.name, self.type))
+        return renderers[key]
 
     @property
     def renderer(self):
-        if self._renderer is None:
-            self._renderer = self._get_renderer()
-        try:
-            self._renderer = self._renderer(self)
-        except TypeError:
-            pass
-        if not isinstance(self._renderer, FieldRenderer):
+        if '_renderer' in self._shared:
+            # a view of a field which already had a renderer instance
+            self._own('_renderer').field = self
+        renderer = self._renderer
+        if isinstance(renderer, FieldRenderer):
+            return renderer
+        if renderer is None:
+            renderer = self._get_renderer()
+        elif not isinstance(renderer, type):
+            # a factory, like the ones set by .dropdown(), .textarea(), etc.
+            # It returns a Renderer class or instance
+            renderer = renderer(self)
+        if not isinstance(renderer, FieldRenderer):
             # must be a Renderer class.  instantiate.
-            self._renderer = self._renderer(self)
-        return self._renderer
+            renderer = renderer(self)
+        self._renderer = renderer
+        return renderer
 
     def _get_render_opts(self):
         """
         Calculate the final options dict to be sent to renderers.
         """
         # Use options from internally set render_opts
-        opts = dict(self.render_opts)
+        opts = dict(self._render_opts)
         # Override with user-specified options (with .with_html())
-        opts.update(self.html_options)
+        opts.update(self._html_options)
         return opts
 
     def render(self):
@@ -1578,7 +2492,7 @@ class AbstractField(object):
         """
         # TODO add ._validated flag to save users from themselves?
         if not self.is_readonly() and self.parent.data is not None:
-            v = self._deserialize()
+            v = self._cached_deserialize()
             if v is not None:
                 return self._pkify(v)
         return self.model_value
@@ -1602,6 +2516,22 @@ class AbstractField(object):
     def _deserialize(self):
         return self.renderer.deserialize()
 
+    def _cached_deserialize(self):
+        # deserialize once per bound data and model instance
+        if not self.renderer.cache_deserialization:
+            return self._deserialize()
+        cache = self.parent._get_deserialization_cache()
+        model = self.model
+        key = (self.name, id(model))
+        entry = cache.get(key)
+        if entry is not None and entry[0] is model:
+            cache.hits += 1
+            return entry[1]
+        value = self._deserialize()
+        cache.misses += 1
+        cache[key] = (model, value)
+        return value
+
     def __repr__(self):
         return '%s(%s)' % (self.__class__.__name__,self.name)
 
@@ -1610,6 +2540,8 @@ class Field(AbstractField):
     """
     A manually-added form field
     """
+    __slots__ = ('_value', 'is_relation', 'is_scalar_relation')
+
     def __init__(self, name=None, type=fatypes.String, value=None, **kwattrs):
         """
         Create a new Field object.
@@ -1656,7 +2588,7 @@ class Field(AbstractField):
     def is_collection(self):
         if isinstance(self.type, (fatypes.List, fatypes.Set)):
             return True
-        return self.render_opts.get('multiple', False) or isinstance(self.renderer, self.parent.default_renderers['checkbox'])
+        return self._render_opts.get('multiple', False) or isinstance(self.renderer, self.parent.default_renderers['checkbox'])
 
     @property
     def raw_value(self):
@@ -1674,7 +2606,7 @@ class Field(AbstractField):
     def sync(self):
         """Set the attribute's value in `model` to the value given in `data`"""
         if not self.is_readonly():
-            self._value = self._deserialize()
+            self._value = self._cached_deserialize()
 
     def __unicode__(self):
         return self.render_readonly()
@@ -1695,6 +2627,10 @@ class AttributeField(AbstractField):
     """
     Field corresponding to an SQLAlchemy attribute.
     """
+    __slots__ = ('_impl', '_property', 'is_collection', 'is_scalar_relation',
+                 'is_relation', 'is_composite', '_columns',
+                 'is_composite_foreign_key', '_column_name')
+
     def __init__(self, instrumented_attribute, parent):
         """
             >>> from formalchemy.tests import FieldSet, Order
@@ -1725,9 +2661,11 @@ class AttributeField(AbstractField):
 
         self.is_composite = isinstance(self._property, CompositeProperty)
 
-        _columns = self._columns
+        # computed once: fields are copied from a per-class blueprint, see
+        # formalchemy.forms._get_blueprint
+        self._columns = _columns = self._get_columns()
 
-        self.is_pk = bool([c for c in self._columns if c.primary_key])
+        self.is_pk = bool([c for c in _columns if c.primary_key])
 
         self.is_raw_foreign_key = bool(isinstance(self._property, ColumnProperty) and _foreign_keys(self._property.columns[0]))
 
@@ -1819,8 +2757,7 @@ class AttributeField(AbstractField):
         from sqlalchemy.sql.expression import _Label
         return AbstractField.is_readonly(self) or isinstance(self._columns[0], _Label)
 
-    @property
-    def _columns(self):
+    def _get_columns(self):
         if self.is_scalar_relation:
             # If the attribute is a foreign key, return the Column that this
             # attribute is mapped from -- e.g., .user -> .user_id.
@@ -1847,6 +2784,71 @@ class AttributeField(AbstractField):
         """
         return self._property.mapper.class_
 
+    def _relation_order_by(self):
+        order_by = self._property.order_by
+        if order_by and not isinstance(order_by, list):
+            order_by = [order_by]
+        return order_by
+
+    def _relation_session(self):
+        return self.parent.session or object_session(self.model)
+
+    def _load_relation_options(self, session=None):
+        """Load the `(description, pk)` options of a relation from `session`,
+        or from the parent's session"""
+        cls = self.relation_type()
+        order_by = self._relation_order_by()
+        # only the primary key and the label columns are selected when the
+        # class declares them, so no instance is loaded
+        labels = _label_columns(cls)
+        if labels:
+            entities = list(class_mapper(cls).primary_key) + labels
+        else:
+            entities = [cls]
+        # todo 2.0 this does not handle primaryjoin (/secondaryjoin) alternate join conditions
+        if session is None:
+            q = self.query(*entities)
+        else:
+            q = session.query(*entities)
+        if order_by:
+            q = q.order_by(*order_by)
+        if labels:
+            return _projected_options(q, len(entities) - len(labels))
+        return _query_options(q)
+
+    def _options_cache_key(self):
+        """Return ``config.options_cache`` and the key of the options of this
+        relation in it, or `(None, None)` if they are not cached"""
+        cache = config.options_cache
+        session = self._relation_session()
+        if cache is None or session is None or \
+           not cache.accepts(self.relation_type()):
+            return None, None
+        # the instances of an AsyncSession belong to its sync_session
+        session = getattr(session, 'sync_session', session)
+        _watch_options(self.relation_type())
+        if _options_uncommitted(session, self.relation_type()):
+            return None, None
+        bind = session.get_bind(mapper=self._property.mapper)
+        return cache, cache.key(self.relation_type(),
+                                self._relation_order_by(), bind)
+
+    def _relation_options(self):
+        """Return the `(description, pk)` options of a relation, loaded from
+        the parent's session.  Memoized by the parent's `render_context`, if
+        any, and by ``config.options_cache`` (see `OptionsCache`)."""
+        load = self._load_relation_options
+        cache, key = self._options_cache_key()
+        if cache is not None:
+            load = lambda: cache.get(key, self._load_relation_options)
+        context = getattr(self.parent, 'render_context', None)
+        if context is None:
+            return load()
+        return context.relation_options(self.relation_type(),
+                                        self._relation_order_by(),
+                                        self._relation_session(),
+                                        load)
+
     def _pkify(self, value):
         """return the PK for value, if applicable"""
         if value is None:
@@ -1892,7 +2894,7 @@ class AttributeField(AbstractField):
     def sync(self):
         """Set the attribute's value in `model` to the value given in `data`"""
         if not self.is_readonly():
-            setattr(self.model, self.name, self._deserialize())
+            setattr(self.model, self.name, self._cached_deserialize())
 
     def __eq__(self, other):
         # we override eq so that when we configure with options=[...], we can match the renders in options
@@ -1910,24 +2912,20 @@ class AttributeField(AbstractField):
     def render(self):
         if self.is_readonly():
             return self.render_readonly()
-        if self.is_relation and self.render_opts.get('options') is None:
+        if self.is_relation and self._render_opts.get('options') is None \
+           and getattr(self.renderer, 'loads_options', True):
+            render_opts = self.render_opts
             if self.is_required() or self.is_collection:
-                self.render_opts['options'] = []
+                render_opts['options'] = []
             else:
-                self.render_opts['options'] = [self._null_option]
-            # todo 2.0 this does not handle primaryjoin (/secondaryjoin) alternate join conditions
-            q = self.query(self.relation_type())
-            order_by = self._property.order_by
-            if order_by:
-                if not isinstance(order_by, list):
-                    order_by = [order_by]
-                q = q.order_by(*order_by)
-            self.render_opts['options'] += _query_options(q)
-            logger.debug('options for %s are %s' % (self.name, self.render_opts['options']))
+                render_opts['options'] = [self._null_option]
+            render_opts['options'] += self._relation_options()
+            logger.debug('options for %s are %s' % (self.name, render_opts['options']))
         if self.is_collection and isinstance(self.renderer, self.parent.default_renderers['dropdown']):
-            self.render_opts['multiple'] = True
-            if 'size' not in self.render_opts:
-                self.render_opts['size'] = 5
+            render_opts = self.render_opts
+            render_opts['multiple'] = True
+            if 'size' not in render_opts:
+                render_opts['size'] = 5
         return AbstractField.render(self)
 
     def _get_renderer(self):
@@ -1944,7 +2942,21 @@ class AttributeField(AbstractField):
             python_pk = lambda st: st
 
         if self.is_collection:
-            return [self.query(self.relation_type()).get(python_pk(pk)) for pk in self.renderer.deserialize()]
+            return self._get_instances([python_pk(pk) for pk in self.renderer.deserialize()])
         if self.is_composite_foreign_key:
-            return self.query(self.relation_type()).get(python_pk(self.renderer.deserialize()))
+            return self._get_instances([python_pk(self.renderer.deserialize())])[0]
         return self.renderer.deserialize()
+
+    def _get_instances(self, pks):
+        # load the related instances with one query. The result is kept in
+        # the deserialization cache for the sync() following validate(), so
+        # it is dropped with the bound data
+        if not pks:
+            return []
+        query = self.query(self.relation_type())
+        key = (query.session, pks)
+        cache = self.parent._get_deserialization_cache()
+        memo = cache.get(('instances', self.name))
+        if memo is None or memo[0] != key:
+            memo = cache[('instances', self.name)] = (key, _get_instances(query, pks))
+        return list(memo[1])
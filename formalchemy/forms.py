@@ -4,6 +4,7 @@
 # the MIT License: http://www.opensource.org/licenses/mit-license.php
 
 import cgi
+import threading
 import warnings
 import logging
 from six import string_types
@@ -17,7 +18,9 @@ if __version__.split('.') < MIN_SA_VERSION.split('.'):
 
 from sqlalchemy.orm.attributes import InstrumentedAttribute
 from sqlalchemy.orm.properties import SynonymProperty, CompositeProperty
+from sqlalchemy import event
 from sqlalchemy.orm import configure_mappers, object_session, class_mapper
+from sqlalchemy.orm.mapper import Mapper
 from sqlalchemy.orm.session import Session
 from sqlalchemy.orm.scoping import ScopedSession
 from sqlalchemy.orm.dynamic import DynamicAttributeImpl
@@ -40,8 +43,6 @@ from tempita import Template as _TempitaTemplate # must import after base
 class TempitaTemplate(_TempitaTemplate):
 	default_encoding = None
 
-configure_mappers() # initializes InstrumentedAttributes
-
 
 from sqlalchemy.orm.attributes import manager_of_class
 def _get_attribute(cls, p):
@@ -49,6 +50,71 @@ def _get_attribute(cls, p):
     return manager[p.key]
 
 
+# mapped class -> list of unbound AttributeField prototypes.  Introspecting a
+# mapper is expensive, so it is done once per class and every FieldSet
+# construction only copies the prototypes.
+_blueprints = {}
+_blueprints_lock = threading.RLock()
+
+def _clear_blueprints(*args):
+    """Forget all model blueprints.  Called whenever SQLAlchemy (re)configures
+    mappers, since properties may have been added in the meantime."""
+    with _blueprints_lock:
+        _blueprints.clear()
+
+event.listen(Mapper, 'after_configured', _clear_blueprints)
+
+
+def _introspect(cls, fieldset):
+    """Return the list of `AttributeField` for the mapped class `cls`, bound
+    to `fieldset`"""
+    # load synonyms so we can ignore them
+    ignore_keys = set()
+    for p in class_mapper(cls).iterate_properties:
+        if isinstance(p, SynonymProperty):
+            ignore_keys.add(p.name)
+            # Can't ignore the original, this hides synonymized relationships when the ID it points to is not also synonymed
+            # ignore_keys.add(p.key)
+        elif hasattr(p, '_is_polymorphic_discriminator') and p._is_polymorphic_discriminator:
+            ignore_keys.add(p.key)
+        elif isinstance(p, CompositeProperty):
+            for p in p.props:
+                ignore_keys.add(p.key)
+
+    # attributes we're interested in
+    attrs = []
+    for p in class_mapper(cls).iterate_properties:
+        attr = _get_attribute(cls, p)
+        if ((isinstance(p, SynonymProperty) or (attr.property.key not in ignore_keys
+            and p.key not in ignore_keys))
+            and not isinstance(attr.impl, DynamicAttributeImpl)):
+            attrs.append(attr)
+    # sort relations last before storing in the OrderedDict
+    L = [fields.AttributeField(attr, fieldset) for attr in attrs]
+    L.sort(key=lambda a: a.is_relation)
+    return L
+
+
+def _get_blueprint(cls, fieldset):
+    """Return the `AttributeField` prototypes of the mapped class `cls`.
+    The mapper is only introspected the first time a class is seen (or after
+    mappers have been reconfigured); the prototypes must be bound before use.
+    """
+    try:
+        return _blueprints[cls]
+    except KeyError:
+        pass
+    # make sure pending mappers are configured before locking, so the
+    # after_configured event can not invalidate the blueprint we are building
+    class_mapper(cls)
+    with _blueprints_lock:
+        blueprint = _blueprints.get(cls)
+        if blueprint is None:
+            blueprint = [field.bind(None) for field in _introspect(cls, fieldset)]
+            _blueprints[cls] = blueprint
+        return blueprint
+
+
 def prettify(text):
     """
     Turn an attribute name into something prettier, for a default label where none is given.
@@ -63,7 +129,8 @@ class SimpleMultiDict(multidict.UnicodeMultiDict):
     def __init__(self, *args, **kwargs):
         encoding = kwargs.get('encoding', config.encoding)
         multi = multidict.MultiDict()
-        multidict.UnicodeMultiDict.__init__(self, multi=multi, encoding=encoding)
+        multidict.UnicodeMultiDict.__init__(self, multi=multi, encoding=encoding,
+                                            decode_once=True)
         for value in args:
             if isinstance(value, (list, tuple)):
                 items = value
@@ -101,6 +168,7 @@ class DefaultRenderers(object):
         fatypes.List: fields.SelectFieldRenderer,
         fatypes.Set: fields.SelectFieldRenderer,
         'dropdown': fields.SelectFieldRenderer,
+        'autocomplete': fields.AutocompleteFieldRenderer,
         'checkbox': fields.CheckBoxSet,
         'radio': fields.RadioSet,
         'password': fields.PasswordFieldRenderer,
@@ -238,9 +306,23 @@ class FieldSet(DefaultRenderers):
         the == operator, they are NOT necessarily the same `Field`
         instance.  Stick to referencing `Field`'s from their parent
         `FieldSet` to always get the "right" instance.)
+
+        When the `copy_on_write` attribute is True, `bind` does not copy the
+        configuration of each `Field`: the bound fields are views sharing
+        ``render_opts``, ``validators``, ``html_options``, ``metadata`` and
+        the renderer with the configured ones.  A view copies one of them
+        the first time it is read through its public attribute, so bound
+        fields can be modified through their methods (`set`, `label`,
+        `validate`, ...) or in place (``fs.name.render_opts['size'] = 10``)
+        without changing the configured FieldSet.  Errors and renderer
+        instances are still specific to each bound FieldSet.
     """
     __sa__ = True
     engine = _render = _render_readonly = None
+    copy_on_write = False
+    render_context = None
+    deserialization_cache = None
+    _params = None
 
     prettify = staticmethod(prettify)
 
@@ -264,6 +346,9 @@ class FieldSet(DefaultRenderers):
         self._original_cls = isinstance(model, type) and model or type(model)
 
         if self.__sa__:
+            # initializes InstrumentedAttributes.  Deferred until the first
+            # FieldSet is built so importing formalchemy stays cheap
+            configure_mappers()
             FieldSet.rebind(self, model, session, data, request)
 
             cls = isinstance(self.model, type) and self.model or type(self.model)
@@ -283,31 +368,8 @@ class FieldSet(DefaultRenderers):
                     raise Exception("not bound to a SA instance, and no manual Field definitions found")
             else:
                 # SA class.
-                # load synonyms so we can ignore them
-                ignore_keys = set()
-                for p in class_mapper(cls).iterate_properties:
-                    if isinstance(p, SynonymProperty):
-                        ignore_keys.add(p.name)
-                        # Can't ignore the original, this hides synonymized relationships when the ID it points to is not also synonymed
-                        # ignore_keys.add(p.key)
-                    elif hasattr(p, '_is_polymorphic_discriminator') and p._is_polymorphic_discriminator:
-                        ignore_keys.add(p.key)
-                    elif isinstance(p, CompositeProperty):
-                        for p in p.props:
-                            ignore_keys.add(p.key)
-
-                # attributes we're interested in
-                attrs = []
-                for p in class_mapper(cls).iterate_properties:
-                    attr = _get_attribute(cls, p)
-                    if ((isinstance(p, SynonymProperty) or (attr.property.key not in ignore_keys
-                        and p.key not in ignore_keys))
-                        and not isinstance(attr.impl, DynamicAttributeImpl)):
-                        attrs.append(attr)
-                # sort relations last before storing in the OrderedDict
-                L = [fields.AttributeField(attr, self) for attr in attrs]
-                L.sort(key=lambda a: a.is_relation)
-                self._fields.update((field.key, field) for field in L)
+                self._fields.update((field.key, field.bind(self))
+                                    for field in _get_blueprint(cls, self))
 
 
     def configure(self, pk=False, focus=True, readonly=False, global_validator=None, exclude=[], include=[], options=[]):
@@ -399,14 +461,21 @@ class FieldSet(DefaultRenderers):
         self._render_fields = OrderedDict([(field.key, field) for field in self._get_fields(pk, exclude, include, options, use_rendered=True)])
 
     def bind(self, model=None, session=None, data=None, request=None,
-             with_prefix=True):
+             with_prefix=True, render_context=None):
         """
         Return a copy of this FieldSet or Grid, bound to the given
         `model`, `session`, and `data`. The parameters to this method are the
         same as in the constructor.
 
+        `render_context` is a :class:`~formalchemy.fields.RenderContext`
+        shared by the FieldSets rendered during a request.  When not given,
+        the context stored in the `request` environ is used.
+
         Often you will create and `configure` a FieldSet or Grid at application
         startup, then `bind` specific instances to it for actual editing or display.
+
+        If `copy_on_write` is set, the fields of the returned FieldSet are
+        cheap views sharing their configuration with the fields of this one.
         """
         if not (model is not None or session or data or request):
             raise Exception('must specify at least one of {model, session, data, request}')
@@ -421,17 +490,23 @@ class FieldSet(DefaultRenderers):
         mr.__dict__ = dict(self.__dict__)
         # two steps so bind's error checking can work
         FieldSet.rebind(mr, model, session, data, request,
-                        with_prefix=with_prefix)
-        mr._fields = OrderedDict([(key, renderer.bind(mr)) for key, renderer in self._fields.items()])
-        if self._render_fields:
-            mr._render_fields = OrderedDict([(field.key, field) for field in
-                                             [field.bind(mr) for field in self._render_fields.values()]])
+                        with_prefix=with_prefix, render_context=render_context)
+        if self.copy_on_write:
+            mr._fields = OrderedDict([(key, field._view(mr)) for key, field in self._fields.items()])
+            if self._render_fields:
+                mr._render_fields = OrderedDict([(field.key, field._view(mr))
+                                                 for field in self._render_fields.values()])
+        else:
+            mr._fields = OrderedDict([(key, renderer.bind(mr)) for key, renderer in self._fields.items()])
+            if self._render_fields:
+                mr._render_fields = OrderedDict([(field.key, field) for field in
+                                                 [field.bind(mr) for field in self._render_fields.values()]])
         mr._request = request
         return mr
 
 
     def rebind(self, model=None, session=None, data=None, request=None,
-               with_prefix=True):
+               with_prefix=True, render_context=None):
         """
         Like `bind`, but acts on this instance.  No return value.
         Not all parameters are treated the same; specifically, what happens if they are NOT specified is different:
@@ -443,7 +518,15 @@ class FieldSet(DefaultRenderers):
           `request` is also saved to be access by renderers (as
           `fs.FIELD.renderer.request`).
         * if `with_prefix` is False then a prefix ``{Model}-{pk}`` is added to each data keys
+        * if `render_context` is specified it is used, else if `request` is
+          specified the context of the request is used, else the context is
+          reset: the options loaded for a previous request are not reused
         """
+        self.deserialization_cache = None
+        if render_context is None and request is not None:
+            render_context = fields.RenderContext.from_request(request)
+        self.render_context = render_context
+
         if data is None and request is not None:
             if hasattr(request, 'environ') and hasattr(request, 'POST'):
                 if request.environ.get('REQUEST_METHOD', '').upper() == 'POST':
@@ -518,7 +601,8 @@ class FieldSet(DefaultRenderers):
         elif isinstance(data, multidict.UnicodeMultiDict):
             self.data = data
         elif isinstance(data, multidict.MultiDict):
-            self.data = multidict.UnicodeMultiDict(multi=data, encoding=config.encoding)
+            self.data = multidict.UnicodeMultiDict(multi=data, encoding=config.encoding,
+                                                   decode_once=True)
         elif hasattr(data, 'getall') and hasattr(data, 'getone'):
             self.data = data
         elif isinstance(data, (dict, list)):
@@ -551,18 +635,36 @@ class FieldSet(DefaultRenderers):
             except (AttributeError, UnmappedInstanceError):
                 pass # non-SA object
             else:
-                if o_session and self.session is not o_session:
+                # the instances of an AsyncSession belong to its sync_session
+                session = getattr(self.session, 'sync_session', self.session)
+                if o_session and session is not o_session:
                     raise Exception('You may not explicitly bind to a session when your model already belongs to a different one')
 
+    def _get_params(self):
+        """return the view of `data` used by the renderers. A
+        `UnicodeMultiDict` is wrapped once in an `IndexedMultiDict`, shared
+        by the rows of a Grid"""
+        data = self.data
+        if not isinstance(data, multidict.UnicodeMultiDict):
+            return data
+        params = self._params
+        if params is None or params.data is not data:
+            params = self._params = multidict.IndexedMultiDict(
+                                        data, self._format, self._prefix)
+        return params
+
+    def _get_deserialization_cache(self):
+        cache = self.deserialization_cache
+        if cache is None or not cache.is_valid(self.data):
+            cache = self.deserialization_cache = fields.DeserializationCache(self.data)
+        return cache
+
     def validate(self):
         """
         Validate attributes and `global_validator`.
         If validation fails, the validator should raise `ValidationError`.
         """
-        if self.readonly:
-            raise ValidationError('Cannot validate a read-only FieldSet')
-        if self.data is None:
-            raise ValidationError('Cannot validate without binding data')
+        self._check_validate()
         success = True
         for field in self.render_fields.values():
             success = field._validate() and success
@@ -578,6 +680,41 @@ class FieldSet(DefaultRenderers):
                 success = False
         return success
 
+    def _check_validate(self):
+        if self.readonly:
+            raise ValidationError('Cannot validate a read-only FieldSet')
+        if self.data is None:
+            raise ValidationError('Cannot validate without binding data')
+
+    def avalidate(self):
+        """
+        asyncio version of `validate`: ``await fs.avalidate()``. Validators
+        and the `global_validator` may be coroutine functions. The
+        validators of the fields run concurrently. See `formalchemy.aio`.
+        """
+        from formalchemy import aio
+        return aio.validate(self)
+
+    def arender(self, executor=None, **kwargs):
+        """
+        asyncio version of `render`: ``await fs.arender()``. The options of
+        the relation fields are loaded before the template is rendered,
+        concurrently when a `concurrent.futures` `executor` is given and
+        `formalchemy.aio.setup()` was called. See
+        `formalchemy.aio.load_relation_options`.
+        """
+        from formalchemy import aio
+        return aio.render(self, executor, **kwargs)
+
+    def async_sync(self):
+        """
+        asyncio version of `sync`: ``await fs.async_sync()``. With a
+        SQLAlchemy ``AsyncSession``, the synchronization runs in
+        ``AsyncSession.run_sync()``.
+        """
+        from formalchemy import aio
+        return aio.sync(self)
+
     def sync(self):
         """
         Sync (copy to the corresponding attributes) the data passed to the constructor or `bind` to the `model`.
@@ -618,7 +755,7 @@ class FieldSet(DefaultRenderers):
         if self._errors:
             errors[None] = self._errors
         errors.update(dict([(field, field.errors)
-                            for field in self.render_fields.values() if field.errors]))
+                            for field in self.render_fields.values() if field._errors]))
         return errors
 
 
@@ -4,6 +4,8 @@
 # the MIT License: http://www.opensource.org/licenses/mit-license.php
 
 import os
+import re
+import threading
 from gettext import GNUTranslations
 
 i18n_path = os.path.join(os.path.dirname(__file__), 'i18n_resources')
@@ -30,6 +32,87 @@ class _Translator(object):
         return value
 _translator = _Translator()
 
+class CatalogCache(object):
+    """Process wide, thread safe cache of the parsed catalogs, by language.
+
+    Languages without catalog are cached too, up to `max_missing` of them.
+    A `lang` which does not look like a language tag (``fr``, ``pt_BR``,
+    ``zh-Hant``) is not looked up nor cached, since it may come from a
+    request header.  If `auto_reload` is true (use it for development), the modification time of the ``.mo`` file is
+    checked on each access and the catalog is parsed again if it changed.
+
+    `hits` and `misses` count the accesses. A miss means that a catalog file
+    has been looked up and parsed.
+    """
+
+    max_missing = 100
+    lang_re = re.compile(r'^[A-Za-z]{1,8}([_-][A-Za-z0-9]{1,8})*$')
+
+    def __init__(self, path, domain='formalchemy', auto_reload=False):
+        self.path = path
+        self.domain = domain
+        self.auto_reload = auto_reload
+        self.hits = self.misses = 0
+        # lang -> (mtime, gettext)
+        self._catalogs = {}
+        self._missing = 0
+        self._lock = threading.Lock()
+
+    def filename(self, lang):
+        return os.path.join(self.path, lang, 'LC_MESSAGES', '%s.mo' % self.domain)
+
+    def _mtime(self, lang):
+        filename = self.filename(lang)
+        if os.path.isfile(filename):
+            return os.path.getmtime(filename)
+
+    def get(self, lang):
+        """return the gettext function of the catalog for `lang`, or None if
+        there is no catalog for this language"""
+        entry = self._catalogs.get(lang)
+        if entry is not None and not self.auto_reload:
+            self.hits += 1
+            return entry[1]
+        if not self.lang_re.match(lang or ''):
+            return None
+        with self._lock:
+            entry = self._catalogs.get(lang)
+            mtime = self._mtime(lang)
+            if entry is None or entry[0] != mtime:
+                self.misses += 1
+                gettext = None
+                if mtime is not None:
+                    with open(self.filename(lang), 'rb') as fd:
+                        gettext = GNUTranslations(fd).gettext
+                missing = gettext is None and 1 or 0
+                if entry is not None:
+                    missing -= entry[1] is None and 1 or 0
+                elif missing and self._missing >= self.max_missing:
+                    return None
+                self._missing += missing
+                entry = self._catalogs[lang] = (mtime, gettext)
+            else:
+                self.hits += 1
+        return entry[1]
+
+    def clear(self):
+        """forget all the catalogs and reset the counters"""
+        with self._lock:
+            self._catalogs.clear()
+            self.hits = self.misses = self._missing = 0
+
+    def stats(self):
+        """return a dict with the counters and the number of languages
+        cached"""
+        return dict(hits=self.hits, misses=self.misses,
+                    catalogs=len(self._catalogs))
+
+    def __repr__(self):
+        return '<%s hits=%s misses=%s>' % (self.__class__.__name__,
+                                           self.hits, self.misses)
+
+catalogs = CatalogCache(i18n_path)
+
 def get_translator(lang=None, request=None):
     """
     return a GNUTranslations instance for `lang`::
@@ -41,6 +124,9 @@ def get_translator(lang=None, request=None):
         >>> assert translate('Remove') == 'Remove'
         >>> assert translate('month_01') == 'January'
 
+    Catalogs are parsed once and kept in `catalogs`, a
+    :class:`CatalogCache`.
+
     The correct gettext method is stored in request if possible::
 
         >>> from webob import Request
@@ -77,13 +163,8 @@ def get_translator(lang=None, request=None):
 
     # get the first available catalog
     for lang in langs:
-        filename = os.path.join(i18n_path, lang, 'LC_MESSAGES','formalchemy.mo')
-        if os.path.isfile(filename):
-            translations_path = os.path.join(i18n_path, lang, 'LC_MESSAGES','formalchemy.mo')
-            tr = GNUTranslations(open(translations_path, 'rb')).gettext
-            def translate(value):
-                value = tr(value)
-                return value
+        translate = catalogs.get(lang)
+        if translate is not None:
             if request is not None:
                 request.environ['fa.translate'] = translate
             return translate
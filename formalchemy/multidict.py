@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import re
 import cgi
 import copy
 from six import string_types
@@ -21,15 +22,28 @@ class UnicodeMultiDict(MutableMapping):
     variable is decoded. Its ``name`` variable is decoded when ``decode_keys``
     is enabled.
 
+    When ``decode_once`` is True, the decoded values of a key are cached on
+    first access (or for all the keys by ``decode_all()``), so a
+    ``FieldStorage`` is cloned only once. Modifications made through the
+    wrapper reset the cache, modifications of ``multi`` itself are not
+    seen. ``decoded`` counts the decoded values and ``hits`` the reads
+    served from the cache.
+
+    ``version`` is incremented by each modification made through the
+    wrapper.
+
     """
     def __init__(self, multi, encoding=None, errors='strict',
-                 decode_keys=False):
+                 decode_keys=False, decode_once=False):
         self.multi = multi
         if encoding is None:
             encoding = sys.getdefaultencoding()
         self.encoding = encoding
         self.errors = errors
         self.decode_keys = decode_keys
+        self.decode_once = decode_once
+        self._decoded = {}
+        self.decoded = self.hits = self.version = 0
 
     def _decode_key(self, key):
         if self.decode_keys:
@@ -51,6 +65,7 @@ class UnicodeMultiDict(MutableMapping):
 
         ``FieldStorage`` objects are specially handled.
         """
+        self.decoded += 1
         if isinstance(value, cgi.FieldStorage):
             # decode FieldStorage's field name and filename
             value = copy.copy(value)
@@ -73,22 +88,67 @@ class UnicodeMultiDict(MutableMapping):
             value = value.encode(self.encoding, self.errors)
         return value
 
+    def _decoded_values(self, key):
+        """return the cached list of decoded values of `key`"""
+        try:
+            values = self._decoded[key]
+        except KeyError:
+            values = self._decoded[key] = [self._decode_value(v) for v in
+                                           self.multi.getall(self._encode_key(key))]
+        else:
+            self.hits += 1
+        return values
+
+    def decode_all(self):
+        """
+        Decode all the values at once and return a dictionary of key: list
+        of decoded values. Only available when ``decode_once`` is True.
+        """
+        if not self.decode_once:
+            raise TypeError('decode_all() requires decode_once=True')
+        missing = {}
+        for k, v in self.multi.items():
+            key = self._decode_key(k)
+            if key not in self._decoded:
+                missing.setdefault(key, []).append(self._decode_value(v))
+        self._decoded.update(missing)
+        return self._decoded
+
+    def stats(self):
+        """return the decoding counters"""
+        return dict(decoded=self.decoded, hits=self.hits,
+                    cached=len(self._decoded))
+
+    def _modified(self):
+        self.version += 1
+        if self._decoded:
+            self._decoded.clear()
+
     def __getitem__(self, key):
+        if self.decode_once:
+            values = self._decoded_values(key)
+            if not values:
+                raise KeyError(key)
+            return values[-1]
         return self._decode_value(self.multi.__getitem__(self._encode_key(key)))
 
     def __setitem__(self, key, value):
+        self._modified()
         self.multi.__setitem__(self._encode_key(key), self._encode_value(value))
 
     def add(self, key, value):
         """
         Add the key and value, not overwriting any previous value.
         """
+        self._modified()
         self.multi.add(self._encode_key(key), self._encode_value(value))
 
     def getall(self, key):
         """
         Return a list of all values matching the key (may be an empty list)
         """
+        if self.decode_once:
+            return list(self._decoded_values(key))
         return map(self._decode_value, self.multi.getall(self._encode_key(key)))
 
     def getone(self, key):
@@ -96,6 +156,13 @@ class UnicodeMultiDict(MutableMapping):
         Get one value matching the key, raising a KeyError if multiple
         values were found.
         """
+        if self.decode_once:
+            values = self._decoded_values(key)
+            if not values:
+                raise KeyError('Key not found: %r' % key)
+            if len(values) > 1:
+                raise KeyError('Multiple values match %r: %r' % (key, values))
+            return values[0]
         return self._decode_value(self.multi.getone(self._encode_key(key)))
 
     def mixed(self):
@@ -106,6 +173,9 @@ class UnicodeMultiDict(MutableMapping):
         dictionary often used to represent the variables in a web
         request.
         """
+        if self.decode_once:
+            return dict((k, v[0] if len(v) == 1 else list(v))
+                        for k, v in self.decode_all().items() if v)
         unicode_mixed = {}
         for key, value in self.multi.mixed().items():
             if isinstance(value, list):
@@ -120,6 +190,9 @@ class UnicodeMultiDict(MutableMapping):
         Returns a dictionary where each key is associated with a
         list of values.
         """
+        if self.decode_once:
+            return dict((k, list(v)) for k, v in self.decode_all().items()
+                        if v)
         unicode_dict = {}
         for key, value in self.multi.dict_of_lists().items():
             value = [self._decode_value(value) for value in value]
@@ -127,6 +200,7 @@ class UnicodeMultiDict(MutableMapping):
         return unicode_dict
 
     def __delitem__(self, key):
+        self._modified()
         self.multi.__delitem__(self._encode_key(key))
 
     def __contains__(self, key):
@@ -135,20 +209,26 @@ class UnicodeMultiDict(MutableMapping):
     has_key = __contains__
 
     def clear(self):
+        self._modified()
         self.multi.clear()
 
     def copy(self):
-        return UnicodeMultiDict(self.multi.copy(), self.encoding, self.errors)
+        return UnicodeMultiDict(self.multi.copy(), self.encoding, self.errors,
+                                decode_keys=self.decode_keys,
+                                decode_once=self.decode_once)
 
     def setdefault(self, key, default=None):
+        self._modified()
         return self._decode_value(
             self.multi.setdefault(self._encode_key(key),
                                   self._encode_value(default)))
 
     def pop(self, key, *args):
+        self._modified()
         return self._decode_value(self.multi.pop(self._encode_key(key), *args))
 
     def popitem(self):
+        self._modified()
         k, v = self.multi.popitem()
         return (self._decode_key(k), self._decode_value(v))
 
@@ -173,20 +253,203 @@ class UnicodeMultiDict(MutableMapping):
     __iter__ = iterkeys
 
     def items(self):
-        return [(self._decode_key(k), self._decode_value(v))
-                for k, v in self.multi.items()]
+        return list(self.iteritems())
 
     def iteritems(self):
+        if self.decode_once:
+            decoded = self.decode_all()
+            seen = {}
+            for k in self.multi.keys():
+                key = self._decode_key(k)
+                i = seen[key] = seen.get(key, -1) + 1
+                yield (key, decoded[key][i])
+            return
         for k, v in self.multi.items():
             yield (self._decode_key(k), self._decode_value(v))
 
     def values(self):
-        return [self._decode_value(v) for v in self.multi.values()]
+        return list(self.itervalues())
 
     def itervalues(self):
+        if self.decode_once:
+            for k, v in self.iteritems():
+                yield v
+            return
         for v in self.multi.values():
             yield self._decode_value(v)
 
+class IndexedMultiDict(MutableMapping):
+    """
+    A view over a ``UnicodeMultiDict`` answering lookups with a dict built in
+    one pass over the submitted items, instead of scanning the items on each
+    ``getone()``, ``getall()`` or ``in``.
+
+    Writes go to the wrapped ``data`` and reset the view. The view is also
+    rebuilt when ``data`` is modified (see `data_state`).
+
+    ``index`` parses the keys with the ``format`` and ``prefix`` of a
+    ``FieldSet``:
+
+    >>> from formalchemy.forms import SimpleMultiDict
+    >>> data = SimpleMultiDict([('User-1-name', 'Bill'), ('User-1-orders', '1'),
+    ...                         ('User-1-orders', '2'), ('User-2-name', 'John')])
+    >>> params = IndexedMultiDict(data)
+    >>> params.getone('User-1-name')
+    'Bill'
+    >>> params.getall('User-1-orders')
+    ['1', '2']
+    >>> 'User-3-name' in params
+    False
+    >>> sorted(params.index['User']['1'].items())
+    [('name', ['Bill']), ('orders', ['1', '2'])]
+    """
+    def __init__(self, data, format=u'%(model)s-%(pk)s-%(name)s',
+                 prefix=None):
+        self.data = data
+        self.format = format
+        self.prefix = prefix
+        self._lists = self._index = None
+        self._state = None
+
+    def _reset(self):
+        self._lists = self._index = None
+
+    @property
+    def lists(self):
+        """a dict of key: list of decoded values"""
+        state = data_state(self.data)
+        if self._lists is None or state != self._state:
+            if getattr(self.data, 'decode_once', False):
+                lists = dict((k, v) for k, v in self.data.decode_all().items()
+                             if v)
+            else:
+                lists = {}
+                for key, value in self.data.items():
+                    if key in lists:
+                        lists[key].append(value)
+                    else:
+                        lists[key] = [value]
+            self._lists = lists
+            self._index = None
+            self._state = state
+        return self._lists
+
+    @property
+    def index(self):
+        """a dict of ``{model: {pk: {field name: [values]}}}``. Keys which do
+        not match ``format`` are not indexed"""
+        lists = self.lists
+        if self._index is None:
+            match = _key_pattern(self.format, self.prefix).match
+            index = {}
+            for key, values in lists.items():
+                m = match(key)
+                if m is None:
+                    continue
+                groups = m.groupdict()
+                pks = index.setdefault(groups.get('model'), {})
+                pks.setdefault(groups.get('pk'), {})[groups['name']] = values
+            self._index = index
+        return self._index
+
+    def getall(self, key):
+        """
+        Return a list of all values matching the key (may be an empty list)
+        """
+        return list(self.lists.get(key, ()))
+
+    def getone(self, key):
+        """
+        Get one value matching the key, raising a KeyError if multiple
+        values were found.
+        """
+        values = self.lists.get(key)
+        if not values:
+            raise KeyError('Key not found: %r' % key)
+        if len(values) > 1:
+            raise KeyError('Multiple values match %r: %r' % (key, values))
+        return values[0]
+
+    def __getitem__(self, key):
+        values = self.lists.get(key)
+        if not values:
+            raise KeyError(key)
+        return values[-1]
+
+    def __contains__(self, key):
+        return key in self.lists
+
+    has_key = __contains__
+
+    def mixed(self):
+        return dict((k, v[0] if len(v) == 1 else list(v))
+                    for k, v in self.lists.items())
+
+    def dict_of_lists(self):
+        return dict((k, list(v)) for k, v in self.lists.items())
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self._reset()
+
+    def add(self, key, value):
+        self.data.add(key, value)
+        self._reset()
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self._reset()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def keys(self):
+        return list(self.data.keys())
+
+    def items(self):
+        return list(self.data.items())
+
+    def values(self):
+        return list(self.data.values())
+
+    def __repr__(self):
+        return repr(self.data)
+
+def data_state(data):
+    """return a value which changes when `data` is modified: its number of
+    items and, for a `UnicodeMultiDict`, its ``version``"""
+    try:
+        size = len(data)
+    except TypeError:
+        size = None
+    return size, getattr(data, 'version', None)
+
+_key_patterns = {}
+
+def _key_pattern(format, prefix):
+    """compile a regexp matching the keys generated with a FieldSet's
+    `format` and `prefix`"""
+    try:
+        return _key_patterns[(format, prefix)]
+    except KeyError:
+        pass
+    groups = dict(model='(?P<model>[^-]+)', pk='(?P<pk>.*?)', name='(?P<name>.+)')
+    pattern = ''
+    for i, part in enumerate(re.split(r'%\((\w+)\)s', format)):
+        if i % 2:
+            pattern += groups.pop(part, '.*?')
+        else:
+            pattern += re.escape(part)
+    if prefix is not None:
+        pattern = re.escape(u'%s-' % prefix) + pattern
+    if 'name' in groups:
+        pattern = '(?!)'
+    regexp = _key_patterns[(format, prefix)] = re.compile(pattern + '$')
+    return regexp
+
 def _hide_passwd(items):
     for k, v in items:
         if ('password' in k
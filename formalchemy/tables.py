@@ -5,9 +5,13 @@
 
 from six import string_types, next
 
+from sqlalchemy.orm.attributes import instance_state
+from sqlalchemy.orm.exc import NO_STATE
+
 import formalchemy.helpers as h
 
 from formalchemy import config
+from formalchemy.fields import FileFieldRenderer
 from formalchemy.forms import FieldSet
 
 from tempita import Template as TempitaTemplate # must import after base
@@ -74,7 +78,8 @@ class Grid(FieldSet):
             del kwargs['focus']
         FieldSet.configure(self, **kwargs)
 
-    def bind(self, instances, session=None, data=None, request=None):
+    def bind(self, instances, session=None, data=None, request=None,
+             render_context=None):
         """bind to instances"""
         _validate_iterable(instances)
         if not session:
@@ -86,16 +91,19 @@ class Grid(FieldSet):
             else:
                 from sqlalchemy.orm import object_session
                 session = object_session(instance)
-        mr = FieldSet.bind(self, self.model, session, data, request)
+        mr = FieldSet.bind(self, self.model, session, data, request,
+                           render_context=render_context)
         mr.rows = instances
         mr._request = request
         return mr
 
-    def rebind(self, instances=None, session=None, data=None, request=None):
+    def rebind(self, instances=None, session=None, data=None, request=None,
+               render_context=None):
         """rebind to instances"""
         if instances is not None:
             _validate_iterable(instances)
-        FieldSet.rebind(self, self.model, session, data, request)
+        FieldSet.rebind(self, self.model, session, data, request,
+                        render_context=render_context)
         if instances is not None:
             self.rows = instances
 
@@ -139,8 +147,32 @@ class Grid(FieldSet):
             return self._render(collection=self, **kwargs)
         return engine('grid', collection=self, **kwargs)
 
+    def render_iter(self, **kwargs):
+        """Same as `render` but return an iterable of HTML chunks, which
+        joined together are the result of `render`.  With an engine able to
+        stream (like :class:`~formalchemy.templates.CompiledEngine`) the
+        header is yielded first, then each row, so a large grid can be sent
+        to the client while being rendered.  Other engines yield the whole
+        grid at once."""
+        engine = self.engine or config.engine
+        if self._render or self._render_readonly:
+            yield self.render(**kwargs)
+            return
+        if self.readonly:
+            template_name = 'grid_readonly'
+        else:
+            template_name = 'grid'
+            if 'request' not in kwargs:
+                kwargs['request'] = self._request
+        for chunk in engine.stream(template_name, collection=self, **kwargs):
+            yield chunk
+    iter_render = render_iter
+
     def _set_active(self, instance, session=None):
+        # the rows share the deserialization cache and the render context
+        cache, context = self.deserialization_cache, self.render_context
         FieldSet.rebind(self, instance, session or self.session, self.data)
+        self.deserialization_cache, self.render_context = cache, context
 
     def __iter__(self):
         """Iterates over the rows, also binds to the specific instance"""
@@ -157,13 +189,25 @@ class Grid(FieldSet):
     def errors(self):
         return self._errors
 
-    def validate(self):
-        """These are the same as in `FieldSet`"""
-        if self.data is None:
-            raise Exception('Cannot validate without binding data')
-        if self.readonly:
-            raise Exception('Cannot validate a read-only Grid')
+    def validate(self, executor=None):
+        """These are the same as in `FieldSet`.
+
+        With an `executor` (e.g. a `concurrent.futures.ThreadPoolExecutor`)
+        each row is validated by its own FieldSet, whose fields are views of
+        the fields of the Grid, and the rows are spread over the executor.
+        This pays off when the validators release the GIL (I/O, regular
+        expressions on long texts). The validators must be thread safe and
+        must not use the session, which is not. The fields which may query
+        the session are validated in the calling thread before the other
+        fields are handed to the executor: the relations, the files, whose
+        deserialization reads the model, and the attributes the row has not
+        loaded (deferred or expired). The errors are merged in the order of
+        the rows.
+        """
+        self._check_validate()
         self._errors.clear()
+        if executor is not None:
+            return self._validate_rows(executor)
         success = True
         for row in self:
             row_errors = {}
@@ -174,6 +218,83 @@ class Grid(FieldSet):
             self._errors[row] = row_errors
         return success
 
+    def _check_validate(self):
+        if self.data is None:
+            raise Exception('Cannot validate without binding data')
+        if self.readonly:
+            raise Exception('Cannot validate a read-only Grid')
+
+    def avalidate(self):
+        """asyncio version of `validate`: ``await grid.avalidate()``. The
+        rows and the validators of their fields are validated
+        concurrently. See `formalchemy.aio`."""
+        from formalchemy import aio
+        return aio.validate_grid(self)
+
+    def _bind_rows(self, rows):
+        """return a FieldSet bound to each row of `rows`. The fields are
+        views of the fields of this Grid and the rows share its data"""
+        # build the index of the data once, before the copies share it
+        getattr(self._get_params(), 'index', None)
+        template = object.__new__(self.__class__)
+        template.__dict__ = dict(self.__dict__, copy_on_write=True)
+        return [FieldSet.bind(template, row, self.session, self.data)
+                for row in rows]
+
+    @staticmethod
+    def _validate_row(fs, keys=None):
+        # validate the fields of `fs`, or only those whose key is in `keys`
+        success = True
+        for key, field in fs.render_fields.items():
+            if keys is None or key in keys:
+                success = field._validate() and success
+        return success
+
+    @staticmethod
+    def _local_keys(fs):
+        # the keys of the fields of `fs` which may load from the session
+        try:
+            unloaded = instance_state(fs.model).unloaded
+        except NO_STATE:
+            unloaded = ()
+        return set([key for key, field in fs.render_fields.items()
+                    if getattr(field, 'is_relation', False) or
+                       isinstance(field.renderer, FileFieldRenderer) or
+                       getattr(field, 'key', None) in unloaded])
+
+    def _merge_rows(self, rows, contexts, results):
+        """store the errors of the fields of `contexts`, the FieldSets bound
+        to `rows`, and return True if all the `results` are successful"""
+        render_fields = self.render_fields
+        cache = self._get_deserialization_cache()
+        success = True
+        for row, fs, row_success in zip(rows, contexts, results):
+            success = row_success and success
+            self._errors[row] = dict([(render_fields[key], field.errors)
+                                      for key, field in fs.render_fields.items()
+                                      if field.errors])
+            # sync() reuses the deserialized values
+            if fs.deserialization_cache is not None:
+                cache.update(fs.deserialization_cache)
+                cache.hits += fs.deserialization_cache.hits
+                cache.misses += fs.deserialization_cache.misses
+        return success
+
+    def _validate_rows(self, executor):
+        rows = list(self.rows)
+        contexts = self._bind_rows(rows)
+        # the session is not thread safe: the fields which may use it are
+        # validated here
+        local = [self._local_keys(fs) for fs in contexts]
+        results = [self._validate_row(fs, keys)
+                   for fs, keys in zip(contexts, local)]
+        others = [set(fs.render_fields) - keys
+                  for fs, keys in zip(contexts, local)]
+        if [keys for keys in others if keys]:
+            results = [here and there for here, there in zip(results,
+                       executor.map(self._validate_row, contexts, others))]
+        return self._merge_rows(rows, contexts, results)
+
     def sync_one(self, row):
         """
         Use to sync a single one of the instances that are
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 import os
 import sys
+import types
+import threading
+
+from six import text_type
 
 from formalchemy.i18n import get_translator
 from formalchemy import helpers
@@ -9,28 +13,44 @@ from formalchemy.helpers import literal
 from tempita import Template as _TempitaTemplate
 class TempitaTemplate(_TempitaTemplate):
 	default_encoding = None
-try:
-    from mako.lookup import TemplateLookup
-    from mako.template import Template as MakoTemplate
-    from mako.exceptions import TopLevelLookupException
-    HAS_MAKO = True
-except ImportError:
-    HAS_MAKO = False
-try:
-    from genshi.template import TemplateLoader as GenshiTemplateLoader
-    HAS_GENSHI = True
-except ImportError:
-    HAS_GENSHI = False
+
+def _has_module(name):
+    """True if the module `name` is available. It is not imported: mako
+    and genshi are only imported when their engine loads a template"""
+    try:
+        from importlib.util import find_spec
+    except ImportError:
+        # python 2
+        import imp
+        try:
+            imp.find_module(name)
+        except ImportError:
+            return False
+        return True
+    try:
+        return find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+HAS_MAKO = _has_module('mako')
+HAS_GENSHI = _has_module('genshi')
 
 MAKO_TEMPLATES = os.path.join(
         os.path.dirname(__file__),
         'paster_templates','pylons_fa','+package+','templates', 'forms')
 
 class TemplateEngine(object):
-    """Base class for templates engines
+    """Base class for templates engines.
+
+    Templates are loaded with the keyword arguments given to the
+    constructor and kept in the `templates` dict. The default templates are
+    loaded by the constructor, unless `lazy` is True: they are then loaded
+    on first use by `get`, so engines reading `templates` directly must
+    call `get` instead.
     """
     directories = []
     extension = None
+    lazy = False
     _templates = ['fieldset', 'fieldset_readonly',
                   'grid', 'grid_readonly']
     def __init__(self, **kw):
@@ -39,13 +59,35 @@ class TemplateEngine(object):
             self.extension = kw.pop('extension')
         if 'directories' in kw:
             self.directories = list(kw.pop('directories'))
-        for name in self._templates:
-            self.templates[name] = self.get_template(name, **kw)
+        if 'lazy' in kw:
+            self.lazy = kw.pop('lazy')
+        self._options = kw
+        self._lock = threading.Lock()
+        if not self.lazy:
+            self.preload()
 
     def get_template(self, name, **kw):
         """return the template object for `name`. Likely to be overridden by engines"""
         return None
 
+    def get(self, name):
+        """return the template object for `name`, loaded by `get_template`
+        on first use"""
+        template = self.templates.get(name)
+        if template is None:
+            with self._lock:
+                template = self.templates.get(name)
+                if template is None:
+                    template = self.get_template(name, **dict(self._options))
+                    if template is not None:
+                        self.templates[name] = template
+        return template
+
+    def preload(self):
+        """load the default templates now instead of on first use"""
+        for name in self._templates:
+            self.get(name)
+
     def get_filename(self, name):
         """return the filename for template `name`"""
         for dirname in self.directories + [os.path.dirname(__file__)]:
@@ -57,6 +99,12 @@ class TemplateEngine(object):
         """render the template. Must be overridden by engines"""
         raise NotImplementedError("You need to implement %s.render." % self.__class__.__name__)
 
+    def render_iter(self, template_name, **kwargs):
+        """render the template as an iterable of chunks. Engines which can
+        render progressively override it. The default yields the result of
+        `render`"""
+        yield self.render(template_name, **kwargs)
+
     def _update_args(cls, kw):
         kw['F_'] = get_translator(lang=kw.get('lang', None),
                                   request=kw.get('request', None))
@@ -69,6 +117,11 @@ class TemplateEngine(object):
         self._update_args(kw)
         return self.render(template_name, **kw)
 
+    def stream(self, template_name, **kw):
+        """same as `__call__` but call `render_iter`"""
+        self._update_args(kw)
+        return self.render_iter(template_name, **kw)
+
 class TempitaEngine(TemplateEngine):
     """Template engine for tempita. File extension is `.tmpl`.
     """
@@ -80,15 +133,245 @@ class TempitaEngine(TemplateEngine):
             return TempitaTemplate.from_filename(filename, **kw)
 
     def render(self, template_name, **kwargs):
-        template = self.templates.get(template_name, None)
+        template = self.get(template_name)
         return literal(template.substitute(**kwargs))
 
+class _Unsupported(Exception):
+    """raised when a template can't be compiled"""
+
+def _text(value):
+    # same as TempitaTemplate._repr for unicode templates
+    if value is None:
+        return u''
+    return text_type(value)
+
+def _loops(nodes):
+    """return the outermost for loops found in `nodes`"""
+    loops = []
+    for node in nodes:
+        if isinstance(node, tuple):
+            if node[0] == 'for':
+                loops.append(node)
+            elif node[0] == 'cond':
+                for part in node[2:]:
+                    loops.extend(_loops(part[3]))
+    return loops
+
+class _Compiler(object):
+    """Turn a parsed tempita template into the source of a python function.
+
+    When `stream` is true, the function is a generator yielding the output
+    before each iteration of the outermost ``{{for}}`` loops containing
+    another loop (like the rows of a grid), or of all the outermost loops if
+    none contains another loop."""
+
+    def __init__(self, parsed, stream=False):
+        self.streamed = ()
+        if stream:
+            loops = _loops(parsed)
+            self.streamed = [id(l) for l in loops if _loops(l[4])] or \
+                            [id(l) for l in loops]
+        self.stream = stream
+        self.lines = []
+        # position in the template of each line of the generated code
+        self.positions = []
+
+    def emit(self, indent, code, pos=None):
+        for line in code.splitlines():
+            self.lines.append('    ' * indent + line)
+            self.positions.append(pos)
+
+    def nodes(self, nodes, indent):
+        if not nodes:
+            self.emit(indent, 'pass')
+        for node in nodes:
+            if isinstance(node, (text_type, str)):
+                self.emit(indent, '_fa_append(%r)' % node)
+            else:
+                getattr(self, 'node_%s' % node[0], self.unsupported)(node, indent)
+
+    def unsupported(self, node, indent):
+        raise _Unsupported(node[0])
+
+    def code(self, code):
+        if "'''" in code or '"""' in code:
+            # may contain a multi-line string, which can't be indented
+            raise _Unsupported(code)
+        return code
+
+    def flush(self, indent):
+        self.emit(indent, 'if _fa_out:')
+        self.emit(indent + 1, 'yield _fa_join(_fa_out)')
+        self.emit(indent + 1, 'del _fa_out[:]')
+
+    def node_expr(self, node, indent):
+        # {{value|filter}}
+        parts = self.code(node[2]).split('|')
+        code = '(%s)' % parts[0]
+        for part in parts[1:]:
+            code = '(%s)(%s)' % (part, code)
+        self.emit(indent, '_fa_append(_fa_text(%s))' % code, node[1])
+
+    def node_py(self, node, indent):
+        self.emit(indent, self.code(node[2]), node[1])
+
+    def node_for(self, node, indent):
+        self.emit(indent, 'for %s in (%s):' % (', '.join(node[2]), node[3]), node[1])
+        if id(node) in self.streamed:
+            self.flush(indent + 1)
+        self.nodes(node[4], indent + 1)
+
+    def node_cond(self, node, indent):
+        for part in node[2:]:
+            if part[0] == 'else':
+                self.emit(indent, 'else:', part[1])
+            else:
+                self.emit(indent, '%s (%s):' % (part[0], part[2]), part[1])
+            self.nodes(part[3], indent + 1)
+
+    def node_continue(self, node, indent):
+        self.emit(indent, 'continue', node[1])
+
+    def node_break(self, node, indent):
+        self.emit(indent, 'break', node[1])
+
+    def node_comment(self, node, indent):
+        pass
+
+    def source(self, prologue=()):
+        lines = ['def _fa_template(_fa_text=_fa_text, _fa_join=_fa_join):']
+        for name in prologue:
+            lines.append('    if %r in _fa_ns: %s = _fa_ns[%r]' % (name, name, name))
+        lines.extend(['    _fa_out = []', '    _fa_append = _fa_out.append'])
+        offset = len(lines) + 1
+        lines.extend(self.lines)
+        if self.stream:
+            lines.extend(['    if _fa_out:', '        yield _fa_join(_fa_out)'])
+        else:
+            lines.append('    return _fa_join(_fa_out)')
+        return '\n'.join(lines) + '\n', offset
+
+class CompiledTemplate(object):
+    """A tempita template compiled to a python function.  The output is the
+    same as the output of the tempita template.  Templates using features
+    which are not supported (``{{def}}``, ``{{inherit}}``, ``{{default}}``)
+    are interpreted by tempita."""
+
+    def __init__(self, template):
+        self.template = template
+        self.name = template.name
+        try:
+            if not template._unicode:
+                raise _Unsupported('bytes')
+            self._code = self.compile(template._parsed)
+            self._stream_code = self.compile(template._parsed, stream=True)
+        except _Unsupported:
+            self._code = self._stream_code = None
+
+    def compile(self, parsed, stream=False):
+        """return the code object, the default arguments and the template
+        positions of a function rendering `parsed`"""
+        compiler = _Compiler(parsed, stream=stream)
+        compiler.nodes(parsed, 1)
+        filename = '<compiled template %s>' % self.name
+        # first pass: find the names assigned by the template. Those are
+        # function locals, loaded from the namespace by a prologue
+        source, offset = compiler.source()
+        namespace = dict(_fa_text=_text, _fa_join=u''.join)
+        try:
+            exec(compile(source, filename, 'exec'), namespace)
+        except SyntaxError:
+            raise _Unsupported('syntax')
+        code = namespace['_fa_template'].__code__
+        names = [n for n in code.co_varnames + code.co_cellvars
+                 if not n.startswith('_fa_')]
+        source, offset = compiler.source(names)
+        namespace = dict(_fa_text=_text, _fa_join=u''.join)
+        exec(compile(source, filename, 'exec'), namespace)
+        func = namespace['_fa_template']
+        positions = dict((i + offset, pos)
+                         for i, pos in enumerate(compiler.positions))
+        return func.__code__, func.__defaults__, positions
+
+    def _function(self, compiled, kw):
+        template = self.template
+        ns = dict(template.default_namespace)
+        ns.update(kw)
+        ns['__template_name__'] = self.name
+        if template.namespace:
+            ns.update(template.namespace)
+        ns['_fa_ns'] = ns
+        code, defaults = compiled[:2]
+        return types.FunctionType(code, ns, code.co_name, defaults)
+
+    def substitute(self, **kw):
+        if self._code is None:
+            return self.template.substitute(**kw)
+        func = self._function(self._code, kw)
+        try:
+            return func()
+        except Exception:
+            self._add_line_info(self._code, *sys.exc_info()[1:])
+            raise
+
+    def substitute_iter(self, **kw):
+        """yield the output as chunks: the text before the first outermost
+        ``{{for}}`` loop, then the output of each iteration."""
+        if self._stream_code is None:
+            yield self.template.substitute(**kw)
+            return
+        chunks = self._function(self._stream_code, kw)()
+        try:
+            for chunk in chunks:
+                yield chunk
+        except Exception:
+            self._add_line_info(self._stream_code, *sys.exc_info()[1:])
+            raise
+
+    def _add_line_info(self, compiled, e, tb):
+        code, positions = compiled[0], compiled[2]
+        pos = None
+        while tb is not None:
+            if tb.tb_frame.f_code is code:
+                pos = positions.get(tb.tb_lineno)
+            tb = tb.tb_next
+        if pos is not None:
+            arg0 = e.args and e.args[0] or text_type(e)
+            e.args = (self.template._add_line_info(arg0, pos),)
+
+    def __repr__(self):
+        return '<%s name=%r>' % (self.__class__.__name__, self.name)
+
+class CompiledEngine(TempitaEngine):
+    """Template engine using the tempita syntax. Templates are compiled to
+    python functions once, then rendered without being interpreted.  The
+    output is the same as the :class:`TempitaEngine` one. File extension is
+    `.tmpl`.
+
+    `render_iter` yields the text before the outermost ``{{for}}`` loops,
+    then the output of each of their iterations, e.g. each row of a grid.
+    """
+    def get_template(self, name, **kw):
+        template = TempitaEngine.get_template(self, name, **kw)
+        if template is not None:
+            return CompiledTemplate(template)
+
+    def render(self, template_name, **kwargs):
+        return literal(self.get(template_name).substitute(**kwargs))
+
+    def render_iter(self, template_name, **kwargs):
+        for chunk in self.get(template_name).substitute_iter(**kwargs):
+            yield literal(chunk)
+
 class MakoEngine(TemplateEngine):
     """Template engine for mako. File extension is `.mako`.
     """
     extension = 'mako'
     _lookup = None
     def get_template(self, name, **kw):
+        from mako.lookup import TemplateLookup
+        from mako.template import Template as MakoTemplate
+        from mako.exceptions import TopLevelLookupException
         if self._lookup is None:
             self._lookup = TemplateLookup(directories=self.directories, **kw)
         try:
@@ -100,7 +383,7 @@ class MakoEngine(TemplateEngine):
                 return MakoTemplate(template.substitute(template_engine='mako'), **kw)
 
     def render(self, template_name, **kwargs):
-        template = self.templates.get(template_name, None)
+        template = self.get(template_name)
         return literal(template.render_unicode(**kwargs))
 
 class GenshiEngine(TemplateEngine):
@@ -108,19 +391,24 @@ class GenshiEngine(TemplateEngine):
     """
     extension = 'html'
     def get_template(self, name, **kw):
+        from genshi.template import TemplateLoader as GenshiTemplateLoader
         filename = self.get_filename(name)
         if filename:
             loader = GenshiTemplateLoader(os.path.dirname(filename), **kw)
             return loader.load(os.path.basename(filename))
 
     def render(self, template_name, **kwargs):
-        template = self.templates.get(template_name, None)
+        template = self.get(template_name)
         return literal(template.generate(**kwargs).render('html', doctype=None))
 
 
+# loaded on first use, so importing formalchemy does not read templates
 if HAS_MAKO:
-    default_engine = MakoEngine(input_encoding='utf-8', output_encoding='utf-8')
-    engines = dict(mako=default_engine, tempita=TempitaEngine())
+    default_engine = MakoEngine(input_encoding='utf-8', output_encoding='utf-8',
+                                lazy=True)
+    engines = dict(mako=default_engine, tempita=TempitaEngine(lazy=True),
+                   compiled=CompiledEngine(lazy=True))
 else:
-    default_engine = TempitaEngine()
-    engines = dict(tempita=TempitaEngine())
+    default_engine = TempitaEngine(lazy=True)
+    engines = dict(tempita=TempitaEngine(lazy=True),
+                   compiled=CompiledEngine(lazy=True))
@@ -364,6 +364,23 @@ class OrderUserTag(Base):
 class Order__User(Base):
     __table__ = join(Order.__table__, User.__table__).alias('__orders__users')
 
+# the users and order users of the fixtures, with label columns
+class LabeledUser(Base):
+    __table__ = User.__table__
+    __label_columns__ = ('name', 'email')
+
+class LabeledOrder(Base):
+    __table__ = Order.__table__
+    user = relation(LabeledUser)
+
+class LabeledOrderUser(Base):
+    __table__ = OrderUser.__table__
+    __label_columns__ = 'order_id'
+
+class LabeledOrderUserTag(Base):
+    __table__ = OrderUserTag.__table__
+    order_user = relation(LabeledOrderUser)
+
 class Aliases(Base):
     __tablename__ = 'table_with_aliases'
     id = Column(Integer, primary_key=True)
@@ -436,40 +453,38 @@ def pretty_html(html):
     soup = BeautifulSoup(html)
     return soup.prettify().strip()
 
+# fresh engines: the compiled templates must render like tempita whatever
+# the default engine is
+tempita_engine = templates.TempitaEngine(lazy=True)
+compiled_engine = templates.CompiledEngine(lazy=True)
+
+def compare_engines(html, template_name, **kwargs):
+    """check that all the engines render `template_name` as `html`"""
+    for name, engine in templates.engines.items():
+        if type(engine) is type(config.engine):
+            continue
+        html_engine = pretty_html(engine(template_name, **kwargs))
+        assert html == html_engine, (name, html, html_engine)
+    html_tempita = pretty_html(tempita_engine(template_name, **kwargs))
+    html_compiled = pretty_html(compiled_engine(template_name, **kwargs))
+    assert html_compiled == html_tempita, ('compiled', html_tempita, html_compiled)
+
 class FieldSet(DefaultFieldSet):
     def render(self, lang=None):
-        if self.readonly:
-            html = pretty_html(DefaultFieldSet.render(self))
-            for name, engine in templates.engines.items():
-                if isinstance(engine, config.engine.__class__):
-                    continue
-                html_engine = pretty_html(engine('fieldset_readonly', fieldset=self))
-                assert html == html_engine, (name, html, html_engine)
-            return html
         html = pretty_html(DefaultFieldSet.render(self))
-        for name, engine in templates.engines.items():
-            if isinstance(engine, config.engine.__class__):
-                continue
-            html_engine = pretty_html(engine('fieldset', fieldset=self))
-            assert html == html_engine, (name, html, html_engine)
+        if self.readonly:
+            compare_engines(html, 'fieldset_readonly', fieldset=self)
+        else:
+            compare_engines(html, 'fieldset', fieldset=self)
         return html
 
 class Grid(DefaultGrid):
     def render(self, lang=None):
-        if self.readonly:
-            html = pretty_html(DefaultGrid.render(self))
-            for name, engine in templates.engines.items():
-                if isinstance(engine, config.engine.__class__):
-                    continue
-                html_engine = pretty_html(engine('grid_readonly', collection=self))
-                assert html == html_engine, (name, html, html_engine)
-            return html
         html = pretty_html(DefaultGrid.render(self))
-        for name, engine in templates.engines.items():
-            if isinstance(engine, config.engine.__class__):
-                continue
-            html_engine = pretty_html(engine('grid', collection=self))
-            assert html == html_engine, (name, html, html_engine)
+        if self.readonly:
+            compare_engines(html, 'grid_readonly', collection=self)
+        else:
+            compare_engines(html, 'grid', collection=self)
         return html
 
 original_renderers = FieldSet.default_renderers.copy()
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""The test cases of `formalchemy.aio`, imported by test_aio on python 3.7
+and later only: they use the async syntax"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from formalchemy.tests import *
+from formalchemy.validators import ValidationError
+from formalchemy import aio, fields
+from sqlalchemy import event
+import asyncio
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+class RunSyncSession(object):
+    """an AsyncSession like wrapper"""
+
+    def __init__(self, session):
+        self.sync_session = session
+        self.calls = 0
+
+    async def run_sync(self, func, *args):
+        self.calls += 1
+        return func(self.sync_session, *args)
+
+class TestAsyncValidation(unittest.TestCase):
+
+    data = {'User-1-email': 'bill_@example.com', 'User-1-password': '1234_',
+            'User-1-name': 'Bill_', 'User-1-orders': ['1'],
+            'User-2-email': 'john_@example.com', 'User-2-password': '',
+            'User-2-name': 'John_', 'User-2-orders': ['2', '3']}
+
+    def tearDown(self):
+        session.rollback()
+
+    def test_async_validators(self):
+        ready = asyncio.Event()
+        async def first(value, field):
+            # only returns if the second validator runs concurrently
+            await asyncio.wait_for(ready.wait(), 1)
+        async def second(value, field):
+            ready.set()
+            raise ValidationError('Taken')
+        def sync(value, field):
+            raise ValidationError('Too short')
+        fs = DefaultFieldSet(User).bind(bill, data=self.data)
+        fs.configure(options=[fs.email.validate(first),
+                              fs.name.validate(second).validate(sync)])
+        self.assertFalse(run(fs.avalidate()))
+        self.assertEqual(fs.errors, {fs.name: ['Taken', 'Too short']})
+
+    def test_global_validator(self):
+        async def validator(fs):
+            raise ValidationError('Invalid')
+        fs = DefaultFieldSet(User).bind(bill, data=self.data)
+        fs.configure(global_validator=validator)
+        self.assertFalse(run(fs.avalidate()))
+        self.assertEqual(fs.errors, {None: ('Invalid',)})
+
+    def test_sync(self):
+        async_session = RunSyncSession(session)
+        data = dict(self.data)
+        data['User-2-password'] = '5678_'
+        fs = DefaultFieldSet(User).bind(john, session=async_session, data=data)
+        self.assertTrue(run(fs.avalidate()))
+        run(fs.async_sync())
+        self.assertEqual(async_session.calls, 2)
+        self.assertTrue(fs.session is async_session)
+        self.assertEqual(john.name, 'John_')
+        self.assertEqual([o.id for o in john.orders], [2, 3])
+
+    def test_grid(self):
+        async_session = RunSyncSession(session)
+        g = DefaultGrid(User).bind([bill, john], session=async_session,
+                                   data=self.data)
+        self.assertFalse(run(g.avalidate()))
+        self.assertEqual(async_session.calls, 1)
+        self.assertEqual(g.get_errors(bill), {})
+        self.assertEqual(g.get_errors(john),
+                         {g.password: ['Please enter a value']})
+        expected = g.errors.copy()
+        g = DefaultGrid(User).bind([bill, john], data=self.data)
+        self.assertFalse(g.validate())
+        self.assertEqual(g.errors, expected)
+
+class TestAsyncRender(unittest.TestCase):
+
+    def setUp(self):
+        from formalchemy.benchmarks.models import Customer, populate
+        aio.setup()
+        self.tmpdir = tempfile.mkdtemp()
+        url = 'sqlite:///' + os.path.join(self.tmpdir, 'test.db')
+        self.session = populate(customers=3, groups=2, orders=2, url=url)
+        self.customer = self.session.query(Customer).get(1)
+        self.fs = FieldSet(Customer).bind(self.customer)
+        self.threads = set()
+        event.listen(self.session.get_bind(), 'before_cursor_execute',
+                     self.record_thread)
+
+    def tearDown(self):
+        self.session.close()
+        self.session.get_bind().dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def record_thread(self, *args):
+        self.threads.add(threading.current_thread())
+
+    def expected(self):
+        # rendering stores the options in the fields, so use other ones
+        return FieldSet(type(self.customer)).bind(self.customer).render()
+
+    def test_render(self):
+        expected = self.expected()
+        self.assertEqual(run(self.fs.arender()), expected)
+        self.assertEqual(self.threads, set([threading.current_thread()]))
+        self.assertEqual(self.fs.render_context, None)
+
+    def test_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        expected = self.expected()
+        self.threads.clear()
+        context = fields.RenderContext()
+        self.fs.rebind(render_context=context)
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(run(self.fs.arender(executor=executor)), expected)
+        self.assertFalse(threading.current_thread() in self.threads)
+        self.assertEqual((context.misses, context.hits), (2, 2))
+
+    def test_executor_uncommitted(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from formalchemy.benchmarks.models import Group
+        self.session.add(Group(id=3, name=u'group 3'))
+        self.session.flush()
+        self.threads.clear()
+        with ThreadPoolExecutor(2) as executor:
+            html = run(self.fs.arender(executor=executor))
+        # the new sessions of the executor would not see the new group
+        self.assertTrue('group 3' in html)
+        self.assertEqual(self.threads, set([threading.current_thread()]))
+
+    def test_async_session(self):
+        async_session = RunSyncSession(self.session)
+        fs = DefaultFieldSet(type(self.customer)).bind(self.customer,
+                                                       session=async_session)
+        html = run(fs.arender())
+        self.assertEqual(async_session.calls, 1)
+        self.assertTrue('group 1' in html)
+
+    def test_readonly(self):
+        context = fields.RenderContext()
+        self.fs.rebind(render_context=context)
+        self.fs.readonly = True
+        run(self.fs.arender())
+        self.assertEqual(context.misses, 0)
+
+    def test_options_cache(self):
+        from formalchemy import config
+        config.options_cache = cache = fields.OptionsCache()
+        try:
+            expected = run(self.fs.arender())
+            fs = FieldSet(type(self.customer)).bind(self.customer)
+            self.assertEqual(run(fs.arender()), expected)
+        finally:
+            config.options_cache = None
+        self.assertEqual((cache.misses, cache.hits), (2, 2))
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+import sys
+
+# the test cases use the async syntax, a SyntaxError for older versions
+if sys.version_info >= (3, 7):
+    from formalchemy.tests.aio_cases import TestAsyncValidation, TestAsyncRender
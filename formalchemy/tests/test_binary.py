@@ -6,6 +6,8 @@ else:
     import cgi
     from StringIO import StringIO
 import shutil
+import hashlib
+import mimetypes
 import tempfile
 from nose import with_setup
 
@@ -238,3 +240,49 @@ class BlobTestCase(unittest.TestCase):
     def tearDown(self):
         shutil.rmtree(self.wd)
 
+
+class StreamingRenderer(FileFieldRenderer):
+    streaming = True
+    chunk_size = 4
+    stored = {}
+
+    def store(self, upload):
+        self.stored[upload.hash] = b''.join(upload.chunks())
+        return upload.hash.encode('ascii')
+
+class UploadTestCase(unittest.TestCase):
+
+    def test_upload(self):
+        fs = FieldSet(Binaries)
+        fs.rebind(data=get_fields(TEST_DATA))
+        self.assertTrue(fs.validate())
+        fs.sync()
+        upload = fs.file.renderer.upload
+        self.assertEqual(upload.size, len(fs.model.file))
+        self.assertEqual(upload.content_type, mimetypes.guess_type('test.js')[0])
+        self.assertEqual(upload.hash,
+                         hashlib.sha256(b'var test = null;\n').hexdigest())
+
+    def test_streaming(self):
+        fs = FieldSet(Binaries)
+        fs.configure(options=[fs.file.with_renderer(StreamingRenderer)])
+        fs.rebind(data=get_fields(TEST_DATA))
+        self.assertTrue(fs.validate())
+        fs.sync()
+        upload = fs.file.renderer.upload
+        self.assertEqual(upload.filename, 'test.js')
+        self.assertEqual(fs.model.file, upload.hash.encode('ascii'))
+        self.assertEqual(StreamingRenderer.stored[upload.hash],
+                         b'var test = null;\n')
+        self.assertTrue(upload.file.closed)
+
+    def test_streaming_content(self):
+        class Renderer(FileFieldRenderer):
+            streaming = True
+        fs = FieldSet(Binaries)
+        fs.configure(options=[fs.file.with_renderer(Renderer)])
+        fs.rebind(data=get_fields(TEST_DATA))
+        self.assertTrue(fs.validate())
+        fs.sync()
+        self.assertEqual(fs.model.file, b'var test = null;\n')
+        self.assertTrue(fs.file.renderer.upload.file.closed)
@@ -219,3 +219,127 @@ def field_set():
 
     """
 
+
+def blueprint():
+    """
+    Mapped classes are introspected once, further FieldSets only copy the
+    cached fields:
+
+    >>> from formalchemy import forms
+    >>> fs1 = FieldSet(User)
+    >>> User in forms._blueprints
+    True
+    >>> introspect = forms._introspect
+    >>> def fail(cls, fieldset):
+    ...     raise AssertionError('%s introspected twice' % cls.__name__)
+    >>> forms._introspect = fail
+    >>> try:
+    ...     fs2 = FieldSet(User)
+    ... finally:
+    ...     forms._introspect = introspect
+    >>> list(fs2._fields.keys())
+    ['id', 'email', 'password', 'name', 'orders']
+
+    The copies are independent:
+
+    >>> fs1.email is fs2.email
+    False
+    >>> fs2.email.parent is fs2
+    True
+    >>> fs1.email.set(instructions='Your email')
+    AttributeField(email)
+    >>> fs2.email.metadata
+    {}
+
+    The cache is reset when mappers are (re)configured:
+
+    >>> from sqlalchemy.orm import configure_mappers
+    >>> from sqlalchemy.ext.declarative import declarative_base
+    >>> class Blueprint(declarative_base()):
+    ...     __tablename__ = 'blueprints'
+    ...     id = Column(Integer, primary_key=True)
+    >>> configure_mappers()
+    >>> User in forms._blueprints
+    False
+    """
+
+def copy_on_write():
+    """
+    >>> fs = FieldSet(User)
+    >>> fs.configure(options=[fs.name.with_metadata(instructions='Your name')])
+    >>> fs.copy_on_write = True
+
+    Bound fields share their configuration with the configured ones:
+
+    >>> fs2 = fs.bind(bill)
+    >>> fs2.name is fs.name
+    False
+    >>> fs2.name.parent is fs2
+    True
+    >>> fs2.name._metadata is fs.name._metadata
+    True
+    >>> fs2.email._validators is fs.email._validators
+    True
+
+    Until they are accessed, or modified:
+
+    >>> fs2.name.set(instructions='Your full name')
+    AttributeField(name)
+    >>> fs2.name.metadata
+    {'instructions': 'Your full name'}
+    >>> fs.name.metadata
+    {'instructions': 'Your name'}
+    >>> from formalchemy.validators import email
+    >>> fs2.email.validators.append(email)
+    >>> fs2.email.validators == fs.email.validators
+    False
+
+    Renderers and errors are specific to each bound FieldSet:
+
+    >>> fs.name.renderer.field is fs.name
+    True
+    >>> fs3 = fs.bind(bill, data={'User-1-email': '', 'User-1-password': 'x',
+    ...                           'User-1-name': 'Bill', 'User-1-orders': []})
+    >>> fs3.name.renderer.field is fs3.name
+    True
+    >>> fs3.validate()
+    False
+    >>> fs3.email.errors
+    ['Please enter a value']
+    >>> fs.email.errors, fs2.email.errors
+    ([], [])
+    """
+
+def empty_containers():
+    """
+    Fields use slots, and share their empty containers:
+
+    >>> fs = FieldSet(User)
+    >>> fs.name._html_options is fs.email._html_options
+    True
+
+    The attributes copy them on first access, so they can be modified in
+    place:
+
+    >>> fs.name.html_options['size'] = 10
+    >>> fs.name.html_options, fs.email.html_options
+    ({'size': 10}, {})
+    >>> fs.name.render_opts['size'] = 20
+    >>> fs.name.render_opts, fs.email.render_opts
+    ({'size': 20}, {})
+    >>> from formalchemy.validators import required
+    >>> Field('foo').validate(required).validators == [required]
+    True
+    >>> field = Field('foo')
+    >>> field.validators.append(required)
+    >>> field.is_required(), Field('foo').validators
+    (True, [])
+
+    Custom attributes are still allowed and copied:
+
+    >>> fs.name.foo = 'bar'
+    >>> fs.bind(bill).name.foo
+    'bar'
+    >>> fs.email.__dict__
+    {}
+    """
@@ -1,8 +1,10 @@
 import os
 import cgi
 import shutil
+import time
+import hashlib
 import tempfile
-from io import StringIO
+from io import StringIO, BytesIO
 from nose import with_setup
 
 from formalchemy.tests import *
@@ -10,6 +12,8 @@ from formalchemy.tests.test_binary import *
 from formalchemy.ext.fsblob import FileFieldRenderer as BaseFile
 from formalchemy.ext.fsblob import ImageFieldRenderer as BaseImage
 from formalchemy.ext.fsblob import file_extension
+from formalchemy.ext.fsblob import ContentAddressedStorage, BlobApp
+from formalchemy.ext.fsblob import collect_garbage
 
 TEMPDIR = tempfile.mkdtemp()
 
@@ -92,3 +96,182 @@ def test_file_validation():
     fs.rebind(data=data)
     assert fs.validate() is False
 
+class ContentAddressedBlobTestCase(BlobTestCase):
+
+    def setUp(self):
+        BlobTestCase.setUp(self)
+        self.storage = ContentAddressedStorage(self.wd)
+        self.fs.foo.set(renderer=self.renderer.new(storage=self.storage,
+                                                   url_prefix='/media'))
+        self.app = TestApp(application(self.binary, self.fs))
+
+class ContentAddressedStorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(self.wd)
+
+    def test_save(self):
+        digest = hashlib.sha256(b'logo').hexdigest()
+        path = self.storage.save(BytesIO(b'logo'), 'logo.png')
+        self.assertEqual(path, '%s/%s/%s/logo.png' % (digest[:2], digest[2:4],
+                                                      digest))
+        with self.storage.open(path) as fd:
+            self.assertEqual(fd.read(), b'logo')
+        self.assertEqual(self.storage.index[path]['size'], 4)
+        self.assertEqual(os.listdir(os.path.join(self.wd, '.tmp')), [])
+
+    def test_dedupe(self):
+        path1 = self.storage.save(BytesIO(b'logo'), 'logo.png')
+        path2 = self.storage.save(BytesIO(b'logo'), 'logo.png')
+        path3 = self.storage.save(BytesIO(b'logo'), 'other.png')
+        self.assertEqual(path1, path2)
+        self.assertEqual(os.path.dirname(path1), os.path.dirname(path3))
+        stat1 = os.stat(self.storage.filepath(path1))
+        stat3 = os.stat(self.storage.filepath(path3))
+        self.assertEqual(stat1.st_ino, stat3.st_ino)
+
+    def test_metadata(self):
+        path = self.storage.save(BytesIO(b'logo'), 'logo.png')
+        storage = ContentAddressedStorage(self.wd)
+        self.assertTrue(storage.index is self.storage.index)
+        self.assertEqual(storage.size(path), 4)
+        self.assertTrue(path in storage.index)
+        self.assertEqual(storage.size('aa/bb/missing'), 0)
+        self.assertFalse(storage.exists('aa/bb/missing'))
+
+    def test_index_size(self):
+        self.storage.index.maxsize = 2
+        paths = [self.storage.save(BytesIO(data), 'file.txt')
+                 for data in (b'one', b'two')]
+        self.storage.size(paths[0])
+        path = self.storage.save(BytesIO(b'three'), 'file.txt')
+        self.assertEqual(len(self.storage.index), 2)
+        self.assertFalse(paths[1] in self.storage.index)
+        self.assertTrue(paths[0] in self.storage.index)
+        self.assertEqual(self.storage.size(paths[1]), 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+
+class BlobAppTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(self.wd)
+        self.path = self.storage.save(BytesIO(b'0123456789'), 'digits.txt')
+        self.app = TestApp(BlobApp(self.storage))
+
+    def test_get(self):
+        resp = self.app.get('/' + self.path)
+        self.assertEqual(resp.body, b'0123456789')
+        self.assertEqual(resp.content_type, 'text/plain')
+        self.assertEqual(resp.headers['ETag'], '"%s"' % self.path.split('/')[2])
+        self.assertTrue('immutable' in resp.headers['Cache-Control'])
+        self.assertTrue(resp.headers['Last-Modified'])
+        resp = self.app.head('/' + self.path)
+        self.assertEqual(resp.headers['Content-Length'], '10')
+        self.assertEqual(resp.headers['X-Content-Type-Options'], 'nosniff')
+        self.assertFalse('Content-Disposition' in resp.headers)
+
+    def test_attachment(self):
+        html = b'<html><script>alert(1)</script></html>'
+        resp = self.app.get('/' + self.storage.save(BytesIO(html), 'page.html'))
+        self.assertEqual(resp.headers['Content-Disposition'],
+                         'attachment; filename="page.html"')
+        resp = self.app.get('/' + self.storage.save(BytesIO(html), 'a;b.svg'))
+        self.assertEqual(resp.headers['Content-Disposition'], 'attachment')
+
+    def test_not_modified(self):
+        etag = self.app.get('/' + self.path).headers['ETag']
+        self.app.get('/' + self.path, headers={'If-None-Match': etag},
+                     status=304)
+        last_modified = self.app.get('/' + self.path).headers['Last-Modified']
+        self.app.get('/' + self.path, status=304,
+                     headers={'If-Modified-Since': last_modified})
+
+    def test_range(self):
+        resp = self.app.get('/' + self.path, headers={'Range': 'bytes=2-4'},
+                            status=206)
+        self.assertEqual(resp.body, b'234')
+        self.assertEqual(resp.headers['Content-Range'], 'bytes 2-4/10')
+        resp = self.app.get('/' + self.path, headers={'Range': 'bytes=-3'},
+                            status=206)
+        self.assertEqual(resp.body, b'789')
+        resp = self.app.get('/' + self.path, headers={'Range': 'bytes=20-'},
+                            status=416)
+        self.assertEqual(resp.headers['Content-Range'], 'bytes */10')
+        resp = self.app.get('/' + self.path, status=200,
+                            headers={'Range': 'bytes=2-4', 'If-Range': '"x"'})
+        self.assertEqual(resp.body, b'0123456789')
+
+    def test_not_found(self):
+        self.app.get('/missing.txt', status=404)
+        self.app.get('/.tmp', status=404)
+        self.app.get('/' + os.path.dirname(self.path), status=404)
+        self.app.get('/../' + self.path, status=404)
+        self.app.post('/' + self.path, status=405)
+
+    def test_directory(self):
+        app = TestApp(BlobApp(self.wd))
+        resp = app.get('/' + self.path)
+        self.assertEqual(resp.headers['Cache-Control'], 'public, max-age=3600')
+
+    def tearDown(self):
+        shutil.rmtree(self.wd)
+
+class GarbageCollectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.wd = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(self.wd)
+        self.storage.track(Three.foo)
+        self.paths = [self.storage.save(BytesIO(data), 'file.txt')
+                      for data in (b'used', b'orphan', b'recent')]
+        old = time.time() - 7200
+        for path in self.paths[:2]:
+            os.utime(self.storage.filepath(path), (old, old))
+        session.add(Three(foo=self.paths[0]))
+        session.flush()
+
+    def test_collect(self):
+        stats = collect_garbage(self.storage, session, grace=3600)
+        self.assertEqual((stats['scanned'], stats['removed'], stats['recent']),
+                         (3, 1, 1))
+        self.assertEqual(stats['removed_bytes'], 6)
+        self.assertTrue(os.path.exists(self.storage.filepath(self.paths[0])))
+        self.assertFalse(os.path.exists(os.path.dirname(os.path.dirname(
+                         self.storage.filepath(self.paths[1])))))
+        self.assertTrue(os.path.exists(self.storage.filepath(self.paths[2])))
+        self.assertFalse(self.paths[1] in self.storage.index)
+
+    def test_removed_elsewhere(self):
+        # another process removed the file
+        os.remove(self.storage.filepath(self.paths[2]))
+        collect_garbage(self.storage, session, grace=3600, dry_run=True)
+        self.assertTrue(self.paths[2] in self.storage.index)
+        collect_garbage(self.storage, session, grace=3600)
+        self.assertFalse(self.paths[2] in self.storage.index)
+        self.assertTrue(self.paths[0] in self.storage.index)
+
+    def test_dry_run(self):
+        stats = collect_garbage(self.storage, session, grace=3600,
+                                dry_run=True)
+        self.assertEqual(stats['removed'], 1)
+        self.assertTrue(os.path.exists(self.storage.filepath(self.paths[1])))
+
+    def test_uploaded_again(self):
+        # the orphan content is uploaded again, under the same name and
+        # under another name, before the collection
+        self.assertEqual(self.storage.save(BytesIO(b'orphan'), 'file.txt'),
+                         self.paths[1])
+        other = self.storage.save(BytesIO(b'orphan'), 'other.txt')
+        stats = collect_garbage(self.storage, session, grace=3600)
+        self.assertEqual((stats['scanned'], stats['removed'], stats['recent']),
+                         (4, 0, 3))
+        self.assertTrue(os.path.exists(self.storage.filepath(self.paths[1])))
+        self.assertTrue(os.path.exists(self.storage.filepath(other)))
+
+    def tearDown(self):
+        session.rollback()
+        shutil.rmtree(self.wd)
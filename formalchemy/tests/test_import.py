@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import sys
+import unittest
+import subprocess
+
+from formalchemy import templates
+
+def run(code):
+    """return the output of `code` run by a new interpreter"""
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return output.decode('utf-8')
+
+class TestImport(unittest.TestCase):
+
+    def setUp(self):
+        self.modules = run('import sys, formalchemy; '
+                           'print("\\n".join(sorted(sys.modules)))').split()
+
+    def test_optional_engines(self):
+        self.assertTrue('formalchemy' in self.modules)
+        imported = [name for name in self.modules
+                    if name.split('.')[0] in ('mako', 'genshi')]
+        self.assertEqual(imported, [])
+
+    def test_optional_modules(self):
+        # imported on first use only
+        imported = [name for name in self.modules
+                    if name.startswith(('formalchemy.aio', 'formalchemy.ext',
+                                        'formalchemy.benchmarks'))]
+        self.assertEqual(imported, [])
+
+    def test_no_template_loaded(self):
+        output = run('from formalchemy import templates; '
+                     'print(sum([len(e.templates) for e in '
+                     'templates.engines.values()]))')
+        self.assertEqual(output.strip(), '0')
+
+class TestLazyEngines(unittest.TestCase):
+
+    def test_templates_loaded_on_first_use(self):
+        engine = templates.TempitaEngine(lazy=True)
+        self.assertEqual(engine.templates, {})
+        template = engine.get('fieldset')
+        self.assertTrue(template is not None)
+        self.assertTrue(engine.get('fieldset') is template)
+        self.assertEqual(list(engine.templates.keys()), ['fieldset'])
+        engine.preload()
+        self.assertEqual(sorted(engine.templates.keys()),
+                         sorted(engine._templates))
+
+    def test_preloaded(self):
+        engine = templates.TempitaEngine()
+        self.assertEqual(sorted(engine.templates.keys()),
+                         sorted(engine._templates))
+        self.assertTrue(engine.get('grid') is engine.templates['grid'])
@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
+import os
+import sys
+import datetime
 import unittest
 from formalchemy.tests import *
 from formalchemy.fields import AbstractField, FieldRenderer
 from formalchemy.fields import _htmlify, deserialize_once
+from formalchemy import fields
+from formalchemy.validators import ValidationError
 
 class TestAbstractField(unittest.TestCase):
 
@@ -45,3 +50,514 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(h.deserialize(), 'foo')
         h.value = 'bar'
         self.assertEqual(h.deserialize(), 'foo')
+
+class TestRendererDispatch(unittest.TestCase):
+
+    def test_most_specific_type(self):
+        class MyDate(types.HTML5Date):
+            pass
+        fs = FieldSet(User)
+        fs.append(Field('date', type=MyDate))
+        self.assertTrue(isinstance(fs.date.renderer,
+                                   fields.HTML5DateFieldRenderer))
+
+    def test_renderers_changes(self):
+        class MyString(types.String):
+            pass
+        class MyRenderer(fields.TextFieldRenderer):
+            pass
+        fs = FieldSet(User)
+        fs.append(Field('foo', type=MyString))
+        self.assertEqual(fs.foo._get_renderer(), fields.TextFieldRenderer)
+        fs.default_renderers = dict(fs.default_renderers)
+        fs.default_renderers[types.String] = MyRenderer
+        self.assertEqual(fs.foo._get_renderer(), MyRenderer)
+        fs.default_renderers[MyString] = fields.TextAreaFieldRenderer
+        self.assertEqual(fs.foo._get_renderer(), fields.TextAreaFieldRenderer)
+
+    def test_instance_is_kept(self):
+        fs = FieldSet(User)
+        renderer = fs.name.renderer
+        self.assertTrue(fs.name.renderer is renderer)
+        field = fs.name.textarea()
+        self.assertTrue(field.renderer is field.renderer)
+        self.assertTrue(isinstance(field.renderer,
+                                   fields.TextAreaFieldRenderer))
+
+    def test_classes_released(self):
+        import gc
+        import weakref
+        cls = type('DynamicFieldSet', (FieldSet,), dict(
+                   default_renderers=dict(FieldSet.default_renderers)))
+        fs = cls(User)
+        fs.name.renderer
+        ref = weakref.ref(cls)
+        del cls, fs
+        gc.collect()
+        self.assertEqual(ref(), None)
+
+class TestCompiledTemplate(unittest.TestCase):
+
+    def compare(self, content, **kw):
+        from formalchemy.templates import TempitaTemplate, CompiledTemplate
+        template = TempitaTemplate(content)
+        compiled = CompiledTemplate(template)
+        self.assertEqual(compiled.substitute(**dict(kw)),
+                         template.substitute(**dict(kw)))
+        return compiled
+
+    def test_syntax(self):
+        compiled = self.compare(
+            u'{{py:total = 0}}{{for i, v in enumerate(values)}}'
+            u'{{if i == 1}}{{continue}}{{elif v is None}}{{break}}'
+            u'{{else}}{{v|repr}}{{endif}}{{py:total += i}}{{endfor}}'
+            u'{{total}} {{name}} {{none}} {{start_braces}}{{# comment}}',
+            values=[1, 2, u'é', None, 3], name='<b>', none=None)
+        self.assertTrue(compiled._code is not None)
+
+    def test_namespace(self):
+        # names assigned by the template can also come from the caller
+        self.compare(u'{{if flag}}{{py:flag = False}}{{endif}}{{flag}}',
+                     flag=True)
+
+    def test_fallback(self):
+        compiled = self.compare(
+            u'{{default name = "you"}}hello {{name}}')
+        self.assertTrue(compiled._code is None)
+
+    def test_errors(self):
+        from formalchemy.templates import TempitaTemplate, CompiledTemplate
+        compiled = CompiledTemplate(TempitaTemplate(u'\n{{1/0}}'))
+        try:
+            compiled.substitute()
+        except ZeroDivisionError as e:
+            self.assertTrue('at line 2 column 3' in str(e), str(e))
+        else:
+            self.fail()
+
+    def test_engine(self):
+        from formalchemy.templates import TempitaEngine, CompiledEngine
+        fs = FieldSet(User).bind(bill)
+        self.assertEqual(CompiledEngine()('fieldset', fieldset=fs),
+                         TempitaEngine()('fieldset', fieldset=fs))
+
+def write_mo(filename, messages):
+    """write a GNU catalog"""
+    import struct
+    keys = sorted(messages.keys())
+    ids = b''.join([k.encode('utf-8') + b'\0' for k in keys])
+    strs = b''.join([messages[k].encode('utf-8') + b'\0' for k in keys])
+    start = 7 * 4 + 16 * len(keys)
+    offsets, offset = [], start
+    for k in keys:
+        offsets.extend([len(k.encode('utf-8')), offset])
+        offset += len(k.encode('utf-8')) + 1
+    for k in keys:
+        offsets.extend([len(messages[k].encode('utf-8')), offset])
+        offset += len(messages[k].encode('utf-8')) + 1
+    header = struct.pack('Iiiiiii', 0x950412de, 0, len(keys), 7 * 4,
+                         7 * 4 + 8 * len(keys), 0, 0)
+    with open(filename, 'wb') as fd:
+        fd.write(header + struct.pack('%ii' % len(offsets), *offsets) +
+                 ids + strs)
+
+class TestCatalogCache(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        from formalchemy.i18n import CatalogCache
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'fr', 'LC_MESSAGES',
+                                     'formalchemy.mo')
+        os.makedirs(os.path.dirname(self.filename))
+        write_mo(self.filename, {'Remove': 'Supprimer'})
+        self.catalogs = CatalogCache(self.path)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.path)
+
+    def test_cache(self):
+        catalogs = self.catalogs
+        self.assertEqual(catalogs.get('fr')('Remove'), 'Supprimer')
+        self.assertTrue(catalogs.get('fr') is not None)
+        self.assertTrue(catalogs.get('xx') is None)
+        self.assertTrue(catalogs.get('xx') is None)
+        self.assertEqual(catalogs.stats(),
+                         dict(hits=2, misses=2, catalogs=2))
+        catalogs.clear()
+        self.assertEqual(catalogs.stats(),
+                         dict(hits=0, misses=0, catalogs=0))
+
+    def test_auto_reload(self):
+        catalogs = self.catalogs
+        catalogs.auto_reload = True
+        self.assertEqual(catalogs.get('fr')('Remove'), 'Supprimer')
+        write_mo(self.filename, {'Remove': 'Enlever'})
+        mtime = os.path.getmtime(self.filename) + 10
+        os.utime(self.filename, (mtime, mtime))
+        self.assertEqual(catalogs.get('fr')('Remove'), 'Enlever')
+        self.assertEqual(catalogs.get('fr')('Remove'), 'Enlever')
+        self.assertEqual((catalogs.hits, catalogs.misses), (1, 2))
+
+    def test_missing(self):
+        catalogs = self.catalogs
+        catalogs.max_missing = 2
+        for lang in ('xx', 'yy', 'zz', 'zz'):
+            self.assertTrue(catalogs.get(lang) is None)
+        self.assertEqual(catalogs.stats(),
+                         dict(hits=0, misses=4, catalogs=2))
+        self.assertEqual(catalogs.get('fr')('Remove'), 'Supprimer')
+        for lang in ('../fr', 'fr;q=0.8', '', None):
+            self.assertTrue(catalogs.get(lang) is None)
+        self.assertEqual(catalogs.stats()['catalogs'], 3)
+
+@unittest.skipIf(sys.version_info < (3, 4), 'tracemalloc is required')
+class TestBenchmarkSuite(unittest.TestCase):
+
+    def test_run(self):
+        from formalchemy.benchmarks import suite
+        from six import StringIO
+        results = suite.run(rows=(2,), min_time=0)
+        self.assertTrue('fieldset.sync' in results)
+        self.assertEqual(results['grid.2.validate']['queries'], 0)
+        baseline = suite.load(suite.BASELINE)
+        fieldsets = lambda names: sorted(n for n in names
+                                         if n.startswith('fieldset.'))
+        self.assertEqual(fieldsets(results), fieldsets(baseline))
+        out = StringIO()
+        suite.report(results, baseline, out)
+        self.assertTrue('fieldset.render ' in out.getvalue())
+
+class TestIndexedMultiDict(unittest.TestCase):
+
+    def test_renderer_params(self):
+        from formalchemy.multidict import IndexedMultiDict
+        fs = DefaultFieldSet(User).bind(bill, data={'User-1-name': 'Bill_'})
+        params = fs.name.renderer.params
+        self.assertTrue(isinstance(params, IndexedMultiDict))
+        self.assertTrue(params.data is fs.data)
+        self.assertTrue(fs.email.renderer.params is params)
+        self.assertEqual(fs.name.renderer.value, 'Bill_')
+        fs.data.add('User-1-email', 'bill_@example.com')
+        self.assertEqual(params.getone('User-1-email'), 'bill_@example.com')
+
+    def test_data_replaced(self):
+        fs = DefaultFieldSet(User).bind(bill, data={'User-1-name': 'Bill_'})
+        self.assertEqual(fs.name.renderer.value, 'Bill_')
+        fs.data['User-1-name'] = 'Changed'
+        self.assertEqual(fs.name.renderer.params.getone('User-1-name'),
+                         'Changed')
+        self.assertEqual(fs.name.renderer.value, 'Changed')
+
+    def test_grid_rows_share_params(self):
+        data = {'User-1-name': 'Bill_', 'User-2-name': 'John_'}
+        g = DefaultGrid(User).bind([bill, john], data=data)
+        params = set()
+        for row in g:
+            params.add(id(g.name.renderer.params))
+        self.assertEqual(len(params), 1)
+        self.assertEqual(sorted(g.name.renderer.params.index['User']),
+                         ['1', '2'])
+
+    def test_prefix(self):
+        from formalchemy.forms import SimpleMultiDict
+        from formalchemy.multidict import IndexedMultiDict
+        data = SimpleMultiDict({'p-User-1-name': 'Bill', 'User-1-name': 'x'})
+        params = IndexedMultiDict(data, prefix='p')
+        self.assertEqual(params.index, {'User': {'1': {'name': ['Bill']}}})
+
+class TestDecodeOnce(unittest.TestCase):
+
+    def multi(self, **kwargs):
+        import cgi
+        from formalchemy.multidict import MultiDict, UnicodeMultiDict
+        upload = cgi.FieldStorage()
+        upload.filename = b'caf\xc3\xa9.txt'
+        multi = MultiDict([('name', b'caf\xc3\xa9'), ('file', upload),
+                           ('tags', b'a'), ('tags', b'b')])
+        return UnicodeMultiDict(multi, encoding='utf-8', **kwargs)
+
+    def test_decode_once(self):
+        data = self.multi(decode_once=True)
+        upload = data.getone('file')
+        self.assertEqual(upload.filename, u'café.txt')
+        self.assertTrue(data['file'] is upload)
+        self.assertEqual(data.getall('tags'), [u'a', u'b'])
+        self.assertEqual(data.getall('tags'), [u'a', u'b'])
+        self.assertEqual(data.stats(), dict(decoded=3, hits=2, cached=2))
+        self.assertEqual(data.items()[0], ('name', u'café'))
+        self.assertEqual(data.decoded, 4)
+
+    def test_modified(self):
+        data = self.multi(decode_once=True)
+        self.assertEqual(data.getall('tags'), [u'a', u'b'])
+        data.add('tags', b'c')
+        self.assertEqual(data.getall('tags'), [u'a', u'b', u'c'])
+        del data['name']
+        self.assertEqual(data.mixed()['tags'], [u'a', u'b', u'c'])
+        self.assertFalse('name' in data.dict_of_lists())
+
+    def test_default(self):
+        data = self.multi()
+        self.assertFalse(data.getone('file') is data.getone('file'))
+        self.assertEqual(data.decoded, 2)
+        self.assertRaises(TypeError, data.decode_all)
+
+class TestGetInstances(unittest.TestCase):
+
+    def count_queries(self, func):
+        from sqlalchemy import event
+        statements = []
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            result = func()
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        return result, statements
+
+    def test_identity_map(self):
+        query = session.query(Order)
+        orders, statements = self.count_queries(
+                    lambda: fields._get_instances(query, ['3', '1', '42']))
+        self.assertEqual(orders, [order3, order1, None])
+        self.assertEqual(len(statements), 1) # IN query for 42 only
+
+    def test_absent(self):
+        query = session.query(Order)
+        orders, statements = self.count_queries(
+                    lambda: fields._get_instances(query, ['41', '42', '43']))
+        self.assertEqual(orders, [None, None, None])
+        self.assertEqual(len(statements), 1)
+
+    def test_not_coerced(self):
+        query = session.query(Order)
+        orders, statements = self.count_queries(
+                    lambda: fields._get_instances(query, ['x', '1']))
+        self.assertEqual(orders, [None, order1])
+        self.assertEqual(len(statements), 1) # get('x')
+
+    def test_one_query(self):
+        session.expire(order2)
+        session.expire(order3)
+        query = session.query(Order)
+        orders, statements = self.count_queries(
+                    lambda: fields._get_instances(query, ['2', '3', '2']))
+        self.assertEqual(orders, [order2, order3, order2])
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(' IN ' in statements[0], statements[0])
+
+    def test_composite(self):
+        query = session.query(PrimaryKeys)
+        session.expire(primary1)
+        session.expire(primary2)
+        keys, statements = self.count_queries(
+                    lambda: fields._get_instances(query, [(1, '33'), (1, '22')]))
+        self.assertEqual(keys, [primary2, primary1])
+        self.assertEqual(len(statements), 1)
+
+    def test_validate_and_sync(self):
+        fs = DefaultFieldSet(User).bind(john, data={
+                        'User-2-email': 'john@example.com',
+                        'User-2-password': '5678', 'User-2-name': 'John',
+                        'User-2-orders': ['2', '3']})
+        session.expire(order2)
+        session.expire(order3)
+        def validate_and_sync():
+            self.assertTrue(fs.validate())
+            fs.sync()
+        result, statements = self.count_queries(validate_and_sync)
+        # john.orders is loaded once by sync() to replace it
+        self.assertEqual(len([s for s in statements if ' IN ' in s]), 1)
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(john.orders, [order2, order3])
+        session.rollback()
+
+    def test_rebind(self):
+        order = Order(user=john, quantity=7)
+        session.add(order)
+        session.flush()
+        data = {'User-2-email': 'john@example.com', 'User-2-password': '5678',
+                'User-2-name': 'John', 'User-2-orders': str(order.id)}
+        fs = DefaultFieldSet(User).bind(john, data=data)
+        self.assertTrue(fs.validate())
+        self.assertEqual(fs.orders._deserialize(), [order])
+        session.delete(order)
+        session.flush()
+        # the instances loaded before are not reused
+        fs.rebind(john, data=data)
+        self.assertEqual(fs.orders._deserialize(), [None])
+        session.rollback()
+
+class TestDeserializationCache(unittest.TestCase):
+
+    data = {'User-1-email': 'bill_@example.com', 'User-1-password': '1234_',
+            'User-1-name': 'Bill_', 'User-1-orders': '1',
+            'User-2-email': 'john_@example.com', 'User-2-password': '5678_',
+            'User-2-name': 'John_', 'User-2-orders': ['2', '3']}
+
+    def test_once_per_field(self):
+        fs = DefaultFieldSet(User).bind(bill, data=self.data)
+        self.assertTrue(fs.validate())
+        self.assertEqual(fs.name.value, 'Bill_')
+        cache = fs.deserialization_cache
+        self.assertEqual((cache.misses, cache.hits), (4, 1))
+        fs.rebind(bill, data=self.data)
+        self.assertTrue(fs.deserialization_cache is None)
+        session.rollback()
+
+    def test_grid(self):
+        g = DefaultGrid(User).bind([bill, john], data=self.data)
+        self.assertTrue(g.validate())
+        g.sync()
+        cache = g.deserialization_cache
+        self.assertEqual((cache.misses, cache.hits), (8, 8))
+        self.assertEqual(john.name, 'John_')
+        session.rollback()
+
+    def test_data_modified(self):
+        fs = DefaultFieldSet(User).bind(bill, data=dict(self.data))
+        self.assertEqual(fs.name.value, 'Bill_')
+        del fs.data['User-1-name']
+        fs.data.add('User-1-name', 'Bill')
+        self.assertEqual(fs.name.value, 'Bill')
+
+    def test_opt_out(self):
+        class Renderer(FieldRenderer):
+            cache_deserialization = False
+        fs = DefaultFieldSet(User).bind(bill, data=self.data)
+        fs.configure(include=[fs.name.with_renderer(Renderer)])
+        self.assertEqual(fs.name.value, 'Bill_')
+        self.assertEqual(fs.name.value, 'Bill_')
+        self.assertEqual(fs.deserialization_cache, None)
+
+class TestDeserializers(unittest.TestCase):
+
+    def deserialize(self, type_, data):
+        renderer = DefaultFieldSet(Three).foo.renderer
+        return fields._deserializer_for(type_)(data, renderer)
+
+    def test_dispatch_once(self):
+        self.assertTrue(fields._deserializer_for(types.Integer()) is
+                        fields._deserializer_for(types.Integer()))
+        self.assertTrue(fields._deserializer_for(types.Numeric(asdecimal=False))
+                        is fields._deserialize_float)
+
+    def test_values(self):
+        from decimal import Decimal
+        self.assertEqual(self.deserialize(types.Boolean(), 'Yes'), True)
+        self.assertEqual(self.deserialize(types.Integer(), '42'), 42)
+        self.assertEqual(self.deserialize(types.Numeric(), '4.2'), Decimal('4.2'))
+        self.assertEqual(self.deserialize(types.Interval(), '1'),
+                         datetime.timedelta(1))
+        self.assertEqual(self.deserialize(types.Unicode(), ''), None)
+
+    def test_dates(self):
+        date = datetime.date(2008, 1, 5)
+        for data in ('2008-01-05', '2008-1-5', '2008-01- 5'):
+            self.assertEqual(self.deserialize(types.Date(), data), date)
+        self.assertEqual(self.deserialize(types.Date(), 'YYYY-MM-DD'), None)
+        self.assertRaises(ValidationError, self.deserialize, types.Date(),
+                          '2008-13-05')
+        self.assertRaises(ValidationError, self.deserialize, types.Date(),
+                          '20080105')
+        self.assertEqual(self.deserialize(types.Time(), '07:05:00'),
+                         datetime.time(7, 5))
+        self.assertRaises(ValidationError, self.deserialize, types.Time(),
+                          '07:05:00.5')
+        value = datetime.datetime(2008, 1, 5, 7, 5)
+        for data in ('2008-01-05 07:05:00', '2008-01-05T07:05:00Z',
+                     '2008-1-5 7:5:0'):
+            self.assertEqual(self.deserialize(types.DateTime(), data), value)
+        self.assertRaises(ValidationError, self.deserialize, types.DateTime(),
+                          '2008-01-05 YY:MM:SS')
+
+@unittest.skipIf(sys.version_info < (3, 2), 'concurrent.futures is required')
+class TestConcurrentValidation(unittest.TestCase):
+
+    data = {'User-1-email': 'bill_@example.com', 'User-1-password': '1234_',
+            'User-1-name': 'Bill_',
+            'User-2-email': 'john_@example.com', 'User-2-password': '',
+            'User-2-name': 'John_'}
+
+    def grid(self):
+        def not_john(value, field):
+            if value == 'John_':
+                raise ValidationError('John is taken')
+        g = DefaultGrid(User)
+        g.configure(exclude=[g.orders], options=[g.name.validate(not_john)])
+        return g.bind([bill, john], data=self.data)
+
+    def test_validate(self):
+        from concurrent.futures import ThreadPoolExecutor
+        g = self.grid()
+        self.assertFalse(g.validate())
+        expected = g.errors.copy()
+        g = self.grid()
+        with ThreadPoolExecutor(2) as executor:
+            self.assertFalse(g.validate(executor=executor))
+        self.assertEqual(g.errors, expected)
+        self.assertEqual(g.get_errors(john),
+                         {g.password: ['Please enter a value'],
+                          g.name: ['John is taken']})
+        self.assertEqual(g.get_errors(bill), {})
+        self.assertEqual(g.deserialization_cache.misses, 6)
+
+    def test_sync(self):
+        from concurrent.futures import ThreadPoolExecutor
+        g = DefaultGrid(User).bind([bill], data=self.data)
+        g.configure(include=[g.email, g.name])
+        with ThreadPoolExecutor(2) as executor:
+            self.assertTrue(g.validate(executor=executor))
+        g.sync()
+        self.assertEqual(bill.name, 'Bill_')
+        self.assertEqual(g.deserialization_cache.hits, 2)
+        session.rollback()
+
+    def test_relations_in_calling_thread(self):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from sqlalchemy import event
+        threads = set()
+        def listener(*args):
+            threads.add(threading.current_thread())
+        data = dict(self.data, **{'User-1-orders': '1', 'User-2-orders': ['2', '3']})
+        g = DefaultGrid(User).bind([bill, john], data=data)
+        for order in (order1, order2, order3):
+            session.expire(order)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            with ThreadPoolExecutor(2) as executor:
+                self.assertFalse(g.validate(executor=executor))
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        self.assertEqual(threads, set([threading.current_thread()]))
+        self.assertEqual(g.get_errors(john), {g.password: ['Please enter a value']})
+        g.sync()
+        self.assertEqual(john.orders, [order2, order3])
+        session.rollback()
+
+    def test_unloaded_in_calling_thread(self):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from sqlalchemy import event
+        threads = set()
+        def listener(*args):
+            threads.add(threading.current_thread())
+        rows = [Binaries(file=b'1'), Binaries(file=b'2')]
+        session.add_all(rows)
+        session.flush()
+        data = dict([('Binaries-%i-file' % row.id, '') for row in rows])
+        g = DefaultGrid(Binaries).bind(rows, data=data)
+        # the file renderer reads the model, the attribute is loaded again
+        session.expire(rows[0], ['file'])
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            with ThreadPoolExecutor(2) as executor:
+                self.assertTrue(g.validate(executor=executor))
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+            session.rollback()
+        self.assertEqual(threads, set([threading.current_thread()]))
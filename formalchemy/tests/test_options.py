@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
+import unittest
 from formalchemy.tests import *
+from formalchemy.fields import OptionsCache
 
 def test_dropdown():
     """
@@ -69,3 +71,140 @@ def test_manual_options():
      </label>
     </div>
     """
+
+class TestLabelColumns(unittest.TestCase):
+
+    def setUp(self):
+        self.order = session.query(LabeledOrder).get(1)
+
+    def tearDown(self):
+        session.rollback()
+
+    def test_options(self):
+        from sqlalchemy import event
+        statements = []
+        def listener(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            fs = DefaultFieldSet(LabeledOrder).bind(self.order)
+            options = fs.user._relation_options()
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        self.assertEqual(options, [('Bill bill@example.com', 1),
+                                   ('John john@example.com', 2)])
+        self.assertEqual(len(statements), 1)
+        self.assertFalse('password' in statements[0])
+        self.assertEqual([o for o in session if isinstance(o, LabeledUser)], [])
+
+    def test_composite_pk(self):
+        fs = DefaultFieldSet(LabeledOrderUserTag).bind(LabeledOrderUserTag,
+                                                      session=session)
+        self.assertEqual(fs.order_user._relation_options(),
+                         [('1', (1, 1)), ('2', (1, 2))])
+
+class TestOptionsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.order = session.query(LabeledOrder).get(1)
+        self.cache = config.options_cache = OptionsCache()
+
+    def tearDown(self):
+        config.options_cache = None
+        session.rollback()
+        session.query(LabeledUser).filter(LabeledUser.id > 2).delete(
+                                            synchronize_session=False)
+        session.commit()
+
+    def options(self):
+        fs = DefaultFieldSet(LabeledOrder).bind(self.order)
+        return fs.user._relation_options()
+
+    def test_lru(self):
+        now = [0]
+        cache = OptionsCache(maxsize=2, ttl=10, clock=lambda: now[0])
+        for key in ('a', 'b', 'c'):
+            cache.store((LabeledUser, key), [key])
+        self.assertEqual(cache.lookup((LabeledUser, 'a')), None)
+        self.assertEqual(cache.lookup((LabeledUser, 'b')), ['b'])
+        now[0] = 10
+        self.assertEqual(cache.lookup((LabeledUser, 'c')), None)
+        self.assertEqual(cache.stats(), dict(size=1, hits=1, misses=2,
+                         evictions=1, expired=1, invalidations=0))
+
+    def test_cached(self):
+        options = self.options()
+        self.assertTrue(self.options() is options)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.cache.classes = (LabeledOrder,)
+        self.assertFalse(self.options() is options)
+
+    def test_invalidation(self):
+        self.options()
+        session.add(LabeledUser(id=3, email=u'new@example.com',
+                                password=u'0000', name=u'New'))
+        session.flush()
+        self.assertEqual(self.cache.invalidations, 1)
+        # the session sees its row, the cache does not keep it
+        self.assertEqual(self.options()[-1][1], 3)
+        self.assertEqual(self.cache.stats()['size'], 0)
+        session.commit()
+        self.assertEqual(self.options()[-1][1], 3)
+        self.assertEqual(self.cache.stats()['size'], 1)
+        session.query(LabeledUser).filter_by(id=3).delete(
+                                            synchronize_session=False)
+        self.assertEqual(self.cache.invalidations, 2)
+        self.assertEqual(self.options()[-1][1], 2)
+
+class TestAutocomplete(unittest.TestCase):
+
+    def setUp(self):
+        self.order = session.query(LabeledOrder).get(1)
+
+    def tearDown(self):
+        session.rollback()
+
+    def fieldset(self, data=None):
+        fs = DefaultFieldSet(LabeledOrder)
+        fs.configure(include=[fs.user.autocomplete(lookup_url='/lookup')])
+        return fs.bind(self.order, data=data)
+
+    def test_render(self):
+        html = self.fieldset().user.render()
+        self.assertTrue('value="Bill bill@example.com"' in html, html)
+        self.assertTrue('data-lookup-url="/lookup"' in html, html)
+        self.assertFalse('John' in html)
+        self.assertEqual(self.fieldset().user.render_readonly(),
+                         'Bill bill@example.com')
+
+    def test_lookup(self):
+        renderer = self.fieldset().user.renderer
+        page = renderer.lookup(u'', limit=1)
+        self.assertEqual(page['results'],
+                         [dict(id=1, label='Bill bill@example.com')])
+        self.assertEqual(page['next'], ['Bill', 1])
+        page = renderer.lookup(u'', after=page['next'])
+        self.assertEqual(page['results'],
+                         [dict(id=2, label='John john@example.com')])
+        self.assertEqual(page['next'], None)
+        self.assertEqual(len(renderer.lookup(u'J')['results']), 1)
+        self.assertEqual(renderer.lookup(u'B_')['results'], [])
+
+    def test_lookup_limit(self):
+        renderer = self.fieldset().user.renderer
+        # no limit: the renderer's one
+        page = renderer.lookup(u'', limit=0)
+        self.assertEqual(len(page['results']), 2)
+        self.assertEqual(page['next'], None)
+        page = renderer.lookup(u'', limit=-1)
+        self.assertEqual(len(page['results']), 1)
+        self.assertEqual(page['next'], ['Bill', 1])
+
+    def test_deserialize(self):
+        fs = self.fieldset({'LabeledOrder-1-user_id': '2'})
+        self.assertTrue(fs.validate())
+        fs.sync()
+        self.assertEqual(self.order.user_id, 2)
+        fs = self.fieldset({'LabeledOrder-1-user_id': '999'})
+        self.assertFalse(fs.validate())
+        self.assertEqual(fs.errors, {fs.user: ['Invalid value']})
@@ -60,3 +60,57 @@ def test_post_on_grid():
     """
     
 
+
+def test_render_context():
+    """
+    FieldSets and Grids bound with the same request load relation options
+    once:
+
+    >>> from formalchemy import RenderContext
+    >>> fs = DefaultFieldSet(Order)
+    >>> request = Request.blank('/')
+    >>> fieldsets = [fs.bind(order1, request=request),
+    ...              fs.bind(Order, session=session, request=request)]
+    >>> context = request.environ['fa.render_context']
+    >>> fieldsets[1].render_context is context
+    True
+    >>> html = [f.render() for f in fieldsets]
+    >>> g = DefaultGrid(Order, [order1, order2], request=request)
+    >>> html = g.render()
+    >>> context
+    <RenderContext hits=2 misses=1>
+
+    The context is not shared with other requests, and is dropped by a
+    rebind without request:
+
+    >>> g.rebind([order1], request=request)
+    >>> g.render_context is context
+    True
+    >>> fs.bind(order1, request=Request.blank('/')).render_context is context
+    False
+    >>> fs.render_context is None
+    True
+    >>> g.rebind([order1])
+    >>> g.render_context is None
+    True
+    """
+
+def test_render_context_rebind():
+    """
+    A long lived FieldSet rebound without request does not keep the options
+    loaded for the previous request:
+
+    >>> fs = DefaultFieldSet(Order)
+    >>> fs.rebind(order1, request=Request.blank('/'))
+    >>> 'Jane' in fs.bind(order1).user.render()
+    False
+    >>> jane = User(email='jane@example.com', password='1234', name='Jane')
+    >>> session.add(jane)
+    >>> session.flush()
+    >>> fs.rebind(order1)
+    >>> fs.render_context is None
+    True
+    >>> 'Jane' in fs.bind(order1).user.render()
+    True
+    >>> session.rollback()
+    """
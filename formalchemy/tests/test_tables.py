@@ -207,6 +207,40 @@ def test_rebind_render():
     'updatebill_@example.com'
     """
 
+def test_render_iter():
+    """
+    With the compiled engine, the header and each row are separate chunks:
+
+    >>> from formalchemy import templates
+    >>> g = DefaultGrid(User, [bill, john], session=session)
+    >>> g.engine = templates.CompiledEngine()
+    >>> chunks = list(g.render_iter())
+    >>> len(chunks)
+    3
+    >>> print(chunks[0].strip())
+    <thead>
+      <tr>
+          <th>Email</td>
+          <th>Password</td>
+          <th>Name</td>
+          <th>Orders</td>
+      </tr>
+    </thead>
+    <BLANKLINE>
+    <tbody>
+    >>> ''.join(chunks) == g.render()
+    True
+    >>> g.readonly = True
+    >>> ''.join(g.iter_render()) == g.render()
+    True
+
+    Other engines yield the whole grid:
+
+    >>> g.engine = templates.TempitaEngine()
+    >>> [chunk == g.render() for chunk in g.render_iter()]
+    [True]
+    """
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
@@ -56,6 +56,7 @@ setup(name='FormAlchemy',
       packages=find_packages(exclude=('formalchemy.tests',)),
       package_data={'formalchemy': ['*.tmpl', 'i18n_resources/*/LC_MESSAGES/formalchemy.mo',
                                     'ext/pylons/*.mako', 'ext/pylons/resources/*.css', 'ext/pylons/resources/*.png',
+                                    'benchmarks/*.json',
                                     'tests/data/mako/*.mako', 'tests/data/genshi/*.html',
                                     'paster_templates/pylons_fa/+package+/*/*_tmpl',
                                     ]},